@@ -10,6 +10,7 @@ import FreeCAD,FreeCADGui
 from PySide import QtCore, QtGui
 import os, sys
 import gdml_locator
+import GDMLShared
 global GDML_WB_icons_path
 GDML_WBpath = os.path.dirname(gdml_locator.__file__)
 GDML_WB_icons_path =  os.path.join( GDML_WBpath, 'Resources', 'icons')
@@ -21,12 +22,12 @@ class BoxFeature:
     def Activated(self):
         from GDMLObjects import GDMLBox, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLBox")
-        print("GDMLBox Object - added")
+        GDMLShared.debug("GDMLBox Object - added")
         # obj, x, y, z, lunits, material
         GDMLBox(a,10.0,10.0,10.0,"mm",0)
-        print("GDMLBox initiated")
+        GDMLShared.debug("GDMLBox initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLBox ViewProvided - added")
+        GDMLShared.debug("GDMLBox ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -51,12 +52,12 @@ class ConeFeature:
     def Activated(self):
         from GDMLObjects import GDMLCone, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLCone")
-        print("GDMLCone Object - added")
+        GDMLShared.debug("GDMLCone Object - added")
         #  obj,rmin1,rmax1,rmin2,rmax2,z,startphi,deltaphi,aunit,lunits,material
         GDMLCone(a,1,3,4,7,10.0,0,2,"rads","mm",0)
-        print("GDMLCone initiated")
+        GDMLShared.debug("GDMLCone initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLCone ViewProvided - added")
+        GDMLShared.debug("GDMLCone ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -81,12 +82,12 @@ class EllispoidFeature:
         from GDMLObjects import GDMLEllipsoid, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython", \
                   "GDMLEllipsoid")
-        print("GDMLEllipsoid Object - added")
+        GDMLShared.debug("GDMLEllipsoid Object - added")
         #  obj,ax, by, cz, zcut1, zcut2, lunit,material
         GDMLEllipsoid(a,10,20,30,0,0,"mm",0)
-        print("GDMLEllipsoid initiated")
+        GDMLShared.debug("GDMLEllipsoid initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLEllipsoid ViewProvided - added")
+        GDMLShared.debug("GDMLEllipsoid ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -111,12 +112,12 @@ class ElliTubeFeature:
         from GDMLObjects import GDMLElTube, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython", \
                   "GDMLElTube")
-        print("GDMLElTube Object - added")
+        GDMLShared.debug("GDMLElTube Object - added")
         #  obj,dx, dy, dz, lunit, material
         GDMLElTube(a,10,20,30,"mm",0)
-        print("GDMLElTube initiated")
+        GDMLShared.debug("GDMLElTube initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLElTube ViewProvided - added")
+        GDMLShared.debug("GDMLElTube ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -140,13 +141,13 @@ class SphereFeature:
     def Activated(self):
         from GDMLObjects import GDMLSphere, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLSphere")
-        print("GDMLSphere Object - added")
+        GDMLShared.debug("GDMLSphere Object - added")
         # obj, rmin, rmax, startphi, deltaphi, starttheta, deltatheta,
         #       aunit, lunits, material
         GDMLSphere(a,10.0, 20.0, 0.0, 2.02, 0.0, 2.02,"rad","mm",0)
-        print("GDMLSphere initiated")
+        GDMLShared.debug("GDMLSphere initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLSphere ViewProvided - added")
+        GDMLShared.debug("GDMLSphere ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -170,13 +171,13 @@ class TrapFeature:
     def Activated(self):
         from GDMLObjects import GDMLTrap, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLTrap")
-        print("GDMLTrap Object - added")
+        GDMLShared.debug("GDMLTrap Object - added")
         # obj z, theta, phi, x1, x2, x3, x4, y1, y2,
         # pAlp2, aunits, lunits, material
         GDMLTrap(a,10.0,0.0,0.0,6.0,6.0,6.0,6.0,7.0,7.0,0.0,"rad","mm",0)
-        print("GDMLTrap initiated")
+        GDMLShared.debug("GDMLTrap initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLTrap ViewProvided - added")
+        GDMLShared.debug("GDMLTrap ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -201,12 +202,12 @@ class TubeFeature:
     def Activated(self):
         from GDMLObjects import GDMLTube, ViewProvider
         a=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLTube")
-        print("GDMLTube Object - added")
+        GDMLShared.debug("GDMLTube Object - added")
         # obj, rmin, rmax, z, startphi, deltaphi, aunit, lunits, material
         GDMLTube(a,5.0,8.0,10.0,0.52,1.57,"rad","mm",0)
-        print("GDMLTube initiated")
+        GDMLShared.debug("GDMLTube initiated")
         ViewProvider(a.ViewObject)
-        print("GDMLTube ViewProvided - added")
+        GDMLShared.debug("GDMLTube ViewProvided - added")
         FreeCAD.ActiveDocument.recompute()
         FreeCADGui.SendMsgToActiveView("ViewFit")
 
@@ -287,6 +288,58 @@ class CycleFeature :
                 QtCore.QT_TRANSLATE_NOOP('GDML_CycleGroup', \
                 'Cycle Object and all children display')}    
 
+class EditMaterialFeature :
+
+    def Activated(self) :
+        from GDMLObjects import findMaterialDB
+        import importGDML
+        db = findMaterialDB(FreeCAD.ActiveDocument)
+        items = []
+        for kind in db.Proxy.kinds :
+            items += [kind+' : '+name for name in db.Proxy.names(db, kind)]
+        # Editable combo box, typing a name completes it
+        item, ok = QtGui.QInputDialog.getItem(None, 'Edit Material', \
+                        'Isotope, element or material', items, 0, True)
+        if not ok or item not in items :
+           return
+        kind, name = item.split(' : ', 1)
+        obj = importGDML.editMaterial(db, kind, name)
+        FreeCAD.ActiveDocument.recompute()
+        FreeCADGui.Selection.clearSelection()
+        FreeCADGui.Selection.addSelection(obj)
+
+    def IsActive(self):
+        if FreeCAD.ActiveDocument == None:
+           return False
+        from GDMLObjects import findMaterialDB
+        return findMaterialDB(FreeCAD.ActiveDocument) is not None
+
+    def GetResources(self):
+        return {'MenuText': \
+                QtCore.QT_TRANSLATE_NOOP('GDMLEditMaterial',\
+                'Edit Material'), 'ToolTip': \
+                QtCore.QT_TRANSLATE_NOOP('GDMLEditMaterial', \
+                'Create an object for a material table entry to edit it')}
+
+class UpdateFromFileFeature :
+
+    def Activated(self) :
+        import importGDML
+        importGDML.updateFromFile(FreeCAD.ActiveDocument)
+
+    def IsActive(self):
+        if FreeCAD.ActiveDocument == None:
+           return False
+        import importGDML
+        return importGDML.importRecord(FreeCAD.ActiveDocument) is not None
+
+    def GetResources(self):
+        return {'MenuText': \
+                QtCore.QT_TRANSLATE_NOOP('GDMLUpdateFromFile',\
+                'Update from File'), 'ToolTip': \
+                QtCore.QT_TRANSLATE_NOOP('GDMLUpdateFromFile', \
+                'Apply the changes of the imported GDML file')}
+
 FreeCADGui.addCommand('CycleCommand',CycleFeature())
 FreeCADGui.addCommand('BoxCommand',BoxFeature())
 FreeCADGui.addCommand('EllipsoidCommand',EllispoidFeature())
@@ -295,3 +348,5 @@ FreeCADGui.addCommand('ConeCommand',ConeFeature())
 FreeCADGui.addCommand('SphereCommand',SphereFeature())
 FreeCADGui.addCommand('TrapCommand',TrapFeature())
 FreeCADGui.addCommand('TubeCommand',TubeFeature())
+FreeCADGui.addCommand('EditMaterialCommand',EditMaterialFeature())
+FreeCADGui.addCommand('UpdateFromFileCommand',UpdateFromFileFeature())
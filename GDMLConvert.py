@@ -0,0 +1,131 @@
+# Convert GDML files without the GUI
+#
+# From a shell with FreeCAD's lib directory on PYTHONPATH
+#    python GDMLConvert.py [options] input.gdml [input2.gdml ...]
+# or with FreeCADCmd
+#    FreeCADCmd -c "import sys, GDMLConvert; sys.exit(GDMLConvert.main(
+#                   ['-f','step','in.gdml']))"
+#
+# Output format is FCStd, STEP or BREP, taken from --format or the
+# extension of --output. Exit code is non zero if any file failed,
+# reported errors while importing or produced no shapes.
+
+import os, sys
+
+formats = {'fcstd' : '.FCStd', 'step' : '.step', 'stp' : '.step', \
+           'brep' : '.brep', 'brp' : '.brep'}
+
+def outputName(inFile, output, fmt) :
+    # --output may be a file ( single input ) or a directory
+    base = os.path.splitext(os.path.basename(inFile))[0] + formats[fmt]
+    if output is None :
+       return os.path.join(os.path.dirname(inFile), base)
+    if os.path.isdir(output) :
+       return os.path.join(output, base)
+    return output
+
+def rootShapes(doc) :
+    import Part
+    # Top level parts hold the world volume, getShape applies the
+    # placements of nested parts and links
+    shapes = [Part.getShape(obj) for obj in doc.RootObjects \
+              if obj.TypeId == 'App::Part']
+    shapes = [s for s in shapes if not s.isNull()]
+    if len(shapes) == 0 :
+       raise RuntimeError('No shapes created')
+    return shapes
+
+def exportShape(doc, outFile, fmt) :
+    import Part
+    shape = Part.makeCompound(rootShapes(doc))
+    if formats[fmt] == '.step' :
+       shape.exportStep(outFile)
+    else :
+       shape.exportBrep(outFile)
+
+def convert(inFile, outFile, fmt, stream=None, threads=None, \
+            volumeFilter=None) :
+    # Returns the number of errors reported by the import
+    import FreeCAD
+    import importGDML
+    docName = os.path.splitext(os.path.basename(inFile))[0]
+    doc = FreeCAD.newDocument(docName)
+    try :
+       errors = importGDML.processGDML(doc, inFile, stream, threads, \
+                              lazy=False, volumeFilter=volumeFilter)
+       if formats[fmt] == '.FCStd' :
+          rootShapes(doc)       # nothing built is a failure for any format
+          doc.saveAs(outFile)
+       else :
+          exportShape(doc, outFile, fmt)
+    finally :
+       FreeCAD.closeDocument(doc.Name)
+    return errors
+
+def main(argv=None) :
+    import argparse
+    parser = argparse.ArgumentParser(prog='GDMLConvert', \
+                 description='Convert GDML files to FCStd, STEP or BREP')
+    parser.add_argument('inputs', nargs='+', metavar='input.gdml')
+    parser.add_argument('-o', '--output', \
+                 help='output file ( one input ) or directory')
+    parser.add_argument('-f', '--format', choices=sorted(formats), \
+                 help='output format, default from --output or fcstd')
+    parser.add_argument('--stream', action='store_true', \
+                 help='streaming import of large files')
+    parser.add_argument('--threads', action='store_true', \
+                 help='threaded import')
+    parser.add_argument('--root', action='append', \
+                 help='volume to import instead of world, may be repeated')
+    parser.add_argument('--depth', type=int, \
+                 help='maximum physvol nesting depth')
+    parser.add_argument('--include', action='append', \
+                 help='only build volumes whose name or material match')
+    parser.add_argument('--exclude', action='append', \
+                 help='skip volumes whose name or material match')
+    parser.add_argument('--box', nargs=6, type=float, \
+                 metavar=('XMIN','YMIN','ZMIN','XMAX','YMAX','ZMAX'), \
+                 help='only import volumes intersecting box')
+    parser.add_argument('--cylinder', nargs=3, type=float, \
+                 metavar=('R','ZMIN','ZMAX'), \
+                 help='only import volumes intersecting cylinder on z axis')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None :
+       fmt = 'fcstd'
+       if args.output is not None and not os.path.isdir(args.output) :
+          ext = os.path.splitext(args.output)[1].lower().lstrip('.')
+          if ext in formats :
+             fmt = ext
+    if len(args.inputs) > 1 and args.output is not None and \
+          not os.path.isdir(args.output) :
+       parser.error('--output must be a directory for several inputs')
+
+    failed = 0
+    for inFile in args.inputs :
+        outFile = outputName(inFile, args.output, fmt)
+        try :
+           import importGDML
+           region = None
+           if args.box is not None :
+              region = importGDML.BoxRegion(*args.box)
+           elif args.cylinder is not None :
+              region = importGDML.CylinderRegion(*args.cylinder)
+           volumeFilter = importGDML.ImportFilter(args.root, args.depth, \
+                                         args.include, args.exclude, region)
+           errors = convert(inFile, outFile, fmt, args.stream, \
+                            args.threads, volumeFilter)
+           if errors > 0 :
+              sys.stderr.write('Converted '+inFile+' -> '+outFile+ \
+                               ' with '+str(errors)+' errors\n')
+              failed += 1
+           else :
+              print('Converted '+inFile+' -> '+outFile)
+        except Exception as e :
+           sys.stderr.write('Failed '+inFile+' : '+str(e)+'\n')
+           failed += 1
+    return 1 if failed > 0 else 0
+
+if __name__ == '__main__' :
+   sys.exit(main())
@@ -0,0 +1,69 @@
+# Geant4 NIST material database
+#
+# Resources/G4NistMaterials.json holds the NIST elements and the G4_
+# materials, it is only read the first time a name is looked up
+#
+#   elements  : symbol -> [Z, atomic mass g/mole]
+#   materials : name -> [density g/cm3, mean excitation energy eV,
+#                        state, fraction | composite, [[element, n], ..]]
+#
+# Entries are returned in the same form as the materials table of
+# GDMLObjects.GDMLmaterialDB i.e. [attributes, [[tag, attributes], ..]]
+
+import os, json
+import gdml_locator
+
+dbPath = os.path.join(os.path.dirname(gdml_locator.__file__), \
+                      'Resources', 'G4NistMaterials.json')
+
+global nistDB
+nistDB = None
+
+def load() :
+    global nistDB
+    if nistDB is None :
+       with open(dbPath) as f :
+          nistDB = json.load(f)
+    return nistDB
+
+def isNist(name) :
+    # Cheap test, does not load the database
+    return name is not None and name.startswith('G4_')
+
+def hasMaterial(name) :
+    return isNist(name) and name in load()['materials']
+
+def elementEntry(symbol) :
+    Z, A = load()['elements'][symbol]
+    return [{'name': symbol, 'formula': symbol, 'Z': str(Z)}, \
+            [['atom', {'unit': 'g/mole', 'value': repr(A)}]]]
+
+def materialEntry(name) :
+    D, I, state, kind, components = load()['materials'][name]
+    children = []
+    if I > 0 :
+       children.append(['MEE', {'unit': 'eV', 'value': repr(I)}])
+    children.append(['D', {'unit': 'g/cm3', 'value': repr(D)}])
+    for element, n in components :
+        children.append([kind, {'n': repr(n), 'ref': element}])
+    return [{'name': name, 'state': state}, children]
+
+def entries(names, defined=()) :
+    # (kind, name, entry) for the NIST materials in names and the
+    # elements they are made of, elements first. Names in defined
+    # are already declared and are not returned
+    defined = set(defined)
+    elements = []
+    materials = []
+    for name in names :
+        if name in defined or not hasMaterial(name) :
+           continue
+        defined.add(name)
+        entry = materialEntry(name)
+        for child in entry[1] :
+            ref = child[1].get('ref')
+            if ref is not None and ref not in defined :
+               defined.add(ref)
+               elements.append(('element', ref, elementEntry(ref)))
+        materials.append(('material', name, entry))
+    return elements + materials
@@ -1,9 +1,11 @@
-import FreeCAD, FreeCADGui, Part
-from pivy import coin
+import FreeCAD, Part
+if FreeCAD.GuiUp :
+   import FreeCADGui
+   from pivy import coin
 
-import GDMLShared
+import GDMLShared, GDMLShapeCache
 global GDML_WB_icons_path
-import gdml_locator, os, sys
+import gdml_locator, os, sys, json, math
 GDML_WBpath = os.path.dirname(gdml_locator.__file__)
 GDML_WB_icons_path =  os.path.join( GDML_WBpath, 'Resources', 'icons')
 
@@ -11,12 +13,51 @@ GDML_WB_icons_path =  os.path.join( GDML_WBpath, 'Resources', 'icons')
 global MaterialsList
 MaterialsList = []
 
-# Get angle in Radians
+# Batch edit, while a batch is open onChanged does not rebuild shapes
+# each touched solid is executed once when the outermost batch closes
+global batchDepth, batchPending
+batchDepth = 0
+batchPending = {}
+
+def startBatch() :
+    global batchDepth
+    batchDepth += 1
+
+def endBatch() :
+    global batchDepth, batchPending
+    if batchDepth > 0 :
+       batchDepth -= 1
+    if batchDepth > 0 :
+       return
+    pending = batchPending
+    batchPending = {}
+    for proxy, fp in pending.values() :
+        try :
+           proxy.execute(fp)
+           # Shape is up to date, recompute need not build it again
+           fp.purgeTouched()
+        except Exception as e :
+           GDMLShared.error("Batch execute failed : %s", e)
+
+def inBatch() :
+    return batchDepth > 0
+
+class batchEdit(object) :
+    '''Context manager for a batch of edits i.e.
+          with GDMLObjects.batchEdit() :
+             create or change objects'''
+    def __enter__(self) :
+        startBatch()
+        return self
+
+    def __exit__(self, excType, excValue, tb) :
+        endBatch()
+        return False
+
+# Get angle in Radians, imported solids are always in rad. Objects
+# created or edited with aunit deg use the factor from the unit table
 def getAngle(aunit,angle) :
-   if aunit == 1 :   # 0 radians 1 Degrees
-      return(angle*180/math.pi)
-   else :
-      return angle
+   return angle * GDMLShared.unitFactor(aunit)
 
 def makeRegularPolygon(n,r,z):
     from math import cos, sin, pi
@@ -25,33 +66,33 @@ def makeRegularPolygon(n,r,z):
     return vecs
 
 def printPolyVec(n,v) :
-    print("Polygon : "+n)
+    GDMLShared.debug("Polygon : %s", n)
     for i in v :
-        print("Vertex - x : "+str(i[0])+" y : "+str(i[1])+" z : "+str(i[2]))
+        GDMLShared.debug("Vertex - x : %s y : %s z : %s", i[0], i[1], i[2])
 
 def translate(shape,base) :
     # Input Object and displacement vector - return a transformed shape
     myPlacement = FreeCAD.Placement()
     myPlacement.move(base)
     mat1 = myPlacement.toMatrix()
-    print(mat1)
+    GDMLShared.debug("%s", mat1)
     mat2 = shape.Matrix
     mat  = mat1.multiply(mat2)
-    print(mat)
+    GDMLShared.debug("%s", mat)
     retShape = shape.copy()
     retShape.transformShape(mat, True)
     return retShape
 
 def makeFrustrum(num,poly0,poly1) :
     # return list of faces
-    print("Make Frustrum : "+str(num)+" Faces")
+    GDMLShared.debug("Make Frustrum : %s Faces", num)
     faces = []
     for i in range(num) :
        j = i + 1
-       print([poly0[i],poly0[j],poly1[j],poly1[i]])
+       GDMLShared.debug("%s", [poly0[i],poly0[j],poly1[j],poly1[i]])
        w = Part.makePolygon([poly0[i],poly0[j],poly1[j],poly1[i],poly0[i]])
        faces.append(Part.Face(w))
-    print("Number of Faces : "+str(len(faces)))
+    GDMLShared.debug("Number of Faces : %s", len(faces))
     return(faces)
 
 class GDMLcommon :
@@ -69,12 +110,60 @@ class GDMLcommon :
                 Since no data were serialized nothing needs to be done here.'''
         return None
 
-class GDMLBox(GDMLcommon) :
+class GDMLsolid(GDMLcommon) :
+   # Base for solids, shapes are built by createShape and kept in the
+   # shape cache keyed on the parameters below, solids with the same
+   # parameters share one shape
+   # Bump builderVersion when createShape changes to invalidate cache
+   builderVersion = 1
+   geomProps = []
+   cacheShape = True
+   # Properties of child objects ( zplanes, 2dVertex, section )
+   childProps = ['x','y','z','rmin','rmax','zOrder','zPosition', \
+                 'xOffset','yOffset','scalingFactor']
+
+   def onChanged(self, fp, prop):
+       '''Do something when a property has changed'''
+       if prop in self.geomProps :
+          if batchDepth > 0 :
+             batchPending[(fp.Document.Name, fp.Name)] = (self, fp)
+          else :
+             self.execute(fp)
+       GDMLShared.debug("Change property: %s\n", prop)
+
+   def shapeParams(self, fp):
+       params = [getattr(fp,p) for p in self.geomProps]
+       for child in fp.OutList :
+           params.append([getattr(child,p) for p in self.childProps \
+                          if hasattr(child,p)])
+       return params
+
+   def execute(self, fp):
+       '''Do something when doing a recomputation, this method is mandatory'''
+       if self.cacheShape :
+          key = GDMLShapeCache.shapeKey(type(self).__name__, \
+                         self.builderVersion, self.shapeParams(fp))
+          # Only non geometric properties i.e. material have changed
+          if key == getattr(self, 'shapeKey', None) and \
+             not fp.Shape.isNull() :
+             return
+          # Cached shapes are shared, keep this object's placement
+          placement = fp.Placement
+          fp.Shape = GDMLShapeCache.lookup(key, lambda : self.createShape(fp))
+          fp.Placement = placement
+          self.shapeKey = key
+       else :
+          fp.Shape = self.createShape(fp)
+       GDMLShared.debug("Recompute %s Object \n", type(self).__name__)
+
+class GDMLBox(GDMLsolid) :
+   geomProps = ['x','y','z','lunit']
+
    def __init__(self, obj, x, y, z, lunit, material):
       '''Add some custom properties to our Box feature'''
       global GDML_WB_icons_path
       import os
-      GDMLShared.trace("GDMLBox init")
+      GDMLShared.debug("GDMLBox init")
       obj.addProperty("App::PropertyLength","x","GDMLBox","Length x").x=x
       obj.addProperty("App::PropertyLength","y","GDMLBox","Length y").y=y
       obj.addProperty("App::PropertyLength","z","GDMLBox","Length z").z=z
@@ -88,23 +177,18 @@ class GDMLBox(GDMLcommon) :
       self.Type = 'GDMLBox'
       obj.Proxy.Icon = os.path.join(GDML_WB_icons_path,'GDMLBoxFeature.svg')
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       #if not hasattr(fp,'onchange') or not fp.onchange : return
-       if prop in ['x','y','z','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        box = Part.makeBox(fp.x,fp.y,fp.z)
        base = FreeCAD.Vector(-fp.x/2,-fp.y/2,-fp.z/2)
        #print(fp.TypeId)
        #print(dir(box))
-       fp.Shape = translate(box,base)
-       GDMLShared.trace("Recompute GDML Box Object \n")
+       return translate(box,base)
+
+class GDMLCone(GDMLsolid) :
+   geomProps = ['rmin1','rmax1','rmin2','rmax2','z','startphi','deltaphi', \
+                  'aunit','lunit']
 
-class GDMLCone(GDMLcommon) :
    def __init__(self, obj, rmin1,rmax1,rmin2,rmax2,z,startphi,deltaphi,aunit, \
                 lunit, material):
       '''Add some custom properties to our Cone feature'''
@@ -129,14 +213,7 @@ class GDMLCone(GDMLcommon) :
       self.Type = 'GDMLCone'
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['rmin1','rmax1','rmin2','rmax2','z','startphi','deltaphi' \
-               ,'aunit', 'lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
 
        # Need to add code to check variables will make a valid cone
@@ -155,13 +232,13 @@ class GDMLCone(GDMLcommon) :
           else :
               cone3 = cone2.cut(cone1)
 
-          fp.Shape = translate(cone3,base)
+          return translate(cone3,base)
        else :   
-          fp.Shape = translate(cone1,base)
-       
-       GDMLShared.trace("Recompute GDML Cone Object \n")
+          return translate(cone1,base)
+
+class GDMLElCone(GDMLsolid) :
+   geomProps = ['dx','dy','zmax','zcut','lunit']
 
-class GDMLElCone(GDMLcommon) :
    def __init__(self, obj, dx, dy, zmax, zcut, lunit, material) :
       '''Add some custom properties to our ElCone feature'''
       obj.addProperty("App::PropertyDistance","dx","GDMLElCone", \
@@ -184,13 +261,7 @@ class GDMLElCone(GDMLcommon) :
       self.Type = 'GDMLElCone'
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['dx','dy','zmax','zcut','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
 
        cone1 = Part.makeCone(100,0,100)
@@ -212,12 +283,13 @@ class GDMLElCone(GDMLcommon) :
           # Only need to move to semi axis
           pl.move(FreeCAD.Vector(-fp.dx,-fp.dy,zmax-zcut))
           box.Placement = pl
-          fp.Shape = cone2.cut(box)
+          return cone2.cut(box)
        else :
-          fp.Shape = cone2
-       GDMLShared.trace("Recompute GDML ElCone Object \n")
+          return cone2
+
+class GDMLEllipsoid(GDMLsolid) :
+   geomProps = ['ax','by','cz','zcut1','zcut2','lunit']
 
-class GDMLEllipsoid(GDMLcommon) :
    def __init__(self, obj, ax, by, cz, zcut1, zcut2, lunit, material) :
       '''Add some custom properties to our Elliptical Tube feature'''
       obj.addProperty("App::PropertyDistance","ax","GDMLEllipsoid", \
@@ -244,13 +316,7 @@ class GDMLEllipsoid(GDMLcommon) :
       self.Type = 'GDMLEllipsoid'
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['ax','by','cz','zcut1','zcut2','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        sphere = Part.makeSphere(100)
        ax = fp.ax
@@ -265,7 +331,7 @@ class GDMLEllipsoid(GDMLcommon) :
        mat.A44 = 1
        zcut1 = abs(fp.zcut1)
        zcut2 = abs(fp.zcut2)
-       GDMLShared.trace("zcut2 : "+str(zcut2))
+       GDMLShared.debug("zcut2 : %s", zcut2)
        t1ellipsoid = sphere.transformGeometry(mat) 
        if zcut2 != None and zcut2 > 0 :   # Remove from upper z
           box1 = Part.makeBox(2*ax,2*by,zcut2)
@@ -287,10 +353,11 @@ class GDMLEllipsoid(GDMLcommon) :
           shape = t2ellipsoid
        
        base = FreeCAD.Vector(0,0,cz/4)
-       fp.Shape = translate(shape,base)   
-       GDMLShared.trace("Recompute GDML Ellipsoid Object \n")
+       return translate(shape,base)
+
+class GDMLElTube(GDMLsolid) :
+   geomProps = ['dx','dy','dz','lunit']
 
-class GDMLElTube(GDMLcommon) :
    def __init__(self, obj, dx, dy, dz, lunit, material) :
       '''Add some custom properties to our Elliptical Tube feature'''
       obj.addProperty("App::PropertyDistance","dx","GDMLElTube", \
@@ -313,13 +380,7 @@ class GDMLElTube(GDMLcommon) :
       self.Type = 'GDMLElTube'
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['dx','dy','dz','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        tube = Part.makeCylinder(100,100)
        mat = FreeCAD.Matrix()
@@ -331,10 +392,11 @@ class GDMLElTube(GDMLcommon) :
        #trace mat
        newtube = tube.transformGeometry(mat)
        base = FreeCAD.Vector(0,0,-fp.dz/2)
-       fp.Shape = translate(newtube,base)
-       GDMLShared.trace("Recompute GDML ElTube Object \n")
+       return translate(newtube,base)
+
+class GDMLPolyhedra(GDMLsolid) :
+   geomProps = ['startphi','deltaphi','numsides','aunit','lunit']
 
-class GDMLPolyhedra(GDMLcommon) :
    def __init__(self, obj, startphi, deltaphi, numsides, aunit, lunit, material) :
       '''Add some custom properties for Polyhedra feature'''
       obj.addProperty("App::PropertyFloat","startphi","GDMLPolyhedra", \
@@ -360,29 +422,22 @@ class GDMLPolyhedra(GDMLcommon) :
       self.Object = obj
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['startphi', 'deltaphi', 'numsides', 'aunit','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
 
-       print("Execute Polyhedra")
-       parms = self.Object.OutList
+       GDMLShared.debug("Execute Polyhedra")
+       parms = fp.OutList
        #print("OutList")
        #print(parms)
-       GDMLShared.trace("Number of parms : "+str(len(parms)))
+       GDMLShared.debug("Number of parms : %s", len(parms))
        numsides = fp.numsides
-       GDMLShared.trace("Number of sides : "+str(numsides))
+       GDMLShared.debug("Number of sides : %s", numsides)
        z0    = parms[0].z
        rmin0 = parms[0].rmin
        rmax0 = parms[0].rmax
-       GDMLShared.trace("Top z    : "+str(z0))
-       GDMLShared.trace("Top rmin : "+str(rmin0))
-       GDMLShared.trace("Top rmax : "+str(rmax0))
+       GDMLShared.debug("Top z    : %s", z0)
+       GDMLShared.debug("Top rmin : %s", rmin0)
+       GDMLShared.debug("Top rmax : %s", rmax0)
        inner_faces = []
        outer_faces = []
        # Make top Polygon
@@ -395,9 +450,9 @@ class GDMLPolyhedra(GDMLcommon) :
            z1 = ptr.z
            rmin1 = ptr.rmin
            rmax1 = ptr.rmax
-           GDMLShared.trace("z1    : "+str(z1))
-           GDMLShared.trace("rmin1 : "+str(rmin1))
-           GDMLShared.trace("rmax1 : "+str(rmax1))
+           GDMLShared.debug("z1    : %s", z1)
+           GDMLShared.debug("rmin1 : %s", rmin1)
+           GDMLShared.debug("rmax1 : %s", rmax1)
            inner_poly1 = makeRegularPolygon(numsides,rmin1,z1)
            outer_poly1 = makeRegularPolygon(numsides,rmax1,z1)
            # Concat face lists
@@ -412,17 +467,18 @@ class GDMLPolyhedra(GDMLcommon) :
        # add bottom polygon face
        inner_faces.append(Part.Face(Part.makePolygon(inner_poly1)))
        outer_faces.append(Part.Face(Part.makePolygon(outer_poly1)))
-       GDMLShared.trace("Total Faces : "+str(len(inner_faces)))
+       GDMLShared.debug("Total Faces : %s", len(inner_faces))
        inner_shell = Part.makeShell(inner_faces)
        inner_solid = Part.makeSolid(inner_shell)
        outer_shell = Part.makeShell(outer_faces)
        outer_solid = Part.makeSolid(outer_shell)
-       fp.Shape = outer_solid.cut(inner_solid)
+       return outer_solid.cut(inner_solid)
        #fp.Shape = shell
        #fp.Shape = Part.makeBox(10,10,10)
-       GDMLShared.trace("Recompute GDML Polyhedra")
 
-class GDMLXtru(GDMLcommon) :
+class GDMLXtru(GDMLsolid) :
+   geomProps = []
+
    def __init__(self, obj, lunit, material) :
       obj.addExtension('App::OriginGroupExtensionPython', self)
       obj.addProperty("App::PropertyString","lunit","GDMLXtru", \
@@ -438,25 +494,19 @@ class GDMLXtru(GDMLcommon) :
       self.Object = obj
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       #if prop in ['startphi','deltaphi','aunit','lunit'] :
-       #   self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
-       parms = self.Object.OutList
+   def createShape(self, fp):
+       parms = fp.OutList
        #print("OutList")
        #print(parms)
-       GDMLShared.trace("Number of parms : "+str(len(parms)))
+       GDMLShared.debug("Number of parms : %s", len(parms))
        polyList = []
        sections = []
        for ptr in parms :
            if hasattr(ptr,'x') :
               x = ptr.x
               y = ptr.y
-              GDMLShared.trace('x : '+str(x))
-              GDMLShared.trace('y : '+str(y))
+              GDMLShared.debug('x : %s', x)
+              GDMLShared.debug('y : %s', y)
               polyList.append([x, y])
 
            if hasattr(ptr,'zOrder') :
@@ -482,9 +532,9 @@ class GDMLXtru(GDMLcommon) :
            yOffset2   = sections[s+1][2]
            zPosition2 = sections[s+1][3]
            sf2        = sections[s+1][4]
-           print("polyList")
+           GDMLShared.debug("polyList")
            for p in polyList :
-              print(p)
+              GDMLShared.debug("%s", p)
               vb=FreeCAD.Vector(p[0]*sf1+xOffset1, p[1]*sf1+yOffset1,zPosition1)
               #vb=FreeCAD.Vector(-20, p[1]*sf1+yOffset1,zPosition1)
               vt=FreeCAD.Vector(p[0]*sf2+xOffset2, p[1]*sf2+yOffset2,zPosition2)
@@ -499,10 +549,10 @@ class GDMLXtru(GDMLcommon) :
            f1 = Part.Face(w1)
            #f1.reverse()
            faces_list.append(f1)
-           print("base list")
-           print(baseList)
-           print("Top list")
-           print(topList)
+           GDMLShared.debug("base list")
+           GDMLShared.debug("%s", baseList)
+           GDMLShared.debug("Top list")
+           GDMLShared.debug("%s", topList)
            # deal with side faces
            # remember first point is added to end of list
            for i in range(0,len(baseList)-1) :
@@ -513,8 +563,8 @@ class GDMLXtru(GDMLcommon) :
                sideList.append(topList[i])
                # Close SideList polygon
                sideList.append(baseList[i])
-               print("sideList")
-               print(sideList)
+               GDMLShared.debug("sideList")
+               GDMLShared.debug("%s", sideList)
                w1 = Part.makePolygon(sideList)
                f1 = Part.Face(w1)
                faces_list.append(f1)
@@ -523,15 +573,16 @@ class GDMLXtru(GDMLcommon) :
            f1 = Part.Face(w1)
            #f1.reverse()
            faces_list.append(f1)
-           print("Faces List")
-           print(faces_list)
+           GDMLShared.debug("Faces List")
+           GDMLShared.debug("%s", faces_list)
            shell=Part.makeShell(faces_list)
            #solid=Part.Solid(shell).removeSplitter()
            solid=Part.Solid(shell)
-           print("Valid Solid : "+str(solid.isValid()))
+           if GDMLShared.logLevel <= GDMLShared.DEBUG :
+              GDMLShared.debug("Valid Solid : %s", solid.isValid())
            if solid.Volume < 0:
               solid.reverse()
-       fp.Shape = solid
+       return solid
 
 class GDML2dVertex(GDMLcommon) :
    def __init__(self, obj, x, y):
@@ -550,10 +601,10 @@ class GDML2dVertex(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['x','y'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML 2dVertex Object \n")
+       GDMLShared.debug("Recompute GDML 2dVertex Object \n")
       
 class GDMLSection(GDMLcommon) :
    def __init__(self, obj, zOrder,zPosition,xOffset,yOffset,scalingFactor):
@@ -561,7 +612,7 @@ class GDMLSection(GDMLcommon) :
               "section").Type='section'
       obj.addProperty("App::PropertyInteger","zOrder","section", \
               "zOrder").zOrder=zOrder
-      obj.addProperty("App::PropertyInteger","zPosition","section", \
+      obj.addProperty("App::PropertyFloat","zPosition","section", \
               "zPosition").zPosition=zPosition
       obj.addProperty("App::PropertyFloat","xOffset","section", \
               "xOffset").xOffset=xOffset
@@ -577,10 +628,10 @@ class GDMLSection(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['zOrder','zPosition','xOffset','yOffset','scaleFactor'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML 2dVertex Object \n")
+       GDMLShared.debug("Recompute GDML 2dVertex Object \n")
       
 
 class GDMLzplane(GDMLcommon) :
@@ -597,13 +648,17 @@ class GDMLzplane(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['rmin','rmax','z'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML zplane Object \n")
+       GDMLShared.debug("Recompute GDML zplane Object \n")
       
 
-class GDMLPolycone(GDMLcommon) :
+class GDMLPolycone(GDMLsolid) :
+   # 2 : single profile revolve over startphi / deltaphi
+   builderVersion = 2
+   geomProps = ['startphi','deltaphi','aunit','lunit']
+
    def __init__(self, obj, startphi, deltaphi, aunit, lunit, material) :
       '''Add some custom properties to our Polycone feature'''
       obj.addExtension('App::OriginGroupExtensionPython', self)
@@ -627,54 +682,49 @@ class GDMLPolycone(GDMLcommon) :
       self.Object = obj
       obj.Proxy = self
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['startphi','deltaphi','aunit','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
+       # Revolve the closed r-z profile of all zplanes over the phi range
+       # outer radii going up z then inner radii coming back down
        startphi = getAngle(fp.aunit,fp.startphi)
        deltaphi = getAngle(fp.aunit,fp.deltaphi)
-       GDMLShared.trace("Start phi : "+str(startphi))
-       GDMLShared.trace("Delta phi : "+str(deltaphi)) 
-       zplanes = self.Object.OutList
-       cones = []
-       GDMLShared.trace("Number of zplanes : "+str(len(zplanes)))
-       for i in range(0,len(zplanes)-1) :
-           GDMLShared.trace('index : '+str(i))
-           h = zplanes[i+1].z - zplanes[i].z
-           rm1 = zplanes[i].rmin
-           rm2 = zplanes[i+1].rmin
-           rM1 = zplanes[i].rmax
-           rM2 = zplanes[i+1].rmax
-           GDMLShared.trace('height :'+str(h))
-           GDMLShared.trace('rm1 :'+str(rm1)+' rm2 :'+str(rm2))
-           GDMLShared.trace('rM1 :'+str(rM1)+' rM2 :'+str(rM2))
-           if rm1 != rm2 :
-              coneInner = Part.makeCone(rm1,rm2,h) 
-           else :
-              coneInner = Part.makeCylinder(rm1,h)
-           if rM1 != rM2 :
-              coneOuter = Part.makeCone(rM1,rM2,h) 
-           else :
-              coneOuter = Part.makeCylinder(rM1,h)
-           cones.append(coneOuter.cut(coneInner))
-
-       cone = cones[0]
-       GDMLShared.trace("Number of cones : "+str(len(cones)))
-       if len(cones) > 1 :
-          for merge in cones[1:] :
-              cone = cone.fuse(merge)
-
-       fp.Shape = cone    
-       GDMLShared.trace("Recompute GDMLPolycone Object \n")
-
-class GDMLSphere(GDMLcommon) :
+       GDMLShared.debug("Start phi : %s", startphi)
+       GDMLShared.debug("Delta phi : %s", deltaphi) 
+       zplanes = fp.OutList
+       GDMLShared.debug("Number of zplanes : %s", len(zplanes))
+       profile = [(zp.rmax, zp.z) for zp in zplanes] + \
+                 [(zp.rmin, zp.z) for zp in reversed(zplanes)]
+       points = []
+       for r, z in profile :
+           if len(points) > 0 and points[-1] == (r, z) :
+              continue
+           # Drop intermediate points along the axis, a revolved edge
+           # on the axis is degenerate
+           if r == 0 and len(points) > 1 and points[-1][0] == 0 and \
+              points[-2][0] == 0 :
+              points[-1] = (r, z)
+              continue
+           points.append((r, z))
+       if len(points) > 1 and points[-1] == points[0] :
+          points.pop()
+       GDMLShared.debug("Profile : %s", points)
+       wire = Part.makePolygon([FreeCAD.Vector(r, 0, z) for r, z in points] \
+                               + [FreeCAD.Vector(points[0][0], 0, \
+                                                 points[0][1])])
+       face = Part.Face(wire)
+       axis = FreeCAD.Vector(0,0,1)
+       if startphi != 0 :
+          face.rotate(FreeCAD.Vector(0,0,0), axis, math.degrees(startphi))
+       return face.revolve(FreeCAD.Vector(0,0,0), axis, \
+                           math.degrees(deltaphi))
+
+class GDMLSphere(GDMLsolid) :
+   geomProps = ['rmin','rmax','startphi','deltaphi','starttheta', \
+                  'deltatheta','aunit','lunit']
+
    def __init__(self, obj, rmin, rmax, startphi, deltaphi, starttheta, \
                 deltatheta, aunit, lunit, material):
       '''Add some custom properties to our Sphere feature'''
-      GDMLShared.trace("GDMLSphere init")
+      GDMLShared.debug("GDMLSphere init")
       obj.addProperty("App::PropertyLength","rmin","GDMLSphere", \
               "Inside Radius").rmin=rmin
       obj.addProperty("App::PropertyLength","rmax","GDMLSphere", \
@@ -702,15 +752,7 @@ class GDMLSphere(GDMLcommon) :
       obj.Proxy = self
       self.Type = 'GDMLSphere'
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['rmin','rmax','startphi','deltaphi','starttheta', \
-                    'deltatheta','aunit','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        import math
        # Need to add code to check values make a valid sphere
@@ -723,10 +765,12 @@ class GDMLSphere(GDMLcommon) :
        sphere2 = Part.makeSphere(fp.rmax, cp, axis_dir)
        
        #sphere3 = sphere2.cut(sphere1)
-       fp.Shape = sphere2
-       GDMLShared.trace("Recompute GDML Sphere Object \n")
+       return sphere2
+
+class GDMLTrap(GDMLsolid) :
+   geomProps = ['z','theta','phi','x1','x2','x3','x4','y1','y2','alpha', \
+                  'aunit','lunit']
 
-class GDMLTrap(GDMLcommon) :
    def __init__(self, obj, z, theta, phi, x1, x2, x3, x4, y1, y2, alpha, \
                 aunit, lunit, material):
       "General Trapezoid"
@@ -762,20 +806,13 @@ class GDMLTrap(GDMLcommon) :
       obj.Proxy = self
       self.Type = 'GDMLTrap'
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['z','theta','phi','x1','x2','x3','x4','y1','y2','alpha', \
-                   'aunit', 'lunit'] :
-           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-   
    def make_face4(self,v1,v2,v3,v4):
        # helper mehod to create the faces
        wire = Part.makePolygon([v1,v2,v3,v4,v1])
        face = Part.Face(wire)
        return face
 
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        import math
        # Define six vetices for the shape
@@ -784,18 +821,18 @@ class GDMLTrap(GDMLcommon) :
        phi   = getAngle(fp.aunit,fp.phi)
        dx = fp.y1*math.sin(alpha)
        dy = fp.y1*(1.0 - math.cos(alpha))
-       GDMLShared.trace("Delta adjustments")
-       GDMLShared.trace("dx : "+str(dx)+" dy : "+str(dy))
+       GDMLShared.debug("Delta adjustments")
+       GDMLShared.debug("dx : %s dy : %s", dx, dy)
        y1m = dy - fp.y1
        y1p = dy + fp.y1
        x1m = dx - fp.x1
        x1p = dx + fp.x1
        z    = fp.z
-       GDMLShared.trace("y1m : "+str(y1m))
-       GDMLShared.trace("y1p : "+str(y1p))
-       GDMLShared.trace("z   : "+str(z))
-       GDMLShared.trace("x1  : "+str(fp.x1))
-       GDMLShared.trace("x2  : "+str(fp.x2))
+       GDMLShared.debug("y1m : %s", y1m)
+       GDMLShared.debug("y1p : %s", y1p)
+       GDMLShared.debug("z   : %s", z)
+       GDMLShared.debug("x1  : %s", fp.x1)
+       GDMLShared.debug("x2  : %s", fp.x2)
 
        v1    = FreeCAD.Vector(x1m, y1m, -z)
        v2    = FreeCAD.Vector(x1p, y1m, -z)
@@ -806,17 +843,17 @@ class GDMLTrap(GDMLcommon) :
        dr = z*math.tan(theta)
        tx = dr*math.cos(phi)
        ty = dr*math.cos(phi)
-       GDMLShared.trace("Coord of top surface centre")
-       GDMLShared.trace("x : "+str(tx)+" y : "+str(ty))
+       GDMLShared.debug("Coord of top surface centre")
+       GDMLShared.debug("x : %s y : %s", tx, ty)
        py2 = ty + fp.y2
        my2 = ty - fp.y2
        px3 = tx + fp.x3
        mx3 = tx - fp.x3
        px4 = tx + fp.x4
        mx4 = tx - fp.x4
-       GDMLShared.trace("px3 : "+str(px3))
-       GDMLShared.trace("py2 : "+str(py2))
-       GDMLShared.trace("my2 : "+str(my2))
+       GDMLShared.debug("px3 : %s", px3)
+       GDMLShared.debug("py2 : %s", py2)
+       GDMLShared.debug("my2 : %s", my2)
 
        v5 = FreeCAD.Vector(mx3, my2, z)
        v6 = FreeCAD.Vector(px3, my2, z)
@@ -835,10 +872,11 @@ class GDMLTrap(GDMLcommon) :
 
        #solid = Part.makePolygon([v1,v2,v3,v4,v5,v6,v7,v1])
 
-       fp.Shape = solid
-       GDMLShared.trace("Recompute GDML Trap Object \n")
+       return solid
+
+class GDMLTrd(GDMLsolid) :
+   geomProps = ['z','x1','x2','y1','y2','lunit']
 
-class GDMLTrd(GDMLcommon) :
    def __init__(self, obj, z, x1, x2,  y1, y2, lunit, material) :
       "3.4.15 : Trapezoid – x & y varying along z"
       obj.addProperty("App::PropertyLength","z","GDMLTrd`","z").z=z
@@ -861,22 +899,16 @@ class GDMLTrd(GDMLcommon) :
       obj.Proxy = self
       self.Type = 'GDMLTrd'
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['z','x1','x2','y1','y2','lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-   
    def make_face4(self,v1,v2,v3,v4):
        # helper mehod to create the faces
        wire = Part.makePolygon([v1,v2,v3,v4,v1])
        face = Part.Face(wire)
        return face
 
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        import math
-       GDMLShared.trace("x2  : "+str(fp.x2))
+       GDMLShared.debug("x2  : %s", fp.x2)
 
        x1 = fp.x1/2
        x2 = fp.x2/2
@@ -904,10 +936,11 @@ class GDMLTrd(GDMLcommon) :
 
        #solid = Part.makePolygon([v1,v2,v3,v4,v5,v6,v7,v1])
 
-       fp.Shape = solid
-       GDMLShared.trace("Recompute GDML Trd Object \n")
+       return solid
+
+class GDMLTube(GDMLsolid) :
+   geomProps = ['rmin','rmax','z','startphi','deltaphi','aunit','lunit']
 
-class GDMLTube(GDMLcommon) :
    def __init__(self, obj, rmin, rmax, z, startphi, deltaphi, aunit,  \
                 lunit, material):
       '''Add some custom properties to our Tube feature'''
@@ -928,14 +961,7 @@ class GDMLTube(GDMLcommon) :
       obj.Proxy = self
       self.Type = 'GDMLTube'
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['rmin','rmax','z','startphi','deltaphi','aunit',  \
-                   'lunit'] :
-          self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-   def execute(self, fp):
+   def createShape(self, fp):
        '''Do something when doing a recomputation, this method is mandatory'''
        import math
        # Need to add code to check values make a valid Tube
@@ -969,8 +995,7 @@ class GDMLTube(GDMLcommon) :
        #base = FreeCAD.Vector(0,0,fp.z/2)
        #base = FreeCAD.Vector(0,0,0)
        base = FreeCAD.Vector(0,0,-fp.z/2)
-       fp.Shape = translate(tube,base)
-       GDMLShared.trace("Recompute GDML Tube Object \n")
+       return translate(tube,base)
 
    def make_face3(self,v1,v2,v3):
        # helper mehod to create the faces
@@ -984,14 +1009,6 @@ class GDMLTube(GDMLcommon) :
        face = Part.Face(wire)
        return face
 
-   def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       if prop in ['rmin','rmax','z','startphi','deltaphi','aunit',  \
-               'lunit']:
-           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
-
-
 class GDMLVertex(GDMLcommon) :
    def __init__(self, obj, x, y, z, lunit):
       obj.addProperty("App::PropertyFloat","x","GDMLVertex", \
@@ -1008,10 +1025,10 @@ class GDMLVertex(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['x','y', 'z'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML Vertex Object \n")
+       GDMLShared.debug("Recompute GDML Vertex Object \n")
        
 
 class GDMLTriangular(GDMLcommon) :
@@ -1033,10 +1050,10 @@ class GDMLTriangular(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['v1','v2','v3','type'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML Triangular Object \n")
+       GDMLShared.debug("Recompute GDML Triangular Object \n")
        
 class GDMLQuadrangular(GDMLcommon) :
    def __init__(self, obj, v1, v2, v3, v4, vtype):
@@ -1059,14 +1076,25 @@ class GDMLQuadrangular(GDMLcommon) :
        '''Do something when a property has changed'''
        if prop in ['v1','v2','v3','v4','type'] :
           self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
 
    def execute(self, fp):
-       GDMLShared.trace("Recompute GDML Quqdrang\n")
+       GDMLShared.debug("Recompute GDML Quqdrang\n")
        
-class GDMLTessellated(GDMLcommon) :
-    def __init__(self, obj, material ) :
+class GDMLTessellated(GDMLsolid) :
+    # Vertices are held in a vector list, facets as a flat integer list
+    # of 4 vertex indexes per facet with -1 as 4th index for triangles
+    geomProps = ['vertices','facets']
+
+    def __init__(self, obj, material, vertices=None, facets=None) :
+      if vertices is None : vertices = []
+      if facets is None : facets = []
       obj.addExtension('App::OriginGroupExtensionPython', self)
+      obj.addProperty("App::PropertyVectorList","vertices","GDMLTessellated", \
+                      "Vertex positions").vertices = vertices
+      obj.addProperty("App::PropertyIntegerList","facets","GDMLTessellated", \
+                      "Vertex indexes, 4 per facet -1 for triangle").facets = \
+                      facets
       obj.addProperty("Part::PropertyPartShape","Shape","GDMLTessellated", "Shape of the Tesssellation")
       obj.addProperty("App::PropertyEnumeration","material","GDMLTessellated","Material")
       obj.material = MaterialsList
@@ -1076,56 +1104,54 @@ class GDMLTessellated(GDMLcommon) :
       self.Object = obj
       obj.Proxy = self
 
-    def onChanged(self, fp, prop):
-       '''Do something when a property has changed'''
-       #if prop in ['v1','v2','v3','v4','type'] :
-       #   self.execute(fp)
-       #self.execute(fp)
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+    def isLegacy(self, fp) :
+       # Older documents hold a GDMLTriangular / Quadrangular per facet
+       return not hasattr(fp,'facets') or \
+              (len(fp.facets) == 0 and len(fp.OutList) > 0)
 
     def execute(self, fp):
-       print("Tessellated")
-       parms = self.Object.OutList
-       GDMLShared.trace("Number of parms : "+str(len(parms)))
+       if self.isLegacy(fp) :
+          fp.Shape = self.createLegacyShape(fp)
+       else :
+          GDMLsolid.execute(self, fp)
+
+    def createShape(self, fp):
+       GDMLShared.debug("Tessellated : %s facets", len(fp.facets)//4)
+       facets = fp.facets
+       triangles = []
+       for i in range(0, len(facets), 4) :
+           triangles.append((facets[i],facets[i+1],facets[i+2]))
+           if facets[i+3] >= 0 :
+              triangles.append((facets[i],facets[i+2],facets[i+3]))
+       shape = Part.Shape()
+       shape.makeShapeFromMesh((fp.vertices, triangles), 0.001)
+       shell = Part.Shell(shape.Faces)
+       solid = Part.Solid(shell)
+       if solid.Volume < 0:
+          solid.reverse()
+       return solid
+
+    def createLegacyShape(self, fp):
+       parms = fp.OutList
+       GDMLShared.debug("Number of parms : %s", len(parms))
        faces = []
        for ptr in parms :
-           #print(dir(ptr))
            if hasattr(ptr,'v4') :
-              print("Quad")
-              print(ptr.v1)
-              print(ptr.v2)
-              print(ptr.v3)
-              print(ptr.v4)
               faces.append(GDMLShared.quad(ptr.v1,ptr.v2,ptr.v3,ptr.v4))
-
            else :   
-              print("Triangle")
-              print("Vertex 1")
-              print(ptr.v1)
-              print("Vertex 2")
-              print(ptr.v2)
-              print("Vertex 3")
-              print(ptr.v3)
               faces.append(GDMLShared.triangle(ptr.v1,ptr.v2,ptr.v3))
-     
-       print(faces)
        shell=Part.makeShell(faces)
-       print("Is Valid")
-       print(shell.isValid())
-       shell.check()
        #solid=Part.Solid(shell).removeSplitter()
        solid=Part.Solid(shell)
        if solid.Volume < 0:
           solid.reverse()
-       fp.Shape = solid
-       #fp.Shape = faces[0]
-       #fp.Shape = Part.makeBox(10,10,10)
+       return solid
 
 class GDMLFiles(GDMLcommon) :
    def __init__(self,obj,FilesEntity,sectionDict) :
       '''Add some custom properties to our Cone feature'''
-      GDMLShared.trace("GDML Files")
-      GDMLShared.trace(FilesEntity)
+      GDMLShared.debug("GDML Files")
+      GDMLShared.debug("%s", FilesEntity)
       obj.addProperty("App::PropertyBool","active","GDMLFiles", \
                     "split option").active=FilesEntity
       obj.addProperty("App::PropertyString","define","GDMLFiles", \
@@ -1146,7 +1172,7 @@ class GDMLFiles(GDMLcommon) :
       '''Do something when a property has changed'''
       if not hasattr(fp,'onchange') or not fp.onchange : return
       #self.execute(fp)
-      GDMLShared.trace("Change property: " + str(prop) + "\n")
+      GDMLShared.debug("Change property: %s\n", prop)
 
 class GDMLvolume :
    def __init__(self,obj) :
@@ -1170,12 +1196,14 @@ class GDMLmaterial(GDMLcommon) :
 class GDMLfraction(GDMLcommon) :
    def __init__(self,obj,ref,n) :
       obj.addProperty("App::PropertyFloat",'n',ref).n = n 
+      obj.addProperty("App::PropertyString",'ref',ref).ref = ref
       obj.Proxy = self
       self.Object = obj
 
 class GDMLcomposite(GDMLcommon) :
    def __init__(self,obj,ref,n) :
       obj.addProperty("App::PropertyInteger",'n',ref).n = n 
+      obj.addProperty("App::PropertyString",'ref',ref).ref = ref
       obj.Proxy = self
       self.Object = obj
 
@@ -1195,6 +1223,148 @@ class GDMLisotope(GDMLcommon) :
       obj.Proxy = self
       self.Object = obj
 
+class GDMLmaterialDB(GDMLcommon) :
+   '''Materials section held by one object rather than a group per entry.
+      Each kind has a map of name -> JSON [attributes, [[tag, attributes]..]]
+      and a list giving the order of definition. Objects are only created
+      for entries being edited, they are children of this group'''
+   kinds = ['isotope','element','material']
+
+   def __init__(self, obj) :
+      for kind in self.kinds :
+          obj.addProperty("App::PropertyMap",kind+'s','GDMLmaterialDB', \
+                          kind+' definitions')
+          obj.addProperty("App::PropertyStringList",kind+'Order', \
+                          'GDMLmaterialDB',kind+' order of definition')
+      obj.addProperty("App::PropertyMap",'edited','GDMLmaterialDB', \
+                      'kind:name -> object of edited entries')
+      obj.Proxy = self
+      self.Object = obj
+
+   def onChanged(self, fp, prop) :
+      # Decoded tables are cached, drop when the map is changed
+      if prop.endswith('s') and prop[:-1] in self.kinds :
+         self.tables().pop(prop[:-1], None)
+
+   def tables(self) :
+      if not hasattr(self, 'decoded') :
+         self.decoded = {}
+      return self.decoded
+
+   def table(self, fp, kind) :
+      tables = self.tables()
+      if kind not in tables :
+         tables[kind] = dict((k, json.loads(v)) for k, v in \
+                             getattr(fp, kind+'s').items())
+      return tables[kind]
+
+   def names(self, fp, kind) :
+      return getattr(fp, kind+'Order')
+
+   def has(self, fp, kind, name) :
+      return name in self.table(fp, kind)
+
+   def editedObject(self, fp, kind, name) :
+      objName = fp.edited.get(kind+':'+name)
+      if objName is None :
+         return None
+      return fp.Document.getObject(objName)
+
+   def entry(self, fp, kind, name) :
+      # Current definition, from the object if the entry is being edited
+      entry = self.table(fp, kind).get(name)
+      obj = self.editedObject(fp, kind, name)
+      if obj is not None :
+         return entryFromObject(kind, obj, entry)
+      return entry
+
+   def addEntries(self, fp, kind, items) :
+      # items list of (name, entry), entries already present are kept
+      # the property is only written once
+      table = getattr(fp, kind+'s')
+      order = getattr(fp, kind+'Order')
+      added = []
+      for name, entry in items :
+          if name is None or name in table :
+             continue
+          table[name] = json.dumps(entry, separators=(',',':'))
+          order.append(name)
+          added.append(name)
+      if len(added) > 0 :
+         setattr(fp, kind+'s', table)
+         setattr(fp, kind+'Order', order)
+      return added
+
+   def replaceEntries(self, fp, kind, items) :
+      # Entries present with a different value are replaced, returns
+      # their names. An edited entry is still taken from its object
+      table = getattr(fp, kind+'s')
+      replaced = []
+      for name, entry in items :
+          value = json.dumps(entry, separators=(',',':'))
+          if name in table and table[name] != value :
+             table[name] = value
+             replaced.append(name)
+      if len(replaced) > 0 :
+         setattr(fp, kind+'s', table)
+      return replaced
+
+   def setEdited(self, fp, kind, name, obj) :
+      edited = fp.edited
+      edited[kind+':'+name] = obj.Name
+      fp.edited = edited
+
+def findMaterialDB(doc) :
+    obj = doc.getObject('MaterialsDB')
+    if obj is not None and isinstance(getattr(obj,'Proxy',None), \
+                                      GDMLmaterialDB) :
+       return obj
+    return None
+
+def entryFromObject(kind, obj, entry=None) :
+    # Materials database entry from an edited object, children the
+    # objects do not hold ( i.e. property ) are kept from entry
+    known = ['atom','D','T','MEE','fraction','composite']
+    attrib = {}
+    children = []
+    if entry is not None :
+       attrib = dict(entry[0])
+       children = [c for c in entry[1] if c[0] not in known]
+    attrib['name'] = obj.name
+    if kind == 'isotope' :
+       attrib['N'] = str(obj.N)
+       attrib['Z'] = str(obj.Z)
+       children.append(['atom', {'unit': obj.unit, 'value': str(obj.value)}])
+       return [attrib, children]
+    if hasattr(obj,'formula') :
+       attrib['formula'] = obj.formula
+    if hasattr(obj,'Z') :
+       attrib['Z'] = str(obj.Z)
+    for tag in ['T','MEE','D'] :
+        if hasattr(obj,tag+'value') :
+           child = {}
+           if getattr(obj,tag+'unit','') != '' :
+              child['unit'] = getattr(obj,tag+'unit')
+           child['value'] = str(getattr(obj,tag+'value'))
+           children.append([tag, child])
+    if hasattr(obj,'atom_unit') or hasattr(obj,'atom_value') :
+       atom = {}
+       if hasattr(obj,'atom_unit') :
+          atom['unit'] = obj.atom_unit
+       if hasattr(obj,'atom_value') :
+          atom['value'] = str(obj.atom_value)
+       children.append(['atom', atom])
+    for child in obj.Group :
+        if isinstance(child.Proxy, GDMLcomposite) :
+           tag = 'composite'
+        elif isinstance(child.Proxy, GDMLfraction) :
+           tag = 'fraction'
+        else :
+           continue
+        children.append([tag, {'n': str(child.n), \
+                               'ref': getattr(child,'ref',child.Name)}])
+    return [attrib, children]
+
 class ViewProviderExtension(GDMLcommon) :
    def __init__(self, obj):
        obj.addExtension("Gui::ViewProviderGeoFeatureGroupExtensionPython", self)
@@ -1254,7 +1424,7 @@ class ViewProvider(GDMLcommon):
  
    def onChanged(self, vp, prop):
        '''Here we can do something when a single property got changed'''
-       GDMLShared.trace("Change property: " + str(prop) + "\n")
+       GDMLShared.debug("Change property: %s\n", prop)
        #if prop == "Color":
        #    c = vp.getPropertyByName("Color")
 #    self.color.rgb.setValue(c[0],c[1],c[2])    
@@ -0,0 +1,192 @@
+# Persistent cache of generated GDML solid shapes
+#
+# Shapes are stored as BREP files keyed on a hash of the solid type,
+# the builder version and the parameters used to build it, so that
+# reopening a document or reimporting a file does not rebuild every
+# solid with boolean operations.
+#
+# Recently used shapes are also kept in memory with the same keys, so
+# solids with the same parameters share one shape whatever their name.
+# Shapes handed out are shared and must not be modified in place,
+# objects only set their own Placement on them.
+#
+# Cache directory : <UserAppData>/GDML/ShapeCache
+# Preferences     : shapeCache (bool), shapeCacheSize (MB)
+#                   shapeMemoryCache (number of shapes, 0 disables)
+
+import FreeCAD, Part
+import os, hashlib, tempfile, collections
+
+import GDMLShared
+
+global cacheDir, cacheEnabled, cacheLimit, cacheSize
+cacheDir = None
+cacheEnabled = None
+cacheLimit = 0
+cacheSize = None
+
+global memoryCache, memoryLimit
+memoryCache = collections.OrderedDict()
+memoryLimit = 0
+
+def readPreferences() :
+    global cacheDir, cacheEnabled, cacheLimit, memoryLimit
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
+    cacheEnabled = params.GetBool('shapeCache',True)
+    cacheLimit = params.GetInt('shapeCacheSize',256) * 1024 * 1024
+    memoryLimit = params.GetInt('shapeMemoryCache',2000)
+    cacheDir = os.path.join(FreeCAD.getUserAppDataDir(),'GDML','ShapeCache')
+    if cacheEnabled :
+       try :
+          os.makedirs(cacheDir, exist_ok=True)
+       except OSError as e :
+          GDMLShared.warning("Shape cache disabled : %s", e)
+          cacheEnabled = False
+
+def enabled() :
+    if cacheEnabled is None :
+       readPreferences()
+    return cacheEnabled
+
+def canonical(value) :
+    # Stable text form of a parameter value
+    if hasattr(value, 'Value') :          # Quantity
+       value = value.Value
+    if isinstance(value, float) :
+       return '%.12g' % value
+    if isinstance(value, (list, tuple)) :
+       return '(' + ','.join(canonical(v) for v in value) + ')'
+    if hasattr(value, 'x') and hasattr(value, 'y') and hasattr(value, 'z') :
+       return canonical((value.x, value.y, value.z))   # Vector
+    return str(value)
+
+def shapeKey(solidType, version, params) :
+    text = solidType + ':' + str(version) + ':' + canonical(params)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def entries() :
+    # List of (mtime, size, path) for cached files
+    result = []
+    for f in os.listdir(cacheDir) :
+        if not f.endswith('.brep') :
+           continue
+        path = os.path.join(cacheDir, f)
+        try :
+           st = os.stat(path)
+        except OSError :
+           continue
+        result.append((st.st_mtime, st.st_size, path))
+    return result
+
+def evict() :
+    # Remove least recently used files until under the size limit
+    global cacheSize
+    files = entries()
+    cacheSize = sum(f[1] for f in files)
+    if cacheSize <= cacheLimit :
+       return
+    files.sort()
+    for mtime, size, path in files :
+        try :
+           os.remove(path)
+           cacheSize -= size
+        except OSError :
+           pass
+        if cacheSize <= cacheLimit :
+           break
+
+def load(key) :
+    path = os.path.join(cacheDir, key + '.brep')
+    if not os.path.exists(path) :
+       return None
+    try :
+       shape = Part.Shape()
+       shape.importBrep(path)
+    except Exception as e :
+       GDMLShared.warning("Shape cache : bad entry %s : %s", key, e)
+       try :
+          os.remove(path)
+       except OSError :
+          pass
+       return None
+    if shape.isNull() :
+       return None
+    try :
+       os.utime(path, None)      # mark as recently used
+    except OSError :
+       pass
+    return shape
+
+def store(key, shape) :
+    global cacheSize
+    path = os.path.join(cacheDir, key + '.brep')
+    try :
+       fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=cacheDir)
+       os.close(fd)
+       shape.exportBrep(tmp)
+       os.replace(tmp, path)        # atomic so readers never see partial files
+    except Exception as e :
+       GDMLShared.warning("Shape cache : unable to store %s : %s", key, e)
+       try :
+          os.remove(tmp)
+       except Exception :
+          pass
+       return
+    if cacheSize is None :
+       evict()
+    else :
+       cacheSize += os.path.getsize(path)
+       if cacheSize > cacheLimit :
+          evict()
+
+def remember(key, shape) :
+    # Keep shape in memory, dropping the least recently used
+    if memoryLimit <= 0 :
+       return
+    memoryCache[key] = shape
+    memoryCache.move_to_end(key)
+    while len(memoryCache) > memoryLimit :
+        memoryCache.popitem(last=False)
+
+def recall(key) :
+    shape = memoryCache.get(key)
+    if shape is not None :
+       memoryCache.move_to_end(key)
+    return shape
+
+def lookup(key, builder) :
+    # Return shape for key from memory, disk or builder() in that order
+    if cacheEnabled is None :
+       readPreferences()
+    shape = recall(key)
+    if shape is not None :
+       GDMLShared.debug("Shape memory hit : %s", key)
+       return shape
+    if cacheEnabled :
+       shape = load(key)
+       if shape is not None :
+          GDMLShared.debug("Shape cache hit : %s", key)
+          remember(key, shape)
+          return shape
+    shape = builder()
+    if shape is not None and not shape.isNull() :
+       remember(key, shape)
+       if cacheEnabled :
+          store(key, shape)
+    return shape
+
+def getShape(solidType, version, params, builder) :
+    # Return shape for params, calling builder() on a cache miss
+    return lookup(shapeKey(solidType, version, params), builder)
+
+def clear() :
+    global cacheSize
+    if cacheDir is None :
+       readPreferences()
+    memoryCache.clear()
+    for mtime, size, path in entries() :
+        try :
+           os.remove(path)
+        except OSError :
+           pass
+    cacheSize = 0
@@ -4,40 +4,369 @@
 # anything needing to call eval needs to be in this file
 
 from math import *
+import math, ast, collections, functools, re
 import FreeCAD, Part
 
 printverbose = False
 
-global define
+global define, defineIndex
+defineIndex = {}
+
+##########################################################
+# Logging                                                #
+# Messages go to the FreeCAD report view. Arguments are  #
+# only formatted ( msg % args ) if the level is enabled, #
+# debug is the printVerbose preference so callers should #
+# pass values as args rather than build strings.         #
+# Warnings and errors are counted so a caller can tell   #
+# how an import went                                     #
+##########################################################
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+
+logLevel = INFO
+logCounts = {WARNING : 0, ERROR : 0}
+
+def resetCounts() :
+    logCounts[WARNING] = 0
+    logCounts[ERROR] = 0
+
+def setVerbose(verbose) :
+    global printverbose, logLevel
+    printverbose = verbose
+    logLevel = DEBUG if verbose else INFO
+
+def log(level, msg, *args) :
+    if level >= ERROR :
+       logCounts[ERROR] += 1
+    elif level >= WARNING :
+       logCounts[WARNING] += 1
+    if level < logLevel :
+       return
+    if args :
+       msg = msg % args
+    else :
+       msg = str(msg)
+    if level >= ERROR :
+       FreeCAD.Console.PrintError(msg+'\n')
+    elif level >= WARNING :
+       FreeCAD.Console.PrintWarning(msg+'\n')
+    else :
+       FreeCAD.Console.PrintMessage(msg+'\n')
+
+def debug(msg, *args) :
+    # Called on hot paths, test the level before any call overhead
+    if logLevel <= DEBUG :
+       log(DEBUG, msg, *args)
+
+def info(msg, *args) :
+    log(INFO, msg, *args)
+
+def warning(msg, *args) :
+    log(WARNING, msg, *args)
+
+def error(msg, *args) :
+    log(ERROR, msg, *args)
 
 def trace(s):
-    if printverbose == True : print(s)
+    # Older name for debug
+    debug(s)
+
+def indexSection(section) :
+    # Build name index for a section ( define, solids, structure )
+    # keys are (tag, name) and ('*', name) so lookups are a dict access
+    # rather than an XPath scan of the whole section
+    index = {}
+    if section is None :
+       return index
+    for elem in section :
+        if not isinstance(elem.tag, str) :    # Skip comments
+           continue
+        name = elem.get('name')
+        if name is None :
+           continue
+        index.setdefault((elem.tag, name), elem)
+        index.setdefault(('*', name), elem)
+    return index
 
 def setDefine(val) :
-    print("Set Define")
-    global define
+    debug("Set Define")
+    global define, defineIndex
     define = val
+    defineIndex = indexSection(val)
+    # New document so start with a clean expression namespace
+    resetNamespace()
+
+def getDefine(tag, name) :
+    # e.g. getDefine('position', name)
+    return defineIndex.get((tag, name))
 
 def processConstants(doc):
-    # all of math must be imported at global level
-    trace("Process Constants")
+    # Scalar defines are resolved in dependency order by resolveDefines
+    # only constants are held as document objects
+    debug("Process Constants")
+    resolveDefines(define)
     constantGrp = doc.addObject("App::DocumentObjectGroupPython","Constants")
     from GDMLObjects import GDMLconstant
     for cdefine in define.findall('constant') :
         #print cdefine.attrib
         name  = str(cdefine.attrib.get('name'))
-        print('name : '+name)
         value = cdefine.attrib.get('value')
-        print('value : '+ value)
-        #constDict[name] = value
-        print(name)
-        #print(dir(name))
-        globals()[name] = eval(value)
+        debug('constant : %s : %s', name, value)
         constObj = constantGrp.newObject("App::DocumentObjectGroupPython", \
                      name)
         GDMLconstant(constObj,name,value)
-    #print("Globals")
-    #print(globals())
+
+##########################################################
+# Expression evaluation                                  #
+# Values are evaluated against exprNamespace which only  #
+# holds math functions, units and the document defines,  #
+# each distinct expression is checked & compiled once.   #
+# Numbers are doubles as in CLHEP so ^ can not build     #
+# huge integers, it overflows instead                    #
+##########################################################
+
+# Units as CLHEP SystemOfUnits i.e. mm, rad, ns, MeV = 1
+unitValues = {
+    'millimeter' : 1., 'mm' : 1., 'mm2' : 1., 'mm3' : 1.,
+    'centimeter' : 10., 'cm' : 10., 'cm2' : 100., 'cm3' : 1000.,
+    'meter' : 1000., 'm' : 1000., 'm2' : 1.e6, 'm3' : 1.e9,
+    'kilometer' : 1.e6, 'km' : 1.e6,
+    'micrometer' : 1.e-3, 'um' : 1.e-3,
+    'nanometer' : 1.e-6, 'nm' : 1.e-6,
+    'angstrom' : 1.e-7, 'fermi' : 1.e-12,
+    'radian' : 1., 'rad' : 1., 'milliradian' : 1.e-3, 'mrad' : 1.e-3,
+    'degree' : pi/180., 'deg' : pi/180., 'steradian' : 1., 'sr' : 1.,
+    'nanosecond' : 1., 'ns' : 1., 'second' : 1.e9, 's' : 1.e9,
+    'millisecond' : 1.e6, 'ms' : 1.e6, 'microsecond' : 1.e3, 'us' : 1.e3,
+    'picosecond' : 1.e-3, 'ps' : 1.e-3, 'hertz' : 1.e-9,
+    'megaelectronvolt' : 1., 'MeV' : 1., 'electronvolt' : 1.e-6,
+    'eV' : 1.e-6, 'keV' : 1.e-3, 'GeV' : 1.e3, 'TeV' : 1.e6, 'PeV' : 1.e9,
+    'eplus' : 1., 'e_SI' : 1.602176634e-19,
+    'kelvin' : 1., 'mole' : 1., 'candela' : 1.,
+    'perCent' : 0.01, 'perThousand' : 0.001, 'perMillion' : 1.e-6,
+    'pi' : pi, 'twopi' : 2*pi, 'halfpi' : pi/2, 'pi2' : pi*pi,
+    }
+# Derived units
+unitValues['joule'] = unitValues['eV'] / unitValues['e_SI']
+unitValues['kilogram'] = unitValues['kg'] = unitValues['joule'] * \
+       unitValues['s'] * unitValues['s'] / (unitValues['m'] * unitValues['m'])
+unitValues['gram'] = unitValues['g'] = 1.e-3 * unitValues['kg']
+unitValues['milligram'] = unitValues['mg'] = 1.e-3 * unitValues['g']
+unitValues['pascal'] = unitValues['joule'] / unitValues['m3']
+unitValues['bar'] = 1.e5 * unitValues['pascal']
+unitValues['atmosphere'] = 101325. * unitValues['pascal']
+
+mathFunctions = ['sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', \
+                 'sinh', 'cosh', 'tanh', 'exp', 'log', 'log10', 'sqrt', \
+                 'pow', 'fabs', 'floor', 'ceil', 'fmod']
+
+safeNodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, \
+             ast.Name, ast.Load, ast.Call, ast.Compare, ast.IfExp, \
+             ast.BoolOp, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+
+# Never evaluated with python builtins
+safeGlobals = {'__builtins__' : {}}
+
+# Number literals, to find 1_000 which python accepts but CLHEP not
+numberPattern = re.compile(r'(?<![\w.])\d[\w.]*')
+
+# Compiled expressions kept, files often repeat the same few values
+exprCacheSize = 65536
+
+def resetNamespace() :
+    global exprNamespace
+    exprNamespace = {}
+    for f in mathFunctions :
+        exprNamespace[f] = getattr(math, f)
+    exprNamespace['abs'] = abs
+    exprNamespace['min'] = min
+    exprNamespace['max'] = max
+    exprNamespace.update(unitValues)
+
+resetNamespace()
+
+def compileExpr(expr) :
+    # Check expression only uses arithmetic, names and function calls
+    # GDML ( CLHEP evaluator ) uses ^ for power
+    for number in numberPattern.findall(expr) :
+        if '_' in number :
+           raise ValueError("Unsupported number in expression : "+expr)
+    tree = ast.parse(expr.strip().replace('^','**'), mode='eval')
+    for node in ast.walk(tree) :
+        if not isinstance(node, safeNodes) :
+           raise ValueError("Unsupported expression : "+expr)
+        if isinstance(node, ast.Name) and node.id.startswith('_') :
+           raise ValueError("Unsupported name in expression : "+expr)
+        if isinstance(node, ast.Call) and \
+               (not isinstance(node.func, ast.Name) or node.keywords) :
+           raise ValueError("Unsupported call in expression : "+expr)
+        if isinstance(node, ast.Constant) and \
+               not isinstance(node.value, (int, float)) :
+           raise ValueError("Unsupported constant in expression : "+expr)
+        if isinstance(node, ast.Constant) :
+           # 9^9^9 overflows as a double rather than never finishing
+           node.value = float(node.value)
+    return compile(tree, '<gdml>', 'eval')
+
+@functools.lru_cache(maxsize=exprCacheSize)
+def cachedExpr(expr) :
+    return compileExpr(expr)
+
+def plainNumber(expr) :
+    # float of a plain number, None otherwise. float() also takes
+    # nan, inf & 1_000 which are not numbers to CLHEP
+    try :
+       value = float(expr)
+    except (ValueError, TypeError) :
+       return None
+    if not isinstance(expr, str) :
+       return value
+    if value - value != 0 or '_' in expr :
+       return None
+    return value
+
+def evalExpr(expr) :
+    # Plain numbers are by far the most common so try them first
+    value = plainNumber(expr)
+    if value is not None :
+       return value
+    return eval(cachedExpr(expr), safeGlobals, exprNamespace)
+
+##########################################################
+# Loops                                                  #
+# Loop variables are bound in a namespace layered over   #
+# exprNamespace, so the document namespace is never      #
+# changed. An expression is evaluated for the whole      #
+# range of a loop at once as a numpy array, value by     #
+# value only if it needs scalars i.e. math functions     #
+##########################################################
+
+def evalWith(expr, bindings) :
+    # evalExpr with the values of enclosing loop variables
+    value = plainNumber(expr)
+    if value is not None :
+       return value
+    return eval(cachedExpr(expr), safeGlobals, \
+                collections.ChainMap(bindings, exprNamespace))
+
+def loopValues(loop, bindings) :
+    # Values of the variable of <loop for= from= to= step=>, to included
+    import numpy
+    start, stop, step = [evalWith(loop.get(a), bindings) \
+                         for a in ('from', 'to', 'step')]
+    if step == 0 :
+       raise ValueError('Loop step is zero : '+str(loop.get('for')))
+    count = int(floor((stop - start) / step + 1e-9)) + 1
+    return start + step * numpy.arange(max(count, 0))
+
+def evalRange(expr, bindings, name, values) :
+    # expr for each of values of loop variable name, a numpy array
+    import numpy
+    code = cachedExpr(expr)
+    try :
+       result = eval(code, safeGlobals, \
+                     collections.ChainMap({name : values}, bindings, \
+                                          exprNamespace))
+       return numpy.broadcast_to(numpy.asarray(result, dtype=float), \
+                                 values.shape)
+    except Exception :
+       scalar = {}
+       namespace = collections.ChainMap(scalar, bindings, exprNamespace)
+       result = numpy.empty(len(values))
+       for i, v in enumerate(values) :
+           scalar[name] = float(v)
+           result[i] = eval(code, safeGlobals, namespace)
+       return result
+
+##########################################################
+# Define resolution                                      #
+# constant, variable, quantity & expression defines may  #
+# refer to each other in any order, they are evaluated   #
+# once each in dependency order into exprNamespace       #
+##########################################################
+
+scalarDefines = ('constant', 'variable', 'quantity', 'expression')
+
+def defineExpression(elem) :
+    # Return expression string for a scalar define
+    if elem.tag == 'expression' :
+       return (elem.text or '').strip()
+    value = elem.get('value')
+    if elem.tag == 'quantity' and value is not None :
+       unit = elem.get('unit')
+       if unit is not None :
+          value = '('+value+')*'+unit
+    return value
+
+def exprNames(expr) :
+    tree = ast.parse(expr.strip().replace('^','**'), mode='eval')
+    return set(n.id for n in ast.walk(tree) if isinstance(n, ast.Name))
+
+def findCycle(deps, remaining) :
+    # Follow dependencies from a node left over by the topological sort
+    # until a name repeats, return the cycle as a list of names
+    name = next(iter(remaining))
+    path = []
+    seen = {}
+    while name not in seen :
+        seen[name] = len(path)
+        path.append(name)
+        name = next(d for d in deps[name] if d in remaining)
+    return path[seen[name]:] + [name]
+
+def resolveDefines(section) :
+    # Evaluate scalar defines in topological order, each exactly once
+    # Returns dictionary of name -> value for the resolved defines
+    exprs = {}
+    if section is not None :
+       for elem in section :
+           if elem.tag in scalarDefines :
+              name = elem.get('name')
+              if name is None or name in exprs :
+                 continue
+              exprs[name] = defineExpression(elem)
+    deps = {}
+    users = dict((name, []) for name in exprs)
+    for name, expr in exprs.items() :
+        try :
+           deps[name] = exprNames(expr) & set(exprs)
+        except Exception as e :
+           # i.e. no value attribute, reported when evaluated
+           debug('Invalid define : %s = %s : %s', name, expr, e)
+           deps[name] = set()
+        for d in deps[name] :
+            users[d].append(name)
+    waiting = dict((name, len(deps[name])) for name in exprs)
+    ready = [name for name in exprs if waiting[name] == 0]
+    values = {}
+    while ready :
+        name = ready.pop()
+        try :
+           values[name] = exprNamespace[name] = evalExpr(exprs[name])
+           debug('define : %s = %s', name, values[name])
+        except Exception as e :
+           error('Unable to evaluate define : %s = %s : %s', \
+                 name, exprs[name], e)
+        for u in users[name] :
+            waiting[u] -= 1
+            if waiting[u] == 0 :
+               ready.append(u)
+        del waiting[name]
+    # Anything not reached is part of or depends on a cycle
+    remaining = set(waiting)
+    while remaining :
+        cycle = findCycle(deps, remaining)
+        error('Circular defines : %s', ' -> '.join(cycle))
+        remaining -= set(cycle)
+        # drop dependants of this cycle
+        pending = list(cycle)
+        while pending :
+            for u in users[pending.pop()] :
+                if u in remaining :
+                   remaining.discard(u)
+                   pending.append(u)
+    return values
 
 def getVal(ptr,var,vtype = 1) :
     # vtype 1 - float vtype 2 int
@@ -48,8 +377,13 @@ def getVal(ptr,var,vtype = 1) :
     if var in ptr.attrib :
        # if yes get its value
        vval = ptr.attrib.get(var)
-       print("vval")
-       print(vval)
+       # Already evaluated i.e. record from a pipeline worker
+       if not isinstance(vval, str) :
+          if vtype == 1 :
+             return(float(vval))
+          else :
+             return(int(vval))
+       debug('%s : %s', var, vval)
        if vval[0] == '&' :  # Is this refering to an HTML entity constant
          chkval = vval[1:]
        else :
@@ -62,9 +396,9 @@ def getVal(ptr,var,vtype = 1) :
        #
        #else :
        if vtype == 1 :
-          return(float(eval(chkval)))
+          return(float(evalExpr(chkval)))
        else :
-          return(int(eval(chkval)))
+          return(int(evalExpr(chkval)))
     else :
        if vtype == 1 :
           return (0.0)
@@ -76,63 +410,110 @@ def getRef(ptr, name) :
     wrk = ptr.find(name)
     if wrk != None :
        ref = wrk.get('ref')
-       trace(name + ' : ' + ref)
+       debug('%s : %s', name, ref)
        return ref
     return wrk
 
 
+##########################################################
+# Units                                                  #
+# Lengths and angles are normalised to mm and rad as a   #
+# file is read, factors come from the unitValues table   #
+# so solids never convert units when built               #
+##########################################################
+
+def unitFactor(unit, default=1., elem=None) :
+    # Factor to internal units i.e. unitFactor('cm') = 10.
+    # elem the element the unit is from, named if it is not known
+    if unit is None or unit == '' :
+       return default
+    factor = unitValues.get(unit)
+    if factor is None :
+       try :
+          factor = evalExpr(unit)       # i.e. unit='10*mm'
+       except Exception as e :
+          error('Unknown unit : %s of %s : %s', unit, elementName(elem), e)
+          return default
+    return factor
+
+def elementName(elem) :
+    # tag and name of an element for messages
+    if elem is None :
+       return 'unknown element'
+    name = elem.get('name')
+    return elem.tag if name is None else elem.tag+' '+name
+
+def lengthFactor(ptr, attr='lunit') :
+    # GDML default length unit is mm
+    return unitFactor(ptr.get(attr), elem=ptr)
+
+def angleFactor(ptr, attr='aunit') :
+    # GDML default angle unit is rad
+    return unitFactor(ptr.get(attr), elem=ptr)
+
+def getVals(ptr, names, factor=1.) :
+    # Values of several attributes scaled to internal units
+    return scaleValues([getVal(ptr, n) for n in names], factor)
+
+def scaleValues(values, factor) :
+    # Whole array converted in one pass
+    if factor == 1. :
+       return values
+    return [v * factor for v in values]
+
+def getPosition(pos) :
+    # Vector in mm from a position define or element
+    x, y, z = getVals(pos, ['x','y','z'], unitFactor(pos.get('unit'), elem=pos))
+    return FreeCAD.Vector(x, y, z)
+
+def getRotation(rot) :
+    # GDML ( Geant4 ) rotations rotate the frame about x then y then z,
+    # the object is placed with the inverse i.e. Rx(-x) Ry(-y) Rz(-z)
+    rotation = FreeCAD.Rotation()
+    if rot is None :
+       return rotation
+    debug("Rotation : ")
+    debug("%s", rot.attrib)
+    # FreeCAD Rotation wants degrees
+    factor = unitFactor(rot.get('unit'), elem=rot) * 180. / pi
+    for a, axis in (('x', FreeCAD.Vector(1,0,0)), \
+                    ('y', FreeCAD.Vector(0,1,0)), \
+                    ('z', FreeCAD.Vector(0,0,1))) :
+        angle = getVal(rot, a) * factor
+        if angle != 0 :
+           rotation = rotation.multiply(FreeCAD.Rotation(axis, -angle))
+    return rotation
+
+def rotationAngles(rotation) :
+    # GDML x, y, z angles in degrees of a FreeCAD rotation, inverse of
+    # getRotation. Rx(-x) Ry(-y) Rz(-z) inverted is Rz(z) Ry(y) Rx(x)
+    # i.e. yaw z, pitch y, roll x
+    yaw, pitch, roll = rotation.inverted().toEuler()
+    return roll, pitch, yaw
+
 def processPlacement(base,rot) :
     # Different Objects will have adjusted base GDML-FreeCAD
     # rot is rotation or None if default 
-    # set angle & axis in case not set by rotation attribute
-    axis = FreeCAD.Vector(1,0,0)
-    angle = 0
-    if rot != None :
-        trace("Rotation : ")
-        trace(rot.attrib)
-        if 'y' in rot.attrib :
-            axis = FreeCAD.Vector(0,1,0)
-            angle = float(eval(rot.attrib['y']))
-        if 'x' in rot.attrib :
-            axis = FreeCAD.Vector(1,0,0)
-            angle = float(eval(rot.attrib['x']))
-        if 'z' in rot.attrib :
-            axis = FreeCAD.Vector(0,0,1)
-            angle = float(eval(rot.attrib['z']))
-    trace(angle)
-    place = FreeCAD.Placement(base,axis,angle)
-    return place
-
-# Return a FreeCAD placement for positionref & rotateref
+    return FreeCAD.Placement(base, getRotation(rot))
+
+# Return a FreeCAD placement for position & rotation ( refs or inline )
 def getPlacementFromRefs(ptr) :
-    trace("getPlacementFromRef")
-    pos = define.find("position[@name='%s']" % getRef(ptr,'positionref'))
-    trace(pos)
-    rot = define.find("rotation[@name='%s']" % getRef(ptr,'rotationref'))
+    debug("getPlacementFromRef")
+    pos = getDefine('position', getRef(ptr,'positionref'))
+    if pos is None :
+       pos = ptr.find('position')
+    rot = getDefine('rotation', getRef(ptr,'rotationref'))
+    if rot is None :
+       rot = ptr.find('rotation')
     base = FreeCAD.Vector(0.0,0.0,0.0)
-    if pos != None :
-       trace(pos.attrib)
-       x = getVal(pos,'x')
-       trace(x)
-       y = getVal(pos,'y')
-       z = getVal(pos,'z')
-       base = FreeCAD.Vector(x,y,z)
+    if pos is not None :
+       debug("%s", pos.attrib)
+       base = getPosition(pos)
     return(processPlacement(base,rot))
 
 
 def getVertex(v):
-    print("Vertex")
-    #print(dir(v))
-    pos = define.find("position[@name='%s']" % v)
-    #print("Position")
-    #print(dir(pos))
-    x = getVal(pos,'x')
-    print('x : '+str(x))
-    y = getVal(pos,'y')
-    print('y : '+str(y))
-    z = getVal(pos,'z')
-    print('z : '+str(z))
-    return(FreeCAD.Vector(x,y,z))
+    return getPosition(getDefine('position', v))
 
 def triangle(v1,v2,v3) :
     # passsed vertex return face
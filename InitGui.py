@@ -71,7 +71,8 @@ class GDML_Workbench ( Workbench ):
         #import GDMLCommands, GDMLResources
         commands=['CycleCommand','BoxCommand','ConeCommand','ElTubeCommand', \
                   'EllipsoidCommand','SphereCommand', \
-                  'TrapCommand','TubeCommand']
+                  'TrapCommand','TubeCommand','EditMaterialCommand',
+                  'UpdateFromFileCommand']
         toolbarcommands=['CycleCommand','BoxCommand','ConeCommand', \
                          'ElTubeCommand', 'EllipsoidCommand','SphereCommand', \
                          'TrapCommand','TubeCommand']
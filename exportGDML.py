@@ -28,6 +28,7 @@ __url__ = ["https://github.com/KeithSloan/FreeCAD_Geant4"]
 
 import FreeCAD, os, Part, math
 from FreeCAD import Vector
+import GDMLShared
 
 # xml handling
 #import argparse
@@ -36,7 +37,7 @@ import lxml.etree  as ET
 #################################
 
 try: import FreeCADGui
-except ValueError: gui = False
+except ImportError: gui = False
 else: gui = True
 
 global zOrder
@@ -45,7 +46,8 @@ from GDMLObjects import GDMLQuadrangular, GDMLTriangular, \
                         GDML2dVertex, GDMLSection, \
                         GDMLmaterial, GDMLfraction, \
                         GDMLcomposite, GDMLisotope, \
-                        GDMLelement, GDMLconstant
+                        GDMLelement, GDMLconstant, \
+                        GDMLmaterialDB
 
 #***************************************************************************
 # Tailor following to your requirements ( Should all be strings )          *
@@ -88,14 +90,19 @@ def indent(elem, level=0):
 #  Setup GDML environment
 #################################
 def GDMLstructure() :
-    print("Setup GDML structure")
+    GDMLShared.debug("Setup GDML structure")
     #################################
     # globals
     ################################
     global gdml, define, materials, solids, structure, setup, worldVOL
     global defineCnt, LVcount, PVcount, POScount, ROTcount
+    global exportPlacement, exportedVolumes
 
     defineCnt = LVcount = PVcount = POScount =  ROTcount = 1
+    # World placement of the object being processed, and per object
+    # name the logical volume and its adjustment, see exportObjects
+    exportPlacement = FreeCAD.Placement()
+    exportedVolumes = {}
 
     #gdml = ET.Element('gdml', {
           #'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
@@ -113,7 +120,7 @@ def GDMLstructure() :
 
 def defineMaterials():
     # Replaced by loading Default
-    print("Define Materials")
+    GDMLShared.debug("Define Materials")
     global materials
    
 def defineWorldBox(exportList,bbox):
@@ -138,7 +145,7 @@ def defineWorldBox(exportList,bbox):
 
 
 def constructWorld():
-    print("Construct World")
+    GDMLShared.debug("Construct World")
     global worldVOL
 
     #ET.ElementTree(gdml).write("test9b", 'utf-8', True)
@@ -150,64 +157,94 @@ def constructWorld():
     #ET.SubElement(solids, 'box',{'name': 'WorldBox','x': '1000','y': '1000','z': '1000','lunit' : 'mm'})
     #ET.ElementTree(gdml).write("test9c", 'utf-8', True)
 
-def createLVandPV(obj, name, solidName):
+# Material for FreeCAD objects without one, from the NIST database
+defaultMaterial = 'G4_STAINLESS-STEEL'
+
+def getMaterial(obj) :
+    # GDML solids have a material, booleans take that of their base
+    material = getattr(obj, 'material', None)
+    if isinstance(material, str) and material != '' :
+       return material
+    if hasattr(obj, 'Base') and obj.Base is not None :
+       return getMaterial(obj.Base)
+    return defaultMaterial
+
+def addNistMaterials() :
+    # Define G4_ materials that are used but not declared in the document
+    import GDMLNist
+    defined = set(item.get('name') for item in materials)
+    used = [ref.get('ref') for ref in structure.iter('materialref')]
+    used += [ref.get('ref') for tag in ('fraction', 'composite') \
+             for ref in materials.iter(tag)]
+    used = sorted(set(name for name in used if GDMLNist.isNist(name)))
+    # NIST entries only refer to elements, so go before any material
+    for i, (kind, name, entry) in enumerate(GDMLNist.entries(used, defined)) :
+        item = ET.Element(kind, entry[0])
+        for tag, attrib in entry[1] :
+            ET.SubElement(item, tag, attrib)
+        materials.insert(i, item)
+
+def createLVandPV(obj, name, solidName, delta=None):
     #
     # Cannot rely on obj.Name so have to pass name
     # Logical & Physical Volumes get added to structure section of gdml
+    # Placed at exportPlacement, moved by delta in the object's axes
     #
     #ET.ElementTree(gdml).write("test9d", 'utf-8', True)
     #print("Object Base")
     #dir(obj.Base)
     #print dir(obj)
     #print dir(obj.Placement)
-    global PVcount, POScount, ROTcount
+    global PVcount
     pvName = 'PV'+name+str(PVcount)
     PVcount += 1
-    pos  = obj.Placement.Base
     lvol = ET.SubElement(structure,'volume', {'name':pvName})
-    ET.SubElement(lvol, 'materialref', {'ref': 'SSteel0x56070ee87d10'})
+    ET.SubElement(lvol, 'materialref', {'ref': getMaterial(obj)})
     ET.SubElement(lvol, 'solidref', {'ref': solidName})
+    adjust = FreeCAD.Placement()
+    if delta is not None :
+       adjust = FreeCAD.Placement(delta, FreeCAD.Rotation())
+    # Further placements via links reuse the volume
+    exportedVolumes[obj.Name] = (pvName, adjust)
+    createPV(name, pvName, exportPlacement.multiply(adjust))
+
+def createPV(name, pvName, placement):
     # Place child physical volume in World Volume
+    global POScount, ROTcount
     phys = ET.SubElement(worldVOL, 'physvol')
     ET.SubElement(phys, 'volumeref', {'ref': pvName})
+    pos = placement.Base
     x = pos[0]
     y = pos[1]
     z = pos[2]
-    if x!=0 and y!=0 and z!=0 :
+    if x!=0 or y!=0 or z!=0 :
        posName = 'Pos'+name+str(POScount)
        POScount += 1
        ET.SubElement(phys, 'position', {'name': posName, 'unit': 'mm', \
-                  'x': str(x), 'y': str(y), 'z': str(y) })
-    angles = obj.Placement.Rotation.toEuler()
-    print ("Angles")
-    print (angles)
-    a0 = angles[0]
-    a1 = angles[1]
-    a2 = angles[2]
-    if a0!=0 and a1!=0 and a2!=0 :
+                  'x': str(x), 'y': str(y), 'z': str(z) })
+    ax, ay, az = GDMLShared.rotationAngles(placement.Rotation)
+    GDMLShared.debug("Angles : %s %s %s", ax, ay, az)
+    if ax!=0 or ay!=0 or az!=0 :
        rotName = 'Rot'+name+str(ROTcount)
        ROTcount += 1
        ET.SubElement(phys, 'rotation', {'name': rotName, 'unit': 'deg', \
-                  'x': str(-a2), 'y': str(-a1), 'z': str(-a0)})
+                  'x': str(ax), 'y': str(ay), 'z': str(az)})
 
 def createAdjustedLVandPV(obj, name, solidName, delta):
     # Allow for difference in placement between FreeCAD and GDML
-    adjObj = obj
-    rot = FreeCAD.Rotation(obj.Placement.Rotation)
-    adjObj.Placement.move(rot.multVec(delta))#.negative()
-    createLVandPV(adjObj, name, solidName)
+    createLVandPV(obj, name, solidName, delta)
 
 def reportObject(obj) :
     
-    print("Report Object")
-    print(obj)
-    print("Name : "+obj.Name)
-    print("Type : "+obj.TypeId) 
+    GDMLShared.debug("Report Object")
+    GDMLShared.debug("%s", obj)
+    GDMLShared.debug("Name : %s", obj.Name)
+    GDMLShared.debug("Type : %s", obj.TypeId) 
     if hasattr(obj,'Placement') :
-       print("Placement")
-       print("Pos   : "+str(obj.Placement.Base))
-       print("axis  : "+str(obj.Placement.Rotation.Axis))
-       print("angle : "+str(obj.Placement.Rotation.Angle))
+       GDMLShared.debug("Placement")
+       GDMLShared.debug("Pos   : %s", obj.Placement.Base)
+       GDMLShared.debug("axis  : %s", obj.Placement.Rotation.Axis)
+       GDMLShared.debug("angle : %s", obj.Placement.Rotation.Angle)
     
     while switch(obj.TypeId) :
 
@@ -215,12 +252,12 @@ def reportObject(obj) :
       # FreeCAD GDML Parts                      #
       ###########################################
       if case("Part::FeaturePython") : 
-         print("Part::FeaturePython")
+         GDMLShared.debug("Part::FeaturePython")
          if hasattr(obj.Proxy,'Type'):
-            print (obj.Proxy.Type)
-            print (obj.Name)
+            GDMLShared.debug("%s", obj.Proxy.Type)
+            GDMLShared.debug("%s", obj.Name)
          else :
-            print("Not a GDML Feature")
+            GDMLShared.warning("Not a GDML Feature")
             
          #print dir(obj)
          #print dir(obj.Proxy)
@@ -230,64 +267,67 @@ def reportObject(obj) :
       # FreeCAD Parts                           #
       ###########################################
       if case("Part::Sphere") :
-         print("Sphere Radius : "+str(obj.Radius))
+         GDMLShared.debug("Sphere Radius : %s", obj.Radius)
          break
            
       if case("Part::Box") : 
-         print("cube : ("+ str(obj.Length)+","+str(obj.Width)+","+str(obj.Height)+")")
+         GDMLShared.debug("cube : (%s,%s,%s)", \
+                          obj.Length, obj.Width, obj.Height)
          break
 
       if case("Part::Cylinder") : 
-         print("cylinder : Height "+str(obj.Height)+ " Radius "+str(obj.Radius))
+         GDMLShared.debug("cylinder : Height %s Radius %s", \
+                          obj.Height, obj.Radius)
          break
    
       if case("Part::Cone") :
-         print("cone : Height "+str(obj.Height)+ " Radius1 "+str(obj.Radius1)+" Radius2 "+str(obj.Radius2))
+         GDMLShared.debug("cone : Height %s Radius1 %s Radius2 %s", \
+                          obj.Height, obj.Radius1, obj.Radius2)
          break
 
       if case("Part::Torus") : 
-         print("Torus")
-         print(obj.Radius1)
-         print(obj.Radius2)
+         GDMLShared.debug("Torus")
+         GDMLShared.debug("%s", obj.Radius1)
+         GDMLShared.debug("%s", obj.Radius2)
          break
 
       if case("Part::Prism") :
-         print("Prism")
+         GDMLShared.debug("Prism")
          break
 
       if case("Part::RegularPolygon") :
-         print("RegularPolygon")
+         GDMLShared.debug("RegularPolygon")
          break
 
       if case("Part::Extrusion") :
-         print("Extrusion")
+         GDMLShared.debug("Extrusion")
          break
 
       if case("Circle") :
-         print("Circle")
+         GDMLShared.debug("Circle")
          break
 
       if case("Extrusion") : 
-         print("Wire extrusion")
+         GDMLShared.debug("Wire extrusion")
          break
 
       if case("Mesh::Feature") :
-         print("Mesh")
+         GDMLShared.debug("Mesh")
          #print dir(obj.Mesh)
          break
 
 
-      print("Other")
-      print(obj.TypeId)
+      GDMLShared.debug("Other")
+      GDMLShared.debug("%s", obj.TypeId)
       break
 
 def processPlanar(obj, shape, name ) :
-    print ('Polyhedron ????')
+    GDMLShared.debug('Polyhedron ????')
     global defineCnt
     #
-    print("Add tessellated Solid")
+    GDMLShared.debug("Add tessellated Solid")
     tess = ET.SubElement(solids,'tessellated',{'name': name})
-    print("Add Vertex positions")
+    GDMLShared.debug("Add Vertex positions")
     for f in shape.Faces :
        baseVrt = defineCnt
        for vrt in f.Vertexes :
@@ -298,7 +338,7 @@ def processPlanar(obj, shape, name ) :
               'z': str(vrt.Point.z), \
               'unit': 'mm'})
            defineCnt += 1
-       print("Add vertex to tessellated Solid")
+       GDMLShared.debug("Add vertex to tessellated Solid")
        vrt1 = 'v'+str(baseVrt)
        vrt2 = 'v'+str(baseVrt+1)
        vrt3 = 'v'+str(baseVrt+2)
@@ -330,22 +370,22 @@ def mesh2Tessellate(mesh, name) :
      global defineCnt
 
      baseVrt = defineCnt
-     print ("mesh")
-     print (mesh)
-     print (dir(mesh))
-     print ("Facets")
-     print (mesh.Facets)
-     print ("mesh topology")
-     print (dir(mesh.Topology))
-     print (mesh.Topology)
+     GDMLShared.debug("mesh")
+     GDMLShared.debug("%s", mesh)
+     GDMLShared.debug("%s", dir(mesh))
+     GDMLShared.debug("Facets")
+     GDMLShared.debug("%s", mesh.Facets)
+     GDMLShared.debug("mesh topology")
+     GDMLShared.debug("%s", dir(mesh.Topology))
+     GDMLShared.debug("%s", mesh.Topology)
 #
 #    mesh.Topology[0] = points
 #    mesh.Topology[1] = faces
 #
 #    First setup vertex in define section vetexs (points) 
-     print("Add Vertex positions")
+     GDMLShared.debug("Add Vertex positions")
      for fc_points in mesh.Topology[0] : 
-         print(fc_points)
+         GDMLShared.debug("%s", fc_points)
          v = 'v'+str(defineCnt)
          ET.SubElement(define, 'position', {'name': v, \
                   'x': str(fc_points[0]), \
@@ -356,10 +396,10 @@ def mesh2Tessellate(mesh, name) :
 #                  
 #     Add faces
 #
-     print("Add Triangular vertex")
+     GDMLShared.debug("Add Triangular vertex")
      tess = ET.SubElement(solids,'tessellated',{'name': name})
      for fc_facet in mesh.Topology[1] : 
-       print(fc_facet)
+       GDMLShared.debug("%s", fc_facet)
        vrt1 = 'v'+str(baseVrt+fc_facet[0])
        vrt2 = 'v'+str(baseVrt+fc_facet[1])
        vrt3 = 'v'+str(baseVrt+fc_facet[2])
@@ -371,7 +411,7 @@ def processMesh(obj, Mesh, Name) :
     #  obj needed for Volune names
     #  object maynot have Mesh as part of Obj
     #  Name - allows control over name
-    print("Create Tessellate Logical Volume")
+    GDMLShared.debug("Create Tessellate Logical Volume")
     createLVandPV(obj, Name, 'Tessellated')
     mesh2Tessellate(Mesh, Name)
     return(Name)
@@ -385,30 +425,30 @@ def processObjectShape(obj) :
     # Check if Planar
     # If plannar create Tessellated Solid with 3 & 4 vertex as appropriate
     # If not planar create a mesh and the a Tessellated Solid with 3 vertex
-    print("Process Object Shape")
-    print(obj)
-    print(obj.PropertiesList)
+    GDMLShared.debug("Process Object Shape")
+    GDMLShared.debug("%s", obj)
+    GDMLShared.debug("%s", obj.PropertiesList)
     shape = obj.Shape
-    print (shape)
-    print(shape.ShapeType)
+    GDMLShared.debug("%s", shape)
+    GDMLShared.debug("%s", shape.ShapeType)
     while switch(shape.ShapeType) : 
       if case("Mesh::Feature") :
-         print("Mesh - Should not occur should have been handled")
+         GDMLShared.warning("Mesh - Should not occur should have been handled")
          #print("Mesh")
          #tessellate = mesh2Tessellate(mesh) 
          #return(tessellate)
          #break
 
-         print("ShapeType Not handled")
-         print(shape.ShapeType)
+         GDMLShared.warning("ShapeType Not handled")
+         GDMLShared.debug("%s", shape.ShapeType)
          break
 
 #   Dropped through to here
 #   Need to check has Shape
 
-    print('Check if All planar')
+    GDMLShared.debug('Check if All planar')
     planar = checkShapeAllPlanar(shape)
-    print(planar)
+    GDMLShared.debug("%s", planar)
 
     if planar :
        return(processPlanar(obj,shape,obj.Name))
@@ -468,7 +508,7 @@ def processConeObject(obj, addVolsFlag) :
     return(coneName)
 
 def processSection(obj, addVolsflag) :
-    print("Process Section")
+    GDMLShared.debug("Process Section")
     ET.SubElement(solids, 'section',{'vertex1': obj.v1, \
             'vertex2': obj.v2, 'vertex3': obj.v3, 'vertex4': obj.v4, \
             'type': obj.vtype})
@@ -497,11 +537,8 @@ def processGDMLBoxObject(obj, addVolsFlag) :
                            'z': str(obj.z.Value),  \
                            'lunit' : 'mm'})
     if addVolsFlag :
-       # Adjustment for position in GDML
-       delta = FreeCAD.Vector(obj.x.Value / 2, \
-                           obj.y.Value / 2,  \
-                           obj.z.Value / 2)
-       createAdjustedLVandPV(obj, obj.Name, boxName, delta)
+       # GDMLBox is centred like the GDML box
+       createLVandPV(obj, obj.Name, boxName)
     return (boxName)
 
 def processGDMLConeObject(obj, addVolsFlag) :
@@ -563,7 +600,7 @@ def processGDMLPolyconeObject(obj, addVolsFlag) :
                            'deltaphi': str(obj.deltaphi),  \
                            'aunit': str(obj.aunit),  \
                            'lunit' : 'mm'})
-    print(obj.OutList)
+    GDMLShared.debug("%s", obj.OutList)
     for zplane in obj.OutList :
         ET.SubElement(solids, 'zplane',{'rmin': str(zplane.rmin), \
                                'rmax' : str(zplane.rmax), \
@@ -577,7 +614,7 @@ def processGDMLPolyconeObject(obj, addVolsFlag) :
     return(polyconeName)
 
 def processGDMLQuadObject(obj, addVolsFlag) :
-    print("GDMLQuadrangular")
+    GDMLShared.debug("GDMLQuadrangular")
     ET.SubElement(solids, 'quadrangular',{'vertex1': obj.v1, \
             'vertex2': obj.v2, 'vertex3': obj.v3, 'vertex4': obj.v4, \
             'type': obj.vtype})
@@ -599,29 +636,40 @@ def processGDMLSphereObject(obj, addVolsFlag) :
 
 def processGDMLTessellatedObject(obj, addVolsFlag) :
     # Needs unique Name
-    # Need to output unique define positions
-    # Need to create set of positions
-    #for items in obj.Outlist :
-    #    ET.SubElement(GDMLShared.define,'position',{'name': obj.Name + 'v1', \
-    #            'x':items.x , 'y':items.y, 'z':items.z,'unit':'mm')
-
+    # Vertices output as unique define positions
     tessName = 'Tess' + obj.Name
-    ET.SubElement(solids, 'tessellated',{'name': tessName})
-    print(len(obj.OutList))
-    for items in obj.OutList :
-        if hasattr(items,'v4' ) :
-            ET.SubElement(solids,'quadrangular',{'vertex1':'v1', \
-                    'vertex2':'v2', 'vertex3':'v3', 'vertex4':'v4',
-                                 'type':'ABSOLUTE'})
-        else :    
-            ET.SubElement(solids,'triangular',{'vertex1':'v1', 'vertex2':'v2', \
-                                 'vertex3':'v3','type':'ABSOLUTE'})
+    if not hasattr(obj,'facets') or len(obj.facets) == 0 :
+       # Older document with facet objects, export from the shape
+       processPlanar(obj, obj.Shape, tessName)
+    else :
+       tess = ET.SubElement(solids, 'tessellated',{'name': tessName})
+       vNames = []
+       for i, v in enumerate(obj.vertices) :
+           vName = tessName + '_v' + str(i)
+           ET.SubElement(define, 'position', {'name': vName, \
+                  'x': str(v.x), 'y': str(v.y), 'z': str(v.z), 'unit': 'mm'})
+           vNames.append(vName)
+       facets = obj.facets
+       for i in range(0, len(facets), 4) :
+           if facets[i+3] >= 0 :
+              ET.SubElement(tess,'quadrangular',{ \
+                      'vertex1': vNames[facets[i]], \
+                      'vertex2': vNames[facets[i+1]], \
+                      'vertex3': vNames[facets[i+2]], \
+                      'vertex4': vNames[facets[i+3]], \
+                      'type': 'ABSOLUTE'})
+           else :
+              ET.SubElement(tess,'triangular',{ \
+                      'vertex1': vNames[facets[i]], \
+                      'vertex2': vNames[facets[i+1]], \
+                      'vertex3': vNames[facets[i+2]], \
+                      'type': 'ABSOLUTE'})
 
     if addVolsFlag :
        # Adjustment for position in GDML
        delta = FreeCAD.Vector(0, 0, 0)
        createAdjustedLVandPV(obj, obj.Name, tessName, delta)
-       return(tessName)
+    return(tessName)
 
 
 def processGDMLTrapObject(obj, addVolsFlag) :
@@ -664,7 +712,7 @@ def processGDMLTrdObject(obj, addVolsFlag) :
     return(trdName)
 
 def processGDMLTriangle(obj, addVolsFlag) :
-    print("Process GDML Triangle")
+    GDMLShared.debug("Process GDML Triangle")
     ET.SubElement(solids, 'triangular',{'vertex1': obj.v1, \
             'vertex2': obj.v2, 'vertex3': obj.v3,  \
             'type': obj.vtype})
@@ -711,18 +759,18 @@ def processGDMLXtruObject(obj, addVolsFlag) :
     return(xtruName)
 
 def processGDML2dVertex(obj, addVolsFlag) :
-    print("Process 2d Vertex")
+    GDMLShared.debug("Process 2d Vertex")
     ET.SubElement(solids, 'twoDimVertex',{'x': obj.x, 'y': obj.y})
 
 
 # Need to add position of object2 relative to object1
 # Need to add rotation ??? !!!!
 def addBooleanPositionAndRotation(element,obj1,obj2):
-    print ("addBooleanPosition")
-    print ("Position obj1")
-    print (obj1.Placement.Base)
-    print ("Position obj2")
-    print (obj2.Placement.Base)
+    GDMLShared.debug("addBooleanPosition")
+    GDMLShared.debug("Position obj1")
+    GDMLShared.debug("%s", obj1.Placement.Base)
+    GDMLShared.debug("Position obj2")
+    GDMLShared.debug("%s", obj2.Placement.Base)
     global defineCnt
     positionName = 'Pos'+str(defineCnt)
     pos = obj2.Placement.Base - obj1.Placement.Base
@@ -734,7 +782,7 @@ def addBooleanPositionAndRotation(element,obj1,obj2):
     ET.SubElement(element,'positionref', {'ref': positionName})
 
 def processGroup(obj, addVolsFlag) :
-    print("Group Num : "+str(len(obj.Group)))
+    GDMLShared.debug("Group Num : %s", len(obj.Group))
     for grp in obj.Group :
         processObject(grp, addVolsFlag)
 
@@ -750,8 +798,26 @@ def processElement(obj, item): # maybe part of material or element (common code)
        if hasattr(obj,'atom_value') :
           atom.set('value',str(obj.atom_value)) 
 
+def processMaterialDB(obj) :
+    # Write the compact materials table, entries being edited are
+    # taken from their objects
+    for kind in obj.Proxy.kinds :
+        for name in obj.Proxy.names(obj, kind) :
+            attrib, children = obj.Proxy.entry(obj, kind, name)
+            item = ET.SubElement(materials, kind, attrib)
+            for tag, childAttrib in children :
+                ET.SubElement(item, tag, childAttrib)
+
+def inMaterialDB(obj) :
+    # Edited entries and their fractions are written by processMaterialDB
+    for parent in obj.InList :
+        if isinstance(getattr(parent,'Proxy',None), GDMLmaterialDB) or \
+           inMaterialDB(parent) :
+           return True
+    return False
+
 def processObject(obj, addVolsFlag) :
-    print("\nProcess Object")
+    GDMLShared.debug("\nProcess Object")
     global materials
     # return solid or boolean reference name
     # addVolsFlag = True then create Logical & Physical Volumes
@@ -762,34 +828,42 @@ def processObject(obj, addVolsFlag) :
       # Deal with non solids
       #
       if case("App::DocumentObjectGroupPython"):
-         print("   Object List : "+obj.Name)
+         GDMLShared.debug("   Object List : %s", obj.Name)
          #print(obj)
          #print(dir(obj))
          global item
          while switch(obj.Name) :
             if case("Materials") : 
-               print("Materials")
+               GDMLShared.debug("Materials")
                break
 
             if case("Isotopes") :
-               print("Isotopes")
+               GDMLShared.debug("Isotopes")
                break
             
             if case("Elements") :
-               print("Elements")
+               GDMLShared.debug("Elements")
                break
 
             break
+
+         if isinstance(obj.Proxy,GDMLmaterialDB) :
+            GDMLShared.debug("GDML materials table")
+            processMaterialDB(obj)
+            break
+
+         if inMaterialDB(obj) :
+            break
      
          if isinstance(obj.Proxy,GDMLconstant) :
-            print("GDML constant")
+            GDMLShared.debug("GDML constant")
             #print(dir(obj))
 
             item = ET.SubElement(define,'constant',{'name': obj.Name, \
                                  'value': obj.value })
             
          if isinstance(obj.Proxy,GDMLmaterial) :
-            print("GDML material")
+            GDMLShared.debug("GDML material")
             #print(dir(obj))
 
             item = ET.SubElement(materials,'material',{'name': obj.Name})
@@ -813,17 +887,17 @@ def processObject(obj, addVolsFlag) :
 
          if isinstance(obj.Proxy,GDMLfraction) :
 
-            print("GDML fraction")
+            GDMLShared.debug("GDML fraction")
             ET.SubElement(item,'fraction',{'n': str(obj.n), \
                                           'ref': obj.Name})
             break
 
          if isinstance(obj.Proxy,GDMLcomposite) :
-            print("GDML Composite")
+            GDMLShared.debug("GDML Composite")
             break
 
          if isinstance(obj.Proxy,GDMLisotope) :
-            print("GDML isotope")
+            GDMLShared.debug("GDML isotope")
             item = ET.SubElement(materials,'isotope',{'N': str(obj.N), \
                                                       'Z': str(obj.Z), \
                                                       'name' : obj.Name})
@@ -832,7 +906,7 @@ def processObject(obj, addVolsFlag) :
             break
 
          if isinstance(obj.Proxy,GDMLelement) :
-            print("GDML element")
+            GDMLShared.debug("GDML element")
             item = ET.SubElement(materials,'element',{'name': obj.Name})
             processElement(obj,item)
             break
@@ -844,7 +918,7 @@ def processObject(obj, addVolsFlag) :
          break
 
       if case("Part::Cut") :
-         print("   Cut")
+         GDMLShared.debug("   Cut")
          cutName = 'Cut'+obj.Name
          ref1 = processObject(obj.Base,False)
          ref2 = processObject(obj.Tool,False)
@@ -858,7 +932,7 @@ def processObject(obj, addVolsFlag) :
          break
 
       if case("Part::Fuse") :
-         print("   Union")
+         GDMLShared.debug("   Union")
          unionName = 'Union'+obj.Name
          ref1 = processObject(obj.Base,False)
          ref2 = processObject(obj.Tool,False)
@@ -873,7 +947,7 @@ def processObject(obj, addVolsFlag) :
          break
 
       if case("Part::Common") :
-         print("   Intersection")
+         GDMLShared.debug("   Intersection")
          intersectName = 'Intersect'+obj.Name
          ref1 = processObject(obj.Base,False)
          ref2 = processObject(obj.Tool,False)
@@ -888,7 +962,7 @@ def processObject(obj, addVolsFlag) :
          break
 
       if case("Part::MultiFuse") :
-         print("   Multifuse") 
+         GDMLShared.debug("   Multifuse") 
          multName = 'MultiFuse'+obj.Name
          multUnion = ET.Element('multiUnion',{'name': multName })
          for subobj in obj.Shapes:
@@ -905,85 +979,85 @@ def processObject(obj, addVolsFlag) :
          break
 
       if case("Part::MultiCommon") :
-         print("   Multi Common / intersection")
-         print("   Not available in GDML")
+         GDMLShared.debug("   Multi Common / intersection")
+         GDMLShared.debug("   Not available in GDML")
          exit(-3)
          break
 
       if case("Mesh::Feature") :
-         print("   Mesh Feature") 
+         GDMLShared.debug("   Mesh Feature") 
          return(processMesh(obj, obj.Mesh, obj.Name))
          break
 
       if case("Part::FeaturePython"):
-          print("   Python Feature")
+          GDMLShared.debug("   Python Feature")
           if hasattr(obj.Proxy, 'Type') :
-             print(obj.Proxy.Type) 
+             GDMLShared.debug("%s", obj.Proxy.Type) 
              switch(obj.Proxy.Type)
              if case("GDMLBox") :
-                print("      GDMLBox") 
+                GDMLShared.debug("      GDMLBox") 
                 return(processGDMLBoxObject(obj, addVolsFlag))
                 break
 
              if case("GDMLEllipsoid") :
-                print("      GDMLEllipsoid") 
+                GDMLShared.debug("      GDMLEllipsoid") 
                 return(processGDMLEllipsoidObject(obj, addVolsFlag))
                 break
 
              if case("GDMLElTube") :
-                print("      GDMLElTube") 
+                GDMLShared.debug("      GDMLElTube") 
                 return(processGDMLElTubeObject(obj, addVolsFlag))
                 break
 
              if case("GDMLCone") :
-                print("      GDMLCone") 
+                GDMLShared.debug("      GDMLCone") 
                 return(processGDMLConeObject(obj, addVolsFlag))
                 break
 
              if case("GDMLPolycone") :
-                print("      GDMLPolycone") 
+                GDMLShared.debug("      GDMLPolycone") 
                 return(processGDMLPolyconeObject(obj, addVolsFlag))
                 break
              
              if case("GDMLSphere") :
-                print("      GDMLSphere") 
+                GDMLShared.debug("      GDMLSphere") 
                 return(processGDMLSphereObject(obj, addVolsFlag))
                 break
 
              if case("GDMLTessellated") :
-                print("      GDMLTessellated") 
+                GDMLShared.debug("      GDMLTessellated") 
                 return(processGDMLTessellatedObject(obj, addVolsFlag))
                 break
 
              if case("GDMLTrap") :
-                print("      GDMLTrap") 
+                GDMLShared.debug("      GDMLTrap") 
                 return(processGDMLTrapObject(obj, addVolsFlag))
                 break
 
              if case("GDMLTrd") :
-                print("      GDMLTrd") 
+                GDMLShared.debug("      GDMLTrd") 
                 return(processGDMLTrdObject(obj, addVolsFlag))
                 break
 
              if case("GDMLTube") :
-                print("      GDMLTube") 
+                GDMLShared.debug("      GDMLTube") 
                 return(processGDMLTubeObject(obj, addVolsFlag))
-                print("GDML Tube processed")
+                GDMLShared.debug("GDML Tube processed")
                 break
 
              if case("GDMLXtru") :
-                print("      GDMLXtru") 
+                GDMLShared.debug("      GDMLXtru") 
                 return(processGDMLXtruObject(obj, addVolsFlag))
                 break
 
-             print("Not yet Handled")
+             GDMLShared.warning("Not yet Handled")
 
           else :
-             print("Not a GDML Feature")
+             GDMLShared.warning("Not a GDML Feature")
           break  
       # Same as Part::Feature but no position
       if case("App::FeaturePython") :
-         print("App::FeaturePython") 
+         GDMLShared.debug("App::FeaturePython") 
          # Following not needed as handled bu Outlist on Tessellated
          #if isinstance(obj.Proxy, GDMLQuadrangular) :
          #   return(processGDMLQuadObject(obj, addVolsFlag))
@@ -1008,22 +1082,22 @@ def processObject(obj, addVolsFlag) :
       #  Now deal with objects that map to GDML solids
       #
       if case("Part::Box") :
-         print("    Box")
+         GDMLShared.debug("    Box")
          return(processBoxObject(obj, addVolsFlag))
          break
 
       if case("Part::Cylinder") :
-         print("    Cylinder")
+         GDMLShared.debug("    Cylinder")
          return(processCylinderObject(obj, addVolsFlag))
          break
 
       if case("Part::Cone") :
-         print("    Cone")
+         GDMLShared.debug("    Cone")
          return(processConeObject(obj, addVolsFlag))
          break
 
       if case("Part::Sphere") :
-         print("    Sphere")
+         GDMLShared.debug("    Sphere")
          return(processSphereObject(obj, addVolsFlag))
          break
 
@@ -1033,36 +1107,103 @@ def processObject(obj, addVolsFlag) :
       # Create tessellated solid
       #
       #return(processObjectShape(obj, addVolsFlag))
-      print("Convert FreeCAD shape to Tessellated")
+      GDMLShared.debug("Convert FreeCAD shape to Tessellated")
       return(processObjectShape(obj))
       break
 
+#########################################################
+# Document walk                                         #
+# Volumes are placed in the world volume with the       #
+# placement composed through their App::Part parents.   #
+# An App::Link places the volumes of the linked part    #
+# again, once per element of a link array               #
+#########################################################
+
+groupTypes = ('App::DocumentObjectGroup', 'App::DocumentObjectGroupPython')
+containerTypes = groupTypes + ('App::Part', 'App::Link')
+
+def isLinkCell(part) :
+    # Hidden cell of a replicated volume, only placed by its links
+    return not part.Visibility and \
+           any(obj.TypeId == 'App::Link' for obj in part.InList)
+
+def isComponent(obj) :
+    # Base, tool etc. of another feature, exported as part of it
+    return any(parent.TypeId not in containerTypes for parent in obj.InList)
+
+def exportObjects(objs, placement) :
+    # placement of the document or part holding objs
+    for obj in objs :
+        if obj.TypeId == 'App::Part' :
+           if not isLinkCell(obj) :
+              exportObjects(obj.Group, placement.multiply(obj.Placement))
+        elif obj.TypeId == 'App::Link' :
+           exportLink(obj, placement)
+        elif obj.TypeId in groupTypes :
+           if obj.TypeId == 'App::DocumentObjectGroupPython' :
+              processObject(obj, True)
+           exportObjects(obj.Group, placement)
+        elif not hasattr(obj, 'Placement') :
+           processObject(obj, True)
+        elif not isComponent(obj) :
+           exportVolume(obj, placement.multiply(obj.Placement))
+
+def exportLink(link, placement) :
+    # The link's placement replaces that of the linked object
+    target = link.LinkedObject
+    if target is None :
+       return
+    frame = placement.multiply(link.Placement)
+    frames = [frame]
+    if link.ElementCount > 0 :
+       frames = [frame.multiply(p) for p in link.PlacementList]
+    for frame in frames :
+        if target.TypeId == 'App::Part' :
+           exportObjects(target.Group, frame)
+        else :
+           exportVolume(target, frame)
+
+def exportVolume(obj, placement) :
+    # placement of obj in the world, once its volume is defined further
+    # placements only add a physvol
+    global exportPlacement
+    volume = exportedVolumes.get(obj.Name)
+    if volume is not None :
+       pvName, adjust = volume
+       createPV(obj.Name, pvName, placement.multiply(adjust))
+       return
+    exportPlacement = placement
+    processObject(obj, True)
+
 def export(exportList,filename) :
     "called when FreeCAD exports a file"
    
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
+    GDMLShared.setVerbose(params.GetBool('printVerbose',False))
+
     # process Objects
-    print("\nStart GDML Export 0.1")
+    GDMLShared.info("Start GDML Export 0.1")
     GDMLstructure()
     #defineMaterials()
-    #constructWorld()
+    # World volume is G4_Galactic, defined from the NIST database
+    constructWorld()
     bbox = FreeCAD.BoundBox()
     defineWorldBox(exportList, bbox)
     #for obj in exportList :
     zOrder = 1
-    for obj in FreeCAD.ActiveDocument.Objects:
-        #reportObject(obj)
-        processObject(obj, True)
+    exportObjects(FreeCAD.ActiveDocument.RootObjects, FreeCAD.Placement())
 
     # Now append World Volume definition to stucture
     # as it will contain references to volumes that need defining
     # before it
     structure.append(worldVOL)
+    addNistMaterials()
 
     #ET.ElementTree(gdml).write("test9e", 'utf-8', True)
 
     # format & write GDML file 
     indent(gdml)
-    print("Write to GDML file")
+    GDMLShared.debug("Write to GDML file")
     #ET.ElementTree(gdml).write(filename, 'utf-8', True)
     ET.ElementTree(gdml).write(filename)
-    print("GDML file written")
+    GDMLShared.info("GDML file written")
@@ -28,8 +28,8 @@ __author__ = "Keith Sloan <keith@sloan-home.co.uk>"
 __url__ = ["https://github.com/KeithSloan/FreeCAD_GDML"]
 
 import FreeCAD 
-import os, io, sys, re
-import Part, Draft
+import os, io, sys, re, collections, threading
+import Part
 
 from math import *
 import GDMLShared
@@ -44,7 +44,7 @@ if FreeCAD.GuiUp:
     import PartGui, FreeCADGui
     gui = True
 else:
-    if printverbose: print("FreeCAD Gui not present.")
+    GDMLShared.debug("FreeCAD Gui not present.")
     gui = False
 
 import Part
@@ -101,28 +101,39 @@ def translate(shape,base) :
     myPlacement = FreeCAD.Placement()
     myPlacement.move(base)
     mat1 = myPlacement.toMatrix()
-    print(mat1)
+    GDMLShared.debug("%s", mat1)
     mat2 = shape.Matrix
     mat  = mat1.multiply(mat2)
-    print(mat)
+    GDMLShared.debug("%s", mat)
     retShape = shape.copy()
     retShape.transformShape(mat, True)
     return retShape
 
 def checkConstant(vval):
-    print (vval)
+    GDMLShared.debug("%s", vval)
 
 def getName(ptr) :
     return (ptr.attrib.get('name'))
 
 def getText(ptr,var,default) :
-    if var in ptr :
-       return (ptr.attrib.get(var))
-    else :
-       return default
+    return ptr.get(var, default)
+
+# View providers & display modes only exist with the GUI, without it
+# ( FreeCADCmd ) these do nothing
+def setViewProvider(obj) :
+    if gui :
+       from GDMLObjects import ViewProvider
+       ViewProvider(obj.ViewObject)
+
+def setViewProviderExtension(obj) :
+    if gui :
+       from GDMLObjects import ViewProviderExtension
+       ViewProviderExtension(obj.ViewObject)
 
 def setDisplayMode(obj,mode):
-    GDMLShared.trace("setDisplayMode : "+str(mode))
+    GDMLShared.debug("setDisplayMode : %s", mode)
+    if not gui :
+       return
     if mode == 2 :
        obj.ViewObject.DisplayMode = 'Hide'
 
@@ -131,152 +142,139 @@ def setDisplayMode(obj,mode):
 
 def createBox(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLBox, ViewProvider
-    GDMLShared.trace("CreateBox : ")
-    GDMLShared.trace(solid.attrib)
+    GDMLShared.debug("CreateBox : ")
+    GDMLShared.debug("%s", solid.attrib)
     #mycube=FreeCAD.ActiveDocument.addObject("Part::FeaturePython","GDMLBox")
     #mycube=volObj.newObject("Part::FeaturePython","GDMLBox:"+getName(solid))
     mycube=part.newObject("Part::FeaturePython","GDMLBox:"+getName(solid))
-    x = GDMLShared.getVal(solid,'x')
-    y = GDMLShared.getVal(solid,'y')
-    z = GDMLShared.getVal(solid,'z')
-    lunit = getText(solid,'lunit',"mm")
-    GDMLBox(mycube,x,y,z,lunit,material)
-    GDMLShared.trace("Logical Position : "+str(px)+','+str(py)+','+str(pz))
+    # Lengths normalised to mm
+    x, y, z = GDMLShared.getVals(solid, ['x','y','z'], \
+                                 GDMLShared.lengthFactor(solid))
+    GDMLBox(mycube,x,y,z,"mm",material)
+    GDMLShared.debug("Logical Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mycube.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mycube.Placement.Rotation)
+    GDMLShared.debug("%s", mycube.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(mycube.ViewObject)
+    setViewProvider(mycube)
     setDisplayMode(mycube,displayMode)
     #myCube.Shape = translate(mycube.Shape,base)
     return mycube
 
 def createCone(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLCone, ViewProvider
-    GDMLShared.trace("CreateCone : ")
-    GDMLShared.trace(solid.attrib)
-    rmin1 = GDMLShared.getVal(solid,'rmin1')
-    rmax1 = GDMLShared.getVal(solid,'rmax1')
-    rmin2 = GDMLShared.getVal(solid,'rmin2')
-    rmax2 = GDMLShared.getVal(solid,'rmax2')
-    z = GDMLShared.getVal(solid,'z')
-    startphi = GDMLShared.getVal(solid,'startphi')
-    deltaphi = GDMLShared.getVal(solid,'deltaphi')
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateCone : ")
+    GDMLShared.debug("%s", solid.attrib)
+    # Lengths normalised to mm, angles to rad
+    rmin1, rmax1, rmin2, rmax2, z = GDMLShared.getVals(solid, \
+             ['rmin1','rmax1','rmin2','rmax2','z'], \
+             GDMLShared.lengthFactor(solid))
+    startphi, deltaphi = GDMLShared.getVals(solid, \
+             ['startphi','deltaphi'], GDMLShared.angleFactor(solid))
     #mycone=volObj.newObject("Part::FeaturePython","GDMLCone:"+getName(solid))
     mycone=part.newObject("Part::FeaturePython","GDMLCone:"+getName(solid))
     GDMLCone(mycone,rmin1,rmax1,rmin2,rmax2,z, \
-             startphi,deltaphi,aunit,lunit,material)
-    GDMLShared.trace("CreateCone : ")
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+             startphi,deltaphi,"rad","mm",material)
+    GDMLShared.debug("CreateCone : ")
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mycone.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mycone.Placement.Rotation)
+    GDMLShared.debug("%s", mycone.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(mycone.ViewObject)
+    setViewProvider(mycone)
     setDisplayMode(mycone,displayMode)
     return(mycone)
 
 def createElcone(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLElCone, ViewProvider
-    GDMLShared.trace("CreateElCone : ")
+    GDMLShared.debug("CreateElCone : ")
+    # dx, dy are semi axes / height so have no unit
     dx = GDMLShared.getVal(solid,'dx')
     dy = GDMLShared.getVal(solid,'dy')
-    zmax = GDMLShared.getVal(solid,'zmax')
-    zcut = GDMLShared.getVal(solid,'zcut')
-    lunit = getText(solid,'lunit',"mm")
+    zmax, zcut = GDMLShared.getVals(solid, ['zmax','zcut'], \
+                                    GDMLShared.lengthFactor(solid))
     #myelcone=volObj.newObject("Part::FeaturePython","GDMLElCone:"+getName(solid))
     myelcone=part.newObject("Part::FeaturePython","GDMLElCone:"+getName(solid))
-    GDMLElCone(myelcone,dx,dy,zmax,zcut,lunit,material)
-    GDMLShared.trace("CreateElCone : ")
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLElCone(myelcone,dx,dy,zmax,zcut,"mm",material)
+    GDMLShared.debug("CreateElCone : ")
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     #base = FreeCAD.Vector(px,py,pz-zmax/2)
     base = FreeCAD.Vector(0,0,0)
     myelcone.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(myelcone.Placement.Rotation)
+    GDMLShared.debug("%s", myelcone.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(myelcone.ViewObject)
+    setViewProvider(myelcone)
     setDisplayMode(myelcone,displayMode)
     return(myelcone)
 
 def createEllipsoid(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLEllipsoid, ViewProvider
-    GDMLShared.trace("CreateElTube : ")
-    GDMLShared.trace(solid.attrib)
-    ax = GDMLShared.getVal(solid,'ax')
-    by = GDMLShared.getVal(solid,'by')
-    cz = GDMLShared.getVal(solid,'cz')
-    zcut1 = GDMLShared.getVal(solid,'zcut1')
-    zcut2 = GDMLShared.getVal(solid,'zcut2')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateElTube : ")
+    GDMLShared.debug("%s", solid.attrib)
+    ax, by, cz, zcut1, zcut2 = GDMLShared.getVals(solid, \
+             ['ax','by','cz','zcut1','zcut2'], GDMLShared.lengthFactor(solid))
     #myelli=volObj.newObject("Part::FeaturePython","GDMLEllipsoid:"+getName(solid))
     myelli=part.newObject("Part::FeaturePython","GDMLEllipsoid:"+getName(solid))
     # cuts 0 for now
-    GDMLEllipsoid(myelli,ax, by, cz,zcut1,zcut2,lunit,material)
-    GDMLShared.trace("CreateEllipsoid : ")
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLEllipsoid(myelli,ax, by, cz,zcut1,zcut2,"mm",material)
+    GDMLShared.debug("CreateEllipsoid : ")
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(px,py,pz)
     myelli.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(myelli.Placement.Rotation)
+    GDMLShared.debug("%s", myelli.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(myelli.ViewObject)
+    setViewProvider(myelli)
     setDisplayMode(myelli,displayMode)
     return myelli
 
 def createEltube(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLElTube, ViewProvider
-    GDMLShared.trace("CreateElTube : ")
-    GDMLShared.trace(solid.attrib)
-    dx = GDMLShared.getVal(solid,'dx')
-    dy = GDMLShared.getVal(solid,'dy')
-    dz = GDMLShared.getVal(solid,'dz')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateElTube : ")
+    GDMLShared.debug("%s", solid.attrib)
+    dx, dy, dz = GDMLShared.getVals(solid, ['dx','dy','dz'], \
+                                    GDMLShared.lengthFactor(solid))
     #myeltube=volObj.newObject("Part::FeaturePython","GDMLElTube:"+getName(solid))
     myeltube=part.newObject("Part::FeaturePython","GDMLElTube:"+getName(solid))
-    GDMLElTube(myeltube,dx, dy, dz,lunit,material)
-    GDMLShared.trace("CreateElTube : ")
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLElTube(myeltube,dx, dy, dz,"mm",material)
+    GDMLShared.debug("CreateElTube : ")
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     myeltube.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(myeltube.Placement.Rotation)
+    GDMLShared.debug("%s", myeltube.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(myeltube.ViewObject)
+    setViewProvider(myeltube)
     setDisplayMode(myeltube,displayMode)
     return myeltube
 
 def createPolycone(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLPolycone, GDMLzplane, \
             ViewProvider, ViewProviderExtension
-    GDMLShared.trace("Create Polycone : ")
-    GDMLShared.trace(solid.attrib)
-    startphi = GDMLShared.getVal(solid,'startphi')
-    deltaphi = GDMLShared.getVal(solid,'deltaphi')
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("Create Polycone : ")
+    GDMLShared.debug("%s", solid.attrib)
+    startphi, deltaphi = GDMLShared.getVals(solid, \
+             ['startphi','deltaphi'], GDMLShared.angleFactor(solid))
+    lf = GDMLShared.lengthFactor(solid)
     #mypolycone=volObj.newObject("Part::FeaturePython","GDMLPolycone:"+getName(solid))
     mypolycone=part.newObject("Part::FeaturePython","GDMLPolycone:"+getName(solid))
     mypolycone.addExtension("App::OriginGroupExtensionPython", None)
-    GDMLPolycone(mypolycone,startphi,deltaphi,aunit,lunit,material)
-    ViewProviderExtension(mypolycone.ViewObject)
+    GDMLPolycone(mypolycone,startphi,deltaphi,"rad","mm",material)
+    setViewProviderExtension(mypolycone)
 
     #mypolycone.ViewObject.DisplayMode = "Shaded"
-    GDMLShared.trace(solid.findall('zplane'))
     for zplane in solid.findall('zplane') : 
-        GDMLShared.trace(zplane)
-        rmin = GDMLShared.getVal(zplane,'rmin')
-        rmax = GDMLShared.getVal(zplane,'rmax')
-        z = GDMLShared.getVal(zplane,'z')
+        GDMLShared.debug("%s", zplane)
+        # zplanes are in the lunit of the polycone
+        rmin, rmax, z = GDMLShared.getVals(zplane, ['rmin','rmax','z'], lf)
         myzplane=FreeCAD.ActiveDocument.addObject('App::FeaturePython','zplane') 
         mypolycone.addObject(myzplane)
         #myzplane=mypolycone.newObject('App::FeaturePython','zplane') 
         GDMLzplane(myzplane,rmin,rmax,z)
-        ViewProvider(myzplane)
+        setViewProvider(myzplane)
 
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mypolycone.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mypolycone.Placement.Rotation)
+    GDMLShared.debug("%s", mypolycone.Placement.Rotation)
     # set ViewProvider before setDisplay
     setDisplayMode(mypolycone,displayMode)
     return mypolycone
@@ -284,235 +282,226 @@ def createPolycone(part,solid,material,px,py,pz,rot,displayMode) :
 def createPolyhedra(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLPolyhedra, GDMLzplane, \
             ViewProvider, ViewProviderExtension
-    GDMLShared.trace("Create Polyhedra : ")
-    GDMLShared.trace(solid.attrib)
-    startphi = GDMLShared.getVal(solid,'startphi')
-    deltaphi = GDMLShared.getVal(solid,'deltaphi')
+    GDMLShared.debug("Create Polyhedra : ")
+    GDMLShared.debug("%s", solid.attrib)
+    startphi, deltaphi = GDMLShared.getVals(solid, \
+             ['startphi','deltaphi'], GDMLShared.angleFactor(solid))
     numsides = GDMLShared.getVal(solid,'numsides',2)
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
+    lf = GDMLShared.lengthFactor(solid)
     #mypolyhedra=volObj.newObject("Part::FeaturePython","GDMLPolyhedra:"+ \
     mypolyhedra=part.newObject("Part::FeaturePython","GDMLPolyhedra:"+ \
                 getName(solid))
     mypolyhedra.addExtension("App::OriginGroupExtensionPython", None)
-    GDMLPolyhedra(mypolyhedra,startphi,deltaphi,numsides,aunit,lunit,material)
-    ViewProviderExtension(mypolyhedra.ViewObject)
+    GDMLPolyhedra(mypolyhedra,startphi,deltaphi,numsides,"rad","mm",material)
+    setViewProviderExtension(mypolyhedra)
 
     #mypolyhedra.ViewObject.DisplayMode = "Shaded"
-    GDMLShared.trace(solid.findall('zplane'))
     for zplane in solid.findall('zplane') : 
-        GDMLShared.trace(zplane)
-        rmin = GDMLShared.getVal(zplane,'rmin')
-        rmax = GDMLShared.getVal(zplane,'rmax')
-        z = GDMLShared.getVal(zplane,'z')
+        GDMLShared.debug("%s", zplane)
+        rmin, rmax, z = GDMLShared.getVals(zplane, ['rmin','rmax','z'], lf)
         myzplane=FreeCAD.ActiveDocument.addObject('App::FeaturePython','zplane') 
         mypolyhedra.addObject(myzplane)
         #myzplane=mypolyhedra.newObject('App::FeaturePython','zplane') 
         GDMLzplane(myzplane,rmin,rmax,z)
-        ViewProvider(myzplane)
+        setViewProvider(myzplane)
 
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mypolyhedra.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mypolyhedra.Placement.Rotation)
+    GDMLShared.debug("%s", mypolyhedra.Placement.Rotation)
     # set ViewProvider before setDisplay
     setDisplayMode(mypolyhedra,displayMode)
     return mypolyhedra
 
 def createSphere(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLSphere, ViewProvider
-    GDMLShared.trace("CreateSphere : ")
-    GDMLShared.trace(solid.attrib)
-    rmin = GDMLShared.getVal(solid,'rmin')
-    rmax = GDMLShared.getVal(solid,'rmax')
-    startphi = GDMLShared.getVal(solid,'startphi')
-    deltaphi = GDMLShared.getVal(solid,'deltaphi')
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateSphere : ")
+    GDMLShared.debug("%s", solid.attrib)
+    rmin, rmax = GDMLShared.getVals(solid, ['rmin','rmax'], \
+                                    GDMLShared.lengthFactor(solid))
+    startphi, deltaphi = GDMLShared.getVals(solid, \
+             ['startphi','deltaphi'], GDMLShared.angleFactor(solid))
     #mysphere=volObj.newObject("Part::FeaturePython","GDMLSphere:"+getName(solid))
     mysphere=part.newObject("Part::FeaturePython","GDMLSphere:"+getName(solid))
-    GDMLSphere(mysphere,rmin,rmax,startphi,deltaphi,0,3.00,aunit, \
-               lunit,material)
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLSphere(mysphere,rmin,rmax,startphi,deltaphi,0,3.00,"rad", \
+               "mm",material)
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mysphere.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mysphere.Placement.Rotation)
+    GDMLShared.debug("%s", mysphere.Placement.Rotation)
     # set ViewProvider before setDisplay
     setDisplayMode(mysphere,displayMode)
-    ViewProvider(mysphere.ViewObject)
+    setViewProvider(mysphere)
     return mysphere
 
 def createTrap(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLTrap, ViewProvider
-    GDMLShared.trace("CreateTrap : ")
-    GDMLShared.trace(solid.attrib)
-    z  = GDMLShared.getVal(solid,'z')
-    x1 = GDMLShared.getVal(solid,'x1')
-    x2 = GDMLShared.getVal(solid,'x2')
-    x3 = GDMLShared.getVal(solid,'x3')
-    x4 = GDMLShared.getVal(solid,'x4')
-    y1 = GDMLShared.getVal(solid,'y1')
-    y2 = GDMLShared.getVal(solid,'y2')
-    theta = GDMLShared.getVal(solid,'theta')
-    phi = GDMLShared.getVal(solid,'phi')
-    alpha = GDMLShared.getVal(solid,'alpah1')
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateTrap : ")
+    GDMLShared.debug("%s", solid.attrib)
+    z, x1, x2, x3, x4, y1, y2 = GDMLShared.getVals(solid, \
+             ['z','x1','x2','x3','x4','y1','y2'], GDMLShared.lengthFactor(solid))
+    theta, phi, alpha = GDMLShared.getVals(solid, \
+             ['theta','phi','alpha1'], GDMLShared.angleFactor(solid))
     #print z
     #mytrap=volObj.newObject("Part::FeaturePython","GDMLTrap:"+getName(solid))
     mytrap=part.newObject("Part::FeaturePython","GDMLTrap:"+getName(solid))
-    GDMLTrap(mytrap,z,theta,phi,x1,x2,x3,x4,y1,y2,alpha,aunit,lunit,material)
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLTrap(mytrap,z,theta,phi,x1,x2,x3,x4,y1,y2,alpha,"rad","mm",material)
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     mytrap.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mytrap.Placement.Rotation)
+    GDMLShared.debug("%s", mytrap.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(mytrap.ViewObject)
+    setViewProvider(mytrap)
     setDisplayMode(mytrap,displayMode)
     return mytrap
 
 def createTrd(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLTrd, ViewProvider
-    GDMLShared.trace("CreateTrd : ")
-    GDMLShared.trace(solid.attrib)
-    z  = GDMLShared.getVal(solid,'z')
-    x1 = GDMLShared.getVal(solid,'x1')
-    x2 = GDMLShared.getVal(solid,'x2')
-    y1 = GDMLShared.getVal(solid,'y1')
-    y2 = GDMLShared.getVal(solid,'y2')
-    lunit = getText(solid,'lunit',"mm")
+    GDMLShared.debug("CreateTrd : ")
+    GDMLShared.debug("%s", solid.attrib)
+    z, x1, x2, y1, y2 = GDMLShared.getVals(solid, \
+             ['z','x1','x2','y1','y2'], GDMLShared.lengthFactor(solid))
     #print z
     #mytrd=volObj.newObject("Part::FeaturePython","GDMLTrd:"+getName(solid))
     mytrd=part.newObject("Part::FeaturePython","GDMLTrd:"+getName(solid))
-    GDMLTrd(mytrd,z,x1,x2,y1,y2,lunit,material)
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLTrd(mytrd,z,x1,x2,y1,y2,"mm",material)
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     #base = FreeCAD.Vector(px,py,pz)
     base = FreeCAD.Vector(0,0,0)
     mytrd.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mytrd.Placement.Rotation)
+    GDMLShared.debug("%s", mytrd.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(mytrd.ViewObject)
+    setViewProvider(mytrd)
     setDisplayMode(mytrd,displayMode)
     return mytrd
 
 def createXtru(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLXtru, GDML2dVertex, GDMLSection, \
              ViewProvider, ViewProviderExtension
-    GDMLShared.trace("CreateXtru : ")
+    GDMLShared.debug("CreateXtru : ")
     #myXtru=volObj.newObject("Part::FeaturePython","GDMLXtru"+getName(solid))
-    print(solid)
-    print(getName(solid))
+    GDMLShared.debug("%s", solid)
+    GDMLShared.debug("%s", getName(solid))
     myXtru=part.newObject("Part::FeaturePython","GDMLXtru"+getName(solid))
     #myXtru.addExtension("App::OriginGroupExtensionPython", None)
-    lunit = getText(solid,'lunit',"mm")
-    GDMLXtru(myXtru,lunit,material)
-    ViewProviderExtension(myXtru.ViewObject)
-    for vert2d in solid.findall('twoDimVertex') : 
-        x = GDMLShared.getVal(vert2d,'x')
-        y = GDMLShared.getVal(vert2d,'y')
+    lf = GDMLShared.lengthFactor(solid)
+    GDMLXtru(myXtru,"mm",material)
+    setViewProviderExtension(myXtru)
+    # Polygon converted to mm as whole arrays
+    verts = solid.findall('twoDimVertex')
+    xs = GDMLShared.scaleValues([GDMLShared.getVal(v,'x') for v in verts], lf)
+    ys = GDMLShared.scaleValues([GDMLShared.getVal(v,'y') for v in verts], lf)
+    for x, y in zip(xs, ys) :
         my2dVert=FreeCAD.ActiveDocument.addObject('App::FeaturePython','GDML2DVertex') 
         #myzplane=mypolycone.newObject('App::FeaturePython','zplane') 
         GDML2dVertex(my2dVert,x,y)
         myXtru.addObject(my2dVert)
-        ViewProvider(my2dVert)
+        setViewProvider(my2dVert)
     for section in solid.findall('section') : 
         zOrder = GDMLShared.getVal(section,'zOrder',2)     # Get Int
-        zPosition = GDMLShared.getVal(section,'zPosition',2) # Get Int
-        xOffset = GDMLShared.getVal(section,'xOffset')
-        yOffset = GDMLShared.getVal(section,'yOffset')
+        zPosition, xOffset, yOffset = GDMLShared.getVals(section, \
+                            ['zPosition','xOffset','yOffset'], lf)
         scalingFactor = GDMLShared.getVal(section,'scalingFactor')
         mysection=FreeCAD.ActiveDocument.addObject('App::FeaturePython','GDMLSection')
         GDMLSection(mysection,zOrder,zPosition,xOffset,yOffset,scalingFactor)
         myXtru.addObject(mysection)
-        ViewProvider(mysection)
+        setViewProvider(mysection)
 
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     #base = FreeCAD.Vector(px,py,pz)
     myXtru.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(myXtru.Placement.Rotation)
+    GDMLShared.debug("%s", myXtru.Placement.Rotation)
     return(myXtru)
 
 def createTube(part,solid,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import GDMLTube, ViewProvider
-    GDMLShared.trace("CreateTube : ")
-    GDMLShared.trace(solid.attrib)
-    rmin = GDMLShared.getVal(solid,'rmin')
-    rmax = GDMLShared.getVal(solid,'rmax')
-    z = GDMLShared.getVal(solid,'z')
-    startphi = GDMLShared.getVal(solid,'startphi')
-    deltaphi = GDMLShared.getVal(solid,'deltaphi')
-    aunit = getText(solid,'aunit','rad')
-    lunit = getText(solid,'lunit',"mm")
-    GDMLShared.trace(rmin)
-    GDMLShared.trace(rmax)
-    GDMLShared.trace(z)
+    GDMLShared.debug("CreateTube : ")
+    GDMLShared.debug("%s", solid.attrib)
+    rmin, rmax, z = GDMLShared.getVals(solid, ['rmin','rmax','z'], \
+                                       GDMLShared.lengthFactor(solid))
+    startphi, deltaphi = GDMLShared.getVals(solid, \
+             ['startphi','deltaphi'], GDMLShared.angleFactor(solid))
+    GDMLShared.debug("%s", rmin)
+    GDMLShared.debug("%s", rmax)
+    GDMLShared.debug("%s", z)
     #mytube=volObj.newObject("Part::FeaturePython","GDMLTube:"+getName(solid))
     mytube=part.newObject("Part::FeaturePython","GDMLTube:"+getName(solid))
-    GDMLTube(mytube,rmin,rmax,z,startphi,deltaphi,aunit,lunit,material)
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+    GDMLTube(mytube,rmin,rmax,z,startphi,deltaphi,"rad","mm",material)
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     base = FreeCAD.Vector(0,0,0)
     #base = FreeCAD.Vector(px,py,pz)
     mytube.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(mytube.Placement.Rotation)
+    GDMLShared.debug("%s", mytube.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(mytube.ViewObject)
+    setViewProvider(mytube)
     setDisplayMode(mytube,displayMode)
     return mytube
 
 def createTessellated(part,solid,material,px,py,pz,rot,displayMode) :
-    from GDMLObjects import GDMLTessellated, GDMLTriangular, \
-            GDMLQuadrangular,  ViewProvider, ViewProviderExtension
-    GDMLShared.trace("CreateTessellated : ")
-    GDMLShared.trace(solid.attrib)
-    #myTess=volObj.newObject("Part::FeaturePython","GDMLTessellated:"+getName(solid))
-    myTess=part.newObject("Part::FeaturePython","GDMLTessellated:"+getName(solid))
-    #myTess.addExtension("App::OriginGroupExtensionPython", None)
-    GDMLTessellated(myTess,material)
-    ViewProviderExtension(myTess.ViewObject)
-    ViewProvider(myTess.ViewObject)
-    for elem in solid.getchildren() :
-        print(elem)
-        v1 = elem.attrib['vertex1']
-        v2 = elem.attrib['vertex2']
-        v3 = elem.attrib['vertex3']
-        vType = elem.attrib['type']
+    from GDMLObjects import GDMLTessellated, ViewProvider, \
+            ViewProviderExtension
+    GDMLShared.debug("CreateTessellated : ")
+    GDMLShared.debug("%s", solid.attrib)
+    # Build vertex table & flat facet index table in one pass,
+    # each position define is evaluated once
+    vertices = []
+    vertexIndex = {}
+    facets = []
+    def index(name) :
+        i = vertexIndex.get(name)
+        if i is None :
+           i = vertexIndex[name] = len(vertices)
+           vertices.append(GDMLShared.getVertex(name))
+        return i
+    for elem in solid :
         if elem.tag == 'triangular' :
-           myTri = FreeCAD.ActiveDocument.addObject('App::FeaturePython','GDMLTriangle')
-           GDMLTriangular(myTri,v1,v2,v3,vType) 
-           myTess.addObject(myTri)
-           ViewProvider(myTri)
-        
-        if elem.tag == 'quadrangular' :
-           v4 = elem.attrib['vertex4']
-           myQuad = FreeCAD.ActiveDocument.addObject('App::FeaturePython','GDMLQuadrangular')
-           GDMLQuadrangular(myQuad,v1,v2,v3,v4,vType) 
-           myTess.addObject(myQuad)
-           ViewProvider(myQuad)
-
-    GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+           names = [elem.get('vertex1'),elem.get('vertex2'), \
+                    elem.get('vertex3')]
+        elif elem.tag == 'quadrangular' :
+           names = [elem.get('vertex1'),elem.get('vertex2'), \
+                    elem.get('vertex3'),elem.get('vertex4')]
+        else :
+           continue
+        if elem.get('type','ABSOLUTE').upper() == 'RELATIVE' :
+           # Following vertices are relative to the first
+           first = index(names[0])
+           idx = [first]
+           for n in names[1:] :
+               idx.append(len(vertices))
+               vertices.append(vertices[first] + GDMLShared.getVertex(n))
+        else :
+           idx = [index(n) for n in names]
+        if len(idx) == 3 :
+           idx.append(-1)
+        facets.extend(idx)
+
+    myTess=part.newObject("Part::FeaturePython","GDMLTessellated:"+getName(solid))
+    GDMLTessellated(myTess,material,vertices,facets)
+    setViewProviderExtension(myTess)
+    GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
     #base = FreeCAD.Vector(px,py,pz)
     base = FreeCAD.Vector(0,0,0)
     myTess.Placement = GDMLShared.processPlacement(base,rot)
-    GDMLShared.trace(myTess.Placement.Rotation)
+    GDMLShared.debug("%s", myTess.Placement.Rotation)
     # set ViewProvider before setDisplay
-    ViewProvider(myTess.ViewObject)
+    setViewProvider(myTess)
     setDisplayMode(myTess,displayMode)
     return myTess
 
 def parseBoolean(part,solid,objType,material,px,py,pz,rot,displayMode) :
     from GDMLObjects import ViewProvider
-    GDMLShared.trace(solid.tag)
-    GDMLShared.trace(solid.attrib)
+    GDMLShared.debug("%s", solid.tag)
+    GDMLShared.debug("%s", solid.attrib)
     if solid.tag in ["subtraction","union","intersection"] :
-       GDMLShared.trace("Boolean : "+solid.tag)
+       GDMLShared.debug("Boolean : %s", solid.tag)
        name1st = GDMLShared.getRef(solid,'first')
-       base = solids.find("*[@name='%s']" % name1st )
-       GDMLShared.trace("first : "+name1st)
+       base = getSolid(name1st)
+       GDMLShared.debug("first : %s", name1st)
        #parseObject(root,base)
        name2nd = GDMLShared.getRef(solid,'second')
-       tool = solids.find("*[@name='%s']" % name2nd )
-       GDMLShared.trace("second : "+name2nd)
+       tool = getSolid(name2nd)
+       GDMLShared.debug("second : %s", name2nd)
        #parseObject(root,tool)
        #mybool = volObj.newObject(objType,solid.tag+':'+getName(solid))
        mybool = part.newObject(objType,solid.tag+':'+getName(solid))
@@ -523,7 +512,7 @@ def parseBoolean(part,solid,objType,material,px,py,pz,rot,displayMode) :
        mybool.Tool = createSolid(part,tool,material,0,0,0,None,displayMode)
        mybool.Tool.Placement= GDMLShared.getPlacementFromRefs(solid) 
        # Okay deal with position of boolean
-       GDMLShared.trace("Position : "+str(px)+','+str(py)+','+str(pz))
+       GDMLShared.debug("Position : %s,%s,%s", px, py, pz)
        base = FreeCAD.Vector(0,0,0)
        #base = FreeCAD.Vector(px,py,pz)
        mybool.Placement = GDMLShared.processPlacement(base,rot)
@@ -531,11 +520,14 @@ def parseBoolean(part,solid,objType,material,px,py,pz,rot,displayMode) :
        #print("Bool Shape : "+str(mybool.Shape.isValid()))
        #print("Bool Base  : "+str(mybool.Base.Shape.isValid()))
        #print("Bool Tool  : "+str(mybool.Tool.Shape.isValid()))
-       print(dir(mybool.Shape))
+       if GDMLShared.logLevel <= GDMLShared.DEBUG :
+          GDMLShared.debug("%s", dir(mybool.Shape))
        return mybool
 
 def createSolid(part,solid,material,px,py,pz,rot,displayMode) :
-    GDMLShared.trace(solid.tag)
+    GDMLShared.debug("%s", solid.tag)
+    if importProgress is not None :
+       importProgress.solid(solid.tag)
     while switch(solid.tag) :
         if case('box'):
            return(createBox(part,solid,material,px,py,pz,rot,displayMode)) 
@@ -608,101 +600,1380 @@ def createSolid(part,solid,material,px,py,pz,rot,displayMode) :
                   material,px,py,pz,rot,displayMode)) 
             break
 
-        GDMLShared.trace("Solid : "+solid.tag+" Not yet supported")
+        GDMLShared.debug("Solid : %s Not yet supported", solid.tag)
         break
 
+def getSolid(name) :
+    # Any solid type by name, pre evaluated record if available
+    solid = evaluatedSolids.get(name)
+    if solid is None :
+       solid = solidsIndex.get(('*', name))
+    return solid
+
+def getStructure(tag, name) :
+    # tag volume or assembly
+    return structureIndex.get((tag, name))
+
 def getVolSolid(name):
-    GDMLShared.trace("Get Volume Solid")
-    vol = structure.find("/volume[@name='%s']" % name )
-    sr = vol.find("solidref")
-    GDMLShared.trace(sr.attrib)
-    name = GDMLShared.getRef(sr)
-    solid = solids.find("*[@name='%s']" % name )
+    GDMLShared.debug("Get Volume Solid")
+    vol = getStructure('volume', name)
+    name = GDMLShared.getRef(vol,"solidref")
+    solid = getSolid(name)
     return solid
 
 def parsePhysVol(parent,physVol,displayMode):
-    GDMLShared.trace("ParsePhyVol")
+    GDMLShared.debug("ParsePhyVol")
+    px, py, pz, rot = getPhysVolPosRot(physVol)
+
+    fileElem = physVol.find("file")
+    if fileElem is not None :
+       parseFileVolume(parent,fileElem,px,py,pz,rot,displayMode)
+       return
+    volref = GDMLShared.getRef(physVol,"volumeref")
+    GDMLShared.debug("Volume ref : %s", volref)
+    global volumeDepth, volumePlacement, prunedCount
+    if importFilter.skip(volref, volumeDepth + 1) :
+       if importFilter.truncated(volumeDepth + 1) :
+          prunedCount += 1
+       return
+    placement = GDMLShared.processPlacement(FreeCAD.Vector(px,py,pz),rot)
+    globalPlacement = volumePlacement
+    if importFilter.region is not None :
+       globalPlacement = volumePlacement.multiply(placement)
+       if outsideRegion(volref, globalPlacement) :
+          prunedCount += 1
+          return
+    # Has the volume already been parsed i.e in Assembly etc
+    obj = volDict.get(volref)
+    if obj is not None :
+       linkVolume(parent,obj,volref,px,py,pz,rot)
+       return
+    part = addVolumePart(parent,volref)
+    part.Placement = placement
+    parentPlacement = volumePlacement
+    volumeDepth += 1
+    volumePlacement = globalPlacement
+    try :
+       parseVolume(part,volref,0,0,0,None,displayMode)
+    finally :
+       volumeDepth -= 1
+       volumePlacement = parentPlacement
+
+# ParseVolume name - structure is global
+# We get passed position and rotation
+# displayMode 1 normal 2 hide 3 wireframe
+def parseVolume(parent,name,px,py,pz,rot,displayMode) :
+    try :
+       return buildVolume(parent,name,px,py,pz,rot,displayMode)
+    except ImportCancelled :
+       abandonPart(parent)
+       raise
+
+def abandonPart(part) :
+    # Part cut short by cancelling the import, removed if nothing was
+    # built in it otherwise labelled as incomplete
+    if len(part.Group) == 0 :
+       volumeParts.pop(part.Name, None)
+       part.Document.removeObject(part.Name)
+    else :
+       part.Label = part.Label + ' (incomplete)'
+
+def buildVolume(parent,name,px,py,pz,rot,displayMode) :
+    global volDict
+
+    GDMLShared.debug("ParseVolume : %s", name)
+    if importProgress is not None :
+       importProgress.volume(name)
+    pruned = prunedCount
+    vol = getStructure('volume', name)
+    if vol != None : # If not volume test for assembly
+       solidref = GDMLShared.getRef(vol,"solidref")
+       if solidref != None :
+          solid  = getSolid(solidref)
+          GDMLShared.debug("%s", solid.tag)
+          # Material is the materialref value
+          # need to add default
+          material = GDMLShared.getRef(vol,"materialref")
+          if importFilter.buildSolid(name, material) :
+             createSolid(parent,solid,material,px,py,pz,rot,displayMode)
+       # Volume may or maynot contain physvol's
+       displayMode = 1
+       for pv in volumeDaughters(vol) :
+           # create solids at pos & rot in physvols
+           if pv.tag == 'physvol' :
+              parsePhysVol(parent,pv,displayMode)
+           elif pv.tag in replicaTags :
+              parseReplicated(parent,pv,vol,displayMode)
+
+    else :
+       asm = getStructure('assembly', name)
+       GDMLShared.debug("Assembly : %s", name)
+       if asm != None :
+          for pv in volumeDaughters(asm) :
+              # create solids at pos & rot in physvols
+              if pv.tag == 'physvol' :
+                 parsePhysVol(parent,pv,displayMode)
+       else :
+          GDMLShared.warning("Not Volume or Assembly") 
+          return
+    # Add parsed Volume to dict, further placements link to its part
+    # unless daughters were pruned by the region at this placement
+    if pruned == prunedCount :
+       volDict[name] = parent
+    return parent
+
+# App::Part object name -> volume name, per file context
+global volumeParts
+volumeParts = {}
+
+def addVolumePart(parent,name) :
+    # App::Part for a placement of volume name, remembered so an
+    # update from file finds the parts of a volume
+    part = parent.newObject("App::Part",name)
+    volumeParts[part.Name] = name
+    return part
+
+def linkVolume(parent,part,name,px,py,pz,rot) :
+    # Further placements of a volume are App::Link to the part of the
+    # first placement, so share its shapes and scene graph
+    link = parent.newObject("App::Link",name)
+    link.setLink(part)
+    link.Placement = GDMLShared.processPlacement(FreeCAD.Vector(px,py,pz),rot)
+    return link
+
+##########################################################
+# Loops                                                  #
+# <loop for= from= to= step=> in solids, structure and   #
+# volumes is expanded into GDMLRecords straight from the #
+# body, no expanded tree is written. Attributes using a  #
+# loop variable are evaluated for the whole range at     #
+# once, name[i] becomes name_<i-1> as in Geant4          #
+##########################################################
+
+bracketPattern = re.compile(r'\[([^\]]*)\]')
+
+def expandLoop(loop, bindings=None) :
+    # Records of the loop body, iteration by iteration
+    # bindings values of the variables of enclosing loops
+    if bindings is None :
+       bindings = {}
+    var = loop.get('for')
+    values = GDMLShared.loopValues(loop, bindings)
+    body = [loopRecords(child, bindings, var, values) for child in loop \
+            if isinstance(child.tag, str)]
+    return [r for i in range(len(values)) for records in body \
+            for r in records[i]]
+
+def loopColumn(value, bindings, var, values) :
+    # Attribute value per iteration, None if it does not change
+    names = set(bindings)
+    names.add(var)
+    try :
+       if len(GDMLShared.exprNames(value) & names) == 0 :
+          return None
+    except SyntaxError :
+       return None
+    return GDMLShared.evalRange(value, bindings, var, values).tolist()
+
+def bracketNames(value, bindings, var, values) :
+    # name[i] -> name_<i-1>, name[i,j] -> name_<i-1>_<j-1> per iteration
+    parts = bracketPattern.split(value)
+    columns = []
+    for n, part in enumerate(parts) :
+        if n % 2 == 0 :
+           columns.append([part] * len(values))
+           continue
+        indices = [GDMLShared.evalRange(e, bindings, var, values) \
+                   for e in part.split(',')]
+        columns.append(['_' + '_'.join(str(int(round(c[i]))-1) \
+                        for c in indices) for i in range(len(values))])
+    return [''.join(c[i] for c in columns) for i in range(len(values))]
+
+def loopRecords(elem, bindings, var, values) :
+    # For each of values of var the list of records elem expands to
+    if elem.tag == 'loop' :
+       records = []
+       for v in values :
+           inner = dict(bindings)
+           inner[var] = float(v)
+           records.append(expandLoop(elem, inner))
+       return records
+    attribs = [{} for v in values]
+    for key, value in elem.attrib.items() :
+        column = None
+        if key not in textAttribs :
+           column = loopColumn(value, bindings, var, values)
+        elif '[' in value :
+           column = bracketNames(value, bindings, var, values)
+        for i, attrib in enumerate(attribs) :
+            attrib[key] = value if column is None else column[i]
+    children = [loopRecords(c, bindings, var, values) for c in elem \
+                if isinstance(c.tag, str)]
+    return [[GDMLRecord(elem.tag, attrib, elem.text, \
+                        [r for c in children for r in c[i]])] \
+            for i, attrib in enumerate(attribs)]
+
+def indexLoops(index, section) :
+    # Add what the loops of a section generate to its name index,
+    # defines have to be resolved first
+    if section is None :
+       return
+    for loop in section.findall('loop') :
+        for elem in expandLoop(loop) :
+            name = elem.get('name')
+            if name is not None :
+               index.setdefault((elem.tag, name), elem)
+               index.setdefault(('*', name), elem)
+
+def volumeDaughters(vol) :
+    # Children of a volume or assembly with loops expanded
+    daughters = []
+    for elem in vol :
+        if elem.tag == 'loop' :
+           daughters += expandLoop(elem)
+        else :
+           daughters.append(elem)
+    return daughters
+
+##########################################################
+# Replicated volumes                                     #
+# replicavol, divisionvol and paramvol place copies of   #
+# one volume. The volume is built once in a hidden part  #
+# and the copies are one App::Link array of it, the      #
+# placements of the array are generated with numpy       #
+##########################################################
+
+replicaTags = ('replicavol', 'divisionvol', 'paramvol')
+daughterTags = ('physvol',) + replicaTags
+
+# replicate_along_axis direction & divisionvol axis, 3 rho 4 phi
+axisIndex = {'x' : 0, 'y' : 1, 'z' : 2, 'rho' : 3, 'phi' : 4, \
+             'kXAxis' : 0, 'kYAxis' : 1, 'kZAxis' : 2, 'kRho' : 3, \
+             'kPhi' : 4}
+
+# paramvol dimensions -> solid attributes
+dimensionAttribs = { \
+    'box_dimensions' : {'x' : 'x', 'y' : 'y', 'z' : 'z'}, \
+    'tube_dimensions' : {'InR' : 'rmin', 'OutR' : 'rmax', 'hz' : 'z', \
+                         'StartPhi' : 'startphi', 'DeltaPhi' : 'deltaphi'}}
+
+def axisPlacements(axis, values) :
+    # values numpy array, lengths along x, y, z or angles about z
+    import numpy
+    if axis < 3 :
+       bases = numpy.zeros((len(values), 3))
+       bases[:, axis] = values
+       return [FreeCAD.Placement(FreeCAD.Vector(*b), FreeCAD.Rotation()) \
+               for b in bases]
+    zAxis = FreeCAD.Vector(0,0,1)
+    return [FreeCAD.Placement(FreeCAD.Vector(), FreeCAD.Rotation(zAxis, a)) \
+            for a in numpy.degrees(values)]
+
+def replicaPlacements(elem) :
+    # Geant4 replica, copies centred on the mother along x, y, z or
+    # rotated about z by offset + ( i + 0.5 ) width for phi, the offset
+    # only applies to phi as in G4ReplicaNavigation
+    import numpy
+    number = GDMLShared.getVal(elem, 'number', 2)
+    along = elem.find('replicate_along_axis')
+    direction = None if along is None else along.find('direction')
+    if direction is None :
+       GDMLShared.warning('Replica without replicate_along_axis direction'
+                          ' : %s', GDMLShared.getRef(elem, 'volumeref'))
+       return []
+    axis = None
+    for name in ('x', 'y', 'z', 'rho', 'phi') :
+        if GDMLShared.getVal(direction, name) != 0 :
+           axis = axisIndex[name]
+    values = []
+    for name in ('width', 'offset') :
+        e = along.find(name)
+        if e is None :
+           values.append(0.)
+        else :
+           values.append(GDMLShared.getVal(e, 'value') * \
+                         GDMLShared.unitFactor(e.get('unit'), elem=elem))
+    width, offset = values
+    copies = numpy.arange(number)
+    if axis is None or axis == 3 :
+       GDMLShared.warning('Replica axis not supported : %s', \
+                          direction.attrib)
+       return []
+    if axis == 4 :
+       return axisPlacements(axis, offset + width * (copies + 0.5))
+    if offset != 0 :
+       GDMLShared.warning('Replica offset ignored along %s : %s', \
+                          'xyz'[axis], GDMLShared.getRef(elem, 'volumeref'))
+    return axisPlacements(axis, width * (copies - (number - 1) * 0.5))
+
+# Mother solid dimensions a division can resize, internal units
+divisionAttribs = { \
+    'box' : (['x', 'y', 'z'], []), \
+    'tube' : (['rmin', 'rmax', 'z'], ['startphi', 'deltaphi'])}
+
+def divisionDimensions(solid) :
+    # { attribute : value } of a box or tube mother, None otherwise
+    if solid is None or solid.tag not in divisionAttribs :
+       return None
+    lengths, angles = divisionAttribs[solid.tag]
+    dims = dict(zip(lengths, GDMLShared.getVals(solid, lengths, \
+                    GDMLShared.lengthFactor(solid))))
+    dims.update(zip(angles, GDMLShared.getVals(solid, angles, \
+                    GDMLShared.angleFactor(solid))))
+    return dims
+
+def divisionExtent(tag, dims, axis) :
+    # ( start, length ) of the mother solid along axis
+    if tag == 'box' and axis < 3 :
+       length = dims['xyz'[axis]]
+       return -length / 2, length
+    if tag == 'tube' and axis == 2 :
+       return -dims['z'] / 2, dims['z']
+    if tag == 'tube' and axis == 3 :
+       return dims['rmin'], dims['rmax'] - dims['rmin']
+    if tag == 'tube' and axis == 4 :
+       return dims['startphi'], dims['deltaphi']
+    return None
+
+def cellSolid(solid, dims, changes) :
+    # Copy of the mother solid, all dimensions written in internal
+    # units with changes applied
+    attrib = dict(solid.attrib)
+    for k, v in dims.items() :
+        attrib[k] = repr(float(changes.get(k, v)))
+    attrib['lunit'] = 'mm'
+    attrib['aunit'] = 'rad'
+    return GDMLRecord(solid.tag, attrib, None, [])
+
+def divisionGroups(elem, mother) :
+    # [( cell solid, placements )] of a Geant4 division of the mother
+    # solid by number or width. The cell is the mother solid with the
+    # divided dimension set to the width, copies are at
+    # start + offset + ( i + 0.5 ) width along x, y, z, rotated by
+    # i width for phi, rho divisions are rings each of its own solid
+    import numpy
+    axis = axisIndex.get(elem.get('axis'))
+    solid = None
+    if mother is not None :
+       solid = getSolid(GDMLShared.getRef(mother, 'solidref'))
+    dims = divisionDimensions(solid)
+    extent = None
+    if axis is not None and dims is not None :
+       extent = divisionExtent(solid.tag, dims, axis)
+    if extent is None :
+       GDMLShared.warning('Division not supported : %s of %s', \
+                  elem.get('axis'), None if solid is None else solid.tag)
+       return []
+    start, length = extent
+    factor = GDMLShared.unitFactor(elem.get('unit'), elem=elem)
+    number = int(GDMLShared.getVal(elem, 'number', 2))
+    width = GDMLShared.getVal(elem, 'width') * factor
+    offset = GDMLShared.getVal(elem, 'offset') * factor
+    if number == 0 and width > 0 :
+       number = int((length - offset) / width + 1e-9)
+    elif width == 0 and number > 0 :
+       width = (length - offset) / number
+    if number <= 0 or width <= 0 :
+       GDMLShared.warning('Division of %s needs a number or width', \
+                          solid.tag)
+       return []
+    copies = numpy.arange(number)
+    if axis == 3 :
+       return [(cellSolid(solid, dims, {'rmin' : r, 'rmax' : r + width}), \
+                [FreeCAD.Placement()]) \
+               for r in start + offset + width * copies]
+    if axis == 4 :
+       cell = cellSolid(solid, dims, {'startphi' : start + offset, \
+                                      'deltaphi' : width})
+       return [(cell, axisPlacements(axis, width * copies))]
+    cell = cellSolid(solid, dims, {'xyz'[axis] : width})
+    return [(cell, axisPlacements(axis, \
+                   start + offset + width * (copies + 0.5)))]
+
+def paramGroups(elem, volref) :
+    # [( copy solid or None, placements )] of a paramvol, copies with
+    # the same dimensions share one solid
+    groups = {}
+    solid = None
+    for placement, dims in paramPlacements(elem) :
+        key = None if dims is None else valueKey(dims)
+        if key not in groups :
+           if dims is not None :
+              if solid is None :
+                 solid = getSolid(GDMLShared.getRef( \
+                         getStructure('volume', volref), 'solidref'))
+              groups[key] = (dimensionedSolid(solid, dims), [])
+           else :
+              groups[key] = (None, [])
+        groups[key][1].append(placement)
+    return list(groups.values())
+
+def paramPlacements(elem) :
+    # [( placement, dimensions element or None )] per copy
+    copies = []
+    params = elem.find('parameterised_position_size')
+    if params is None :
+       return copies
+    for p in params.findall('parameters') :
+        dims = [c for c in p if c.tag in dimensionAttribs]
+        if len(dims) == 0 :
+           other = [c.tag for c in p if c.tag.endswith('_dimensions')]
+           if len(other) > 0 :
+              GDMLShared.warning('Parameterised %s not supported', \
+                                 other[0])
+        copies.append((GDMLShared.getPlacementFromRefs(p), \
+                       dims[0] if len(dims) > 0 else None))
+    return copies
+
+def dimensionedSolid(solid, dims) :
+    # Solid of a paramvol copy, the volume's solid with the dimensions
+    if solid.tag+'_dimensions' != dims.tag :
+       GDMLShared.warning('Parameterised %s of %s not supported', \
+                          dims.tag, solid.tag)
+       return solid
+    attrib = dict(solid.attrib)
+    for k, v in dimensionAttribs[dims.tag].items() :
+        if k in dims.attrib :
+           attrib[v] = dims.get(k)
+    # GDML default units unless given
+    attrib['lunit'] = dims.get('lunit', 'mm')
+    attrib['aunit'] = dims.get('aunit', 'rad')
+    return GDMLRecord(solid.tag, attrib, None, [])
+
+def regionPlacements(volref, placements) :
+    # Copies outside the region of the import filter are dropped
+    global prunedCount
+    if importFilter.region is None :
+       return placements
+    kept = [p for p in placements \
+            if not outsideRegion(volref, volumePlacement.multiply(p))]
+    prunedCount += len(placements) - len(kept)
+    return kept
+
+def cellPart(parent, volref, displayMode, solid=None) :
+    # Hidden part of the replicated volume, only shown by the array.
+    # solid replaces the volume's solid i.e. paramvol dimensions
+    global volumeDepth
+    part = addVolumePart(parent, volref)
+    part.Visibility = False
+    solidref = None
+    region = importFilter.region
+    volumeDepth += 1
+    try :
+       if solid is not None :
+          solidref = GDMLShared.getRef(getStructure('volume', volref), \
+                                       'solidref')
+          previous = evaluatedSolids.get(solidref)
+          evaluatedSolids[solidref] = solid
+       # The cell is at the origin not a copy, its daughters are not
+       # tested against the region
+       importFilter.region = None
+       parseVolume(part, volref, 0, 0, 0, None, displayMode)
+    finally :
+       volumeDepth -= 1
+       importFilter.region = region
+       if solidref is not None :
+          del evaluatedSolids[solidref]
+          if previous is not None :
+             evaluatedSolids[solidref] = previous
+          # Other placements of the volume use its own solid
+          if volDict.get(volref) is part :
+             del volDict[volref]
+    return part
+
+def linkArray(parent, part, name, placements) :
+    # One App::Link with an element per copy, all share part's shapes
+    link = parent.newObject("App::Link", name)
+    link.setLink(part)
+    link.ElementCount = len(placements)
+    link.PlacementList = placements
+    return link
+
+def parseReplicated(parent, elem, mother, displayMode) :
+    # replicavol, divisionvol or paramvol elem of volume mother
+    volref = GDMLShared.getRef(elem, 'volumeref')
+    GDMLShared.debug('%s : %s', elem.tag, volref)
+    global prunedCount
+    if importFilter.skip(volref, volumeDepth + 1) :
+       if importFilter.truncated(volumeDepth + 1) :
+          prunedCount += 1
+       return
+    if elem.tag == 'paramvol' :
+       groups = paramGroups(elem, volref)
+    elif elem.tag == 'divisionvol' :
+       groups = divisionGroups(elem, mother)
+    else :
+       groups = [(None, replicaPlacements(elem))]
+    for solid, placements in groups :
+        placements = regionPlacements(volref, placements)
+        if len(placements) == 0 :
+           continue
+        if importProgress is not None :
+           importProgress.volume(volref)
+        if solid is not None :
+           part = cellPart(parent, volref, displayMode, solid)
+        else :
+           part = volDict.get(volref)
+           if part is None :
+              part = cellPart(parent, volref, displayMode)
+        linkArray(parent, part, volref, placements)
+
+##########################################################
+# Lazy import                                            #
+# The structure hierarchy is created as App::Part        #
+# placeholders carrying the physvol placement, a         #
+# volume's solid is only built when the placeholder is   #
+# expanded, either by selecting it or via expandVolume   #
+##########################################################
+
+# Import context per document name, needed to expand later
+global lazyContexts, lazyObserver
+lazyContexts = {}
+lazyObserver = None
+
+def saveContext() :
+    # Globals used while parsing the structure of one GDML file
+    return { 'setup' : setup, 'materials' : materials, 'solids' : solids, \
+             'structure' : structure, 'solidsIndex' : solidsIndex, \
+             'structureIndex' : structureIndex, \
+             'evaluatedSolids' : evaluatedSolids, 'volDict' : volDict, \
+             'pathName' : pathName, 'define' : GDMLShared.define, \
+             'defineIndex' : GDMLShared.defineIndex, \
+             'exprNamespace' : GDMLShared.exprNamespace, \
+             'importFilter' : importFilter, 'volumeParts' : volumeParts, \
+             'boundsCache' : boundsCache }
+
+def restoreContext(context) :
+    global setup, materials, solids, structure, solidsIndex, structureIndex
+    global evaluatedSolids, volDict, pathName, importFilter, volumeParts
+    global boundsCache
+    setup = context['setup']
+    materials = context['materials']
+    solids = context['solids']
+    structure = context['structure']
+    solidsIndex = context['solidsIndex']
+    structureIndex = context['structureIndex']
+    evaluatedSolids = context['evaluatedSolids']
+    volDict = context['volDict']
+    pathName = context['pathName']
+    importFilter = context['importFilter']
+    volumeParts = context['volumeParts']
+    boundsCache = context['boundsCache']
+    GDMLShared.define = context['define']
+    GDMLShared.defineIndex = context['defineIndex']
+    GDMLShared.exprNamespace = context['exprNamespace']
+
+def getPhysVolPosRot(physVol) :
+    # return px, py, pz, rot for a physvol
     posref = GDMLShared.getRef(physVol,"positionref")
     if posref is not None :
-       GDMLShared.trace("positionref : "+posref)
-       pos = GDMLShared.define.find("position[@name='%s']" % posref )
-       if pos is not None : GDMLShared.trace(pos.attrib)
+       pos = GDMLShared.getDefine('position', posref)
     else :
        pos = physVol.find("position")
     if pos is not None :
-       px = GDMLShared.getVal(pos,'x')
-       py = GDMLShared.getVal(pos,'y')
-       pz = GDMLShared.getVal(pos,'z')
+       v = GDMLShared.getPosition(pos)
+       px, py, pz = v.x, v.y, v.z
     else :
-       px = py = pz = 0 
+       px = py = pz = 0
     rotref = GDMLShared.getRef(physVol,"rotationref")
     if rotref is not None :
-       rot = GDMLShared.define.find("rotation[@name='%s']" % rotref )
+       rot = GDMLShared.getDefine('rotation', rotref)
     else :
        rot = physVol.find("rotation")
-
-    volref = GDMLShared.getRef(physVol,"volumeref")
-    GDMLShared.trace("Volume ref : "+volref)
-    part = parent.newObject("App::Part",volref)
-    parseVolume(part,volref,px,py,pz,rot,displayMode)
-
-# ParseVolume name - structure is global
-# We get passed position and rotation
-# displayMode 1 normal 2 hide 3 wireframe
-def parseVolume(parent,name,px,py,pz,rot,displayMode) :
-    global volDict
-
-    # Has the volume already been parsed i.e in Assembly etc
-    obj = volDict.get(name)
-    if obj != None :
-       newobj = Draft.clone(obj)
-       #print(dir(newobj))
-       #print(newobj.TypeId)
-       #print(newobj.Name)
-       #print(newobj.Label)
-       parent.addObject(newobj)
-       base = FreeCAD.Vector(px,py,pz)
-       newobj.Placement = GDMLShared.processPlacement(base,rot)
+    return px, py, pz, rot
+
+def setPlaceholder(part,name,displayMode) :
+    part.addProperty("App::PropertyString","VolRef","GDML", \
+                     "Logical volume to build on expand").VolRef = name
+    part.addProperty("App::PropertyBool","Expanded","GDML", \
+                     "Volume has been built").Expanded = False
+    part.addProperty("App::PropertyInteger","DisplayMode","GDML", \
+                     "Display mode of volume solid").DisplayMode = displayMode
+    part.setEditorMode("VolRef", 1)
+    part.setEditorMode("Expanded", 1)
+    part.setEditorMode("DisplayMode", 2)
+
+def parseLazyVolume(parent,name,displayMode,depth=0,placement=None) :
+    # Create placeholders for the daughters of volume / assembly name
+    # placement is the global placement of the volume for the region
+    global volumeDepth, volumePlacement
+    vol = getStructure('volume', name)
+    if vol is not None :
+       pvs = [pv for pv in volumeDaughters(vol) if pv.tag in daughterTags]
+       displayMode = 1
+    else :
+       asm = getStructure('assembly', name)
+       if asm is None :
+          GDMLShared.warning("Not Volume or Assembly")
+          return
+       pvs = [pv for pv in volumeDaughters(asm) if pv.tag == 'physvol']
+    for pv in pvs :
+        if pv.tag == 'physvol' :
+           parseLazyPhysVol(parent,pv,displayMode,depth,placement)
+        else :
+           # Replicated volumes are built straight away
+           volumeDepth = depth
+           volumePlacement = placement or FreeCAD.Placement()
+           parseReplicated(parent,pv,vol,displayMode)
+
+def parseLazyPhysVol(parent,pv,displayMode,depth=0,placement=None) :
+    global prunedCount, volumePlacement
+    px, py, pz, rot = getPhysVolPosRot(pv)
+    fileElem = pv.find("file")
+    if fileElem is not None :
+       # Volumes from other files are built straight away
+       volumePlacement = placement or FreeCAD.Placement()
+       parseFileVolume(parent,fileElem,px,py,pz,rot,displayMode)
        return
+    volref = GDMLShared.getRef(pv,"volumeref")
+    if importFilter.skip(volref, depth + 1) :
+       if importFilter.truncated(depth + 1) :
+          prunedCount += 1
+       return
+    local = GDMLShared.processPlacement(FreeCAD.Vector(px,py,pz),rot)
+    globalPlacement = None
+    if importFilter.region is not None :
+       globalPlacement = (placement or FreeCAD.Placement()).multiply(local)
+       if outsideRegion(volref, globalPlacement) :
+          prunedCount += 1
+          return
+    obj = volDict.get(volref)
+    if obj is not None :
+       linkVolume(parent,obj,volref,px,py,pz,rot)
+       return
+    if importProgress is not None :
+       importProgress.volume(volref)
+    part = addVolumePart(parent,volref)
+    setPlaceholder(part,volref,displayMode)
+    part.Placement = local
+    pruned = prunedCount
+    parseLazyVolume(part,volref,displayMode,depth + 1,globalPlacement)
+    if pruned == prunedCount :
+       volDict[volref] = part
+
+def isPlaceholder(obj) :
+    return hasattr(obj,'VolRef') and hasattr(obj,'Expanded')
+
+def linkedVolume(obj) :
+    # Placeholder behind an App::Link for repeated volumes
+    if obj.TypeId == 'App::Link' :
+       return obj.LinkedObject
+    return obj
+
+def expandVolume(part, recursive=False, seen=None) :
+    '''Build the solid of a lazy imported volume placeholder
+       returns True if anything was built'''
+    built = False
+    if isPlaceholder(part) and not part.Expanded :
+       context = lazyContexts.get(part.Document.Name)
+       if context is None :
+          GDMLShared.warning("No import data for %s", part.Label)
+          return False
+       restoreContext(context)
+       vol = getStructure('volume', part.VolRef)
+       if vol is not None :
+          solidref = GDMLShared.getRef(vol,"solidref")
+          material = GDMLShared.getRef(vol,"materialref")
+          if solidref is not None and \
+                importFilter.buildSolid(part.VolRef, material) :
+             import GDMLObjects
+             with GDMLObjects.batchEdit() :
+                createSolid(part,getSolid(solidref),material,0,0,0,None, \
+                            part.DisplayMode)
+             built = True
+       part.Expanded = True
+    if recursive :
+       if seen is None :
+          seen = set()
+       seen.add(part.Name)
+       for obj in part.Group :
+           obj = linkedVolume(obj)
+           if isPlaceholder(obj) and obj.Name not in seen :
+              built = expandVolume(obj, True, seen) or built
+    return built
+
+def expandAll(doc) :
+    import GDMLObjects
+    with GDMLObjects.batchEdit() :
+       for obj in doc.Objects :
+           if isPlaceholder(obj) :
+              expandVolume(obj)
+    doc.recompute()
 
-    else :
-        GDMLShared.trace("ParseVolume : "+name)
-        #part = parent.newObject("App::Part",name)
-        vol = structure.find("volume[@name='%s']" % name )
-        if vol != None : # If not volume test for assembly
+class LazySelectionObserver :
+    # Build placeholder volumes when selected in tree or 3D view
+    def addSelection(self, docName, objName, sub, pnt) :
+        doc = FreeCAD.getDocument(docName)
+        obj = doc.getObject(objName)
+        if obj is not None and expandVolume(linkedVolume(obj)) :
+           doc.recompute()
+
+def lazyImport(doc,part,world) :
+    global lazyObserver
+    setPlaceholder(part,world,3)
+    lazyContexts[doc.Name] = saveContext()
+    parseLazyVolume(part,world,3)
+    expandVolume(part)
+    if gui and lazyObserver is None :
+       lazyObserver = LazySelectionObserver()
+       FreeCADGui.Selection.addObserver(lazyObserver)
+
+##########################################################
+# Modular import                                         #
+# <physvol><file name=... volname=.../></physvol> places #
+# the world ( or volname ) volume of another GDML file.  #
+# Referenced files are parsed concurrently, each file    #
+# keeps its own defines & names as a context and parsed  #
+# files are cached by path and modification time         #
+##########################################################
+
+# path -> (mtime, context) kept between imports
+global fileCache, fileContexts
+fileCache = {}
+fileContexts = {}
+
+def readGDML(filename, stream) :
+    # Returns a dictionary of section name -> section
+    if stream :
+       return streamGDML(filename)
+    from lxml import etree
+    parser = etree.XMLParser(resolve_entities=True)
+    root = etree.parse(filename, parser=parser)
+    sections = {}
+    for s in root.getroot() :
+        sections[s.tag] = s
+    return sections
+
+def fileReferences(context, path) :
+    # Paths of files referenced by physvols of the volumes of a file
+    # context, loops are expanded with the defines of that file
+    files = []
+    if context['structure'] is None :
+       return files
+    current = saveContext()
+    restoreContext(context)
+    try :
+       for (tag, name), vol in structureIndex.items() :
+           if tag not in ('volume', 'assembly') :
+              continue
+           for pv in volumeDaughters(vol) :
+               f = pv.find('file') if pv.tag == 'physvol' else None
+               if f is not None and f.get('name') is not None :
+                  files.append(os.path.normpath(os.path.join(path, \
+                                                f.get('name'))))
+    finally :
+       restoreContext(current)
+    return files
+
+def parseFile(filename, stream) :
+    # Worker task, parse and index a referenced file
+    sections = readGDML(filename, stream)
+    sections['solidsIndex'] = sectionIndex(sections.get('solids'))
+    sections['structureIndex'] = sectionIndex(sections.get('structure'))
+    return sections
+
+def createFileContext(filename, sections) :
+    # Resolve the defines of a file into its own expression namespace
+    current = saveContext()
+    GDMLShared.setDefine(sections.get('define'))
+    if sections.get('define') is not None :
+       GDMLShared.resolveDefines(sections.get('define'))
+    indexLoops(sections['solidsIndex'], sections.get('solids'))
+    indexLoops(sections['structureIndex'], sections.get('structure'))
+    context = { 'setup' : sections.get('setup'), \
+                'materials' : sections.get('materials'), \
+                'solids' : sections.get('solids'), \
+                'structure' : sections.get('structure'), \
+                'solidsIndex' : sections['solidsIndex'], \
+                'structureIndex' : sections['structureIndex'], \
+                'evaluatedSolids' : {}, 'volDict' : {}, \
+                'pathName' : os.path.dirname(filename), \
+                'define' : GDMLShared.define, \
+                'defineIndex' : GDMLShared.defineIndex, \
+                'exprNamespace' : GDMLShared.exprNamespace, \
+                'importFilter' : ImportFilter(), 'volumeParts' : {}, \
+                'boundsCache' : {} }
+    restoreContext(current)
+    return context
+
+def loadFiles(doc, files, stream, referenced=False) :
+    # Parse referenced files concurrently, level by level as files
+    # may reference further files, unchanged files come from the cache
+    # referenced - only add materials used by the volumes of the file
+    # otherwise all materials of the file and any G4_ materials used
+    from concurrent.futures import ThreadPoolExecutor
+    global fileContexts
+    fileContexts = {}
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as executor :
+       while len(files) > 0 :
+          futures = {}
+          added = []
+          for f in files :
+              if f in fileContexts or f in futures :
+                 continue
+              try :
+                 mtime = os.path.getmtime(f)
+              except OSError :
+                 GDMLShared.error('GDML file not found : %s', f)
+                 continue
+              cached = fileCache.get(f)
+              if cached is not None and cached[0] == mtime :
+                 # Fresh volume dictionary, objects belong to this import
+                 fileContexts[f] = dict(cached[1], volDict = {}, \
+                          volumeParts = {}, importFilter = importFilter, \
+                          evaluatedSolids = dict(cached[1]['evaluatedSolids']))
+                 added.append(f)
+              else :
+                 futures[f] = (mtime, executor.submit(parseFile, f, stream))
+          for f, (mtime, future) in futures.items() :
+              GDMLShared.info('Parsed GDML file : %s', f)
+              context = createFileContext(f, future.result())
+              fileCache[f] = (mtime, context)
+              fileContexts[f] = dict(context, volDict = {}, \
+                          volumeParts = {}, importFilter = importFilter, \
+                          evaluatedSolids = dict(context['evaluatedSolids']))
+              added.append(f)
+          # Cached files too, their references may have been edited
+          files = []
+          for f in added :
+              files += fileReferences(fileContexts[f], \
+                                      os.path.dirname(f))
+    for context in fileContexts.values() :
+        addMaterials(doc, usedMaterials(context['materials'], \
+                        context['structureIndex'], None, referenced))
+
+def parseFileVolume(parent,fileElem,px,py,pz,rot,displayMode) :
+    filename = os.path.normpath(os.path.join(pathName,fileElem.get('name')))
+    context = fileContexts.get(filename)
+    if context is None :
+       GDMLShared.warning("GDML file not loaded : %s", filename)
+       return
+    volname = fileElem.get('volname')
+    if volname is None :
+       volname = GDMLShared.getRef(context['setup'],"world")
+    global volumePlacement, prunedCount
+    current = saveContext()
+    parentPlacement = volumePlacement
+    restoreContext(context)
+    try :
+       placement = GDMLShared.processPlacement(FreeCAD.Vector(px,py,pz),rot)
+       if importFilter.region is not None :
+          volumePlacement = volumePlacement.multiply(placement)
+          if outsideRegion(volname, volumePlacement) :
+             prunedCount += 1
+             return
+       obj = volDict.get(volname)
+       if obj is not None :
+          linkVolume(parent,obj,volname,px,py,pz,rot)
+       else :
+          part = addVolumePart(parent,volname)
+          part.Placement = placement
+          parseVolume(part,volname,0,0,0,None,displayMode)
+    finally :
+       restoreContext(current)
+       volumePlacement = parentPlacement
+
+##########################################################
+# Pipelined import                                       #
+# A walker thread follows the same path as parseVolume / #
+# parsePhysVol and queues build operations, solids are   #
+# evaluated into records by a pool of worker threads.    #
+# Only the main thread touches the FreeCAD document      #
+##########################################################
+
+# Attributes that are names or units rather than values
+textAttribs = set(['name', 'ref', 'lunit', 'aunit', 'unit', 'type', \
+                   'vertex1', 'vertex2', 'vertex3', 'vertex4', 'formula', \
+                   'state', 'axis', 'file', 'volname'])
+
+def evaluateRecord(elem) :
+    # Return GDMLRecord copy of elem with numeric attributes evaluated
+    attrib = {}
+    for k, v in elem.attrib.items() :
+        if k not in textAttribs :
+           try :
+              v = GDMLShared.evalExpr(v)
+           except Exception :
+              pass
+        attrib[k] = v
+    children = [evaluateRecord(c) for c in elem if isinstance(c.tag, str)]
+    return GDMLRecord(elem.tag, attrib, elem.text, children)
+
+def evaluateSolid(name, components=None) :
+    # Worker task, evaluate solid and for booleans its components
+    # components - futures of the components if already submitted
+    solid = solidsIndex.get(('*', name))
+    if solid is None :
+       return None
+    if components is not None :
+       for future in components :
+           future.result()
+    elif solid.tag in ["subtraction","union","intersection"] :
+       for ref in ['first', 'second'] :
+           refName = GDMLShared.getRef(solid, ref)
+           if refName not in evaluatedSolids :
+              evaluateSolid(refName)
+    record = evaluateRecord(solid)
+    evaluatedSolids[name] = record
+    return record
+
+class ImportPipeline(object) :
+    '''Producer / consumer import of the structure from the world volume.
+       Operations queued by the walker thread are
+         ('part',  parentKey, key, volref, px, py, pz, rot)
+         ('solid', key, volname, future, material, mode)
+         ('link',  parentKey, volref, px, py, pz, rot)
+         ('file',  parentKey, fileElem, px, py, pz, rot, mode, placement)
+         ('replica', parentKey, elem, mother, mode, depth, placement)
+         ('error', exception)
+       a key identifies the App::Part created for a physvol. Solids are
+       submitted as the walker reaches them. For file and replica ops
+       the walker waits until the main thread has built them, as they
+       switch the define context, so the tree is built in the same
+       order as parseVolume'''
+
+    def __init__(self, workers=None) :
+        import queue, threading
+        from concurrent.futures import ThreadPoolExecutor
+        if workers is None :
+           workers = os.cpu_count() or 2
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Bounded so the walker does not run too far ahead
+        self.queue = queue.Queue(maxsize=1000)
+        self.futures = {}
+        self.nextKey = 1
+        self.stopped = False
+        self.pruned = 0
+        # Set by the main thread once a file or replica op is built
+        self.resume = threading.Event()
+
+    def submitSolid(self, name) :
+        # Boolean components are submitted first and shared, a worker
+        # only waits for solids already ahead of it in the pool
+        future = self.futures.get(name)
+        if future is None :
+           components = None
+           solid = solidsIndex.get(('*', name))
+           if solid is not None and \
+                 solid.tag in ["subtraction","union","intersection"] :
+              components = [self.submitSolid(GDMLShared.getRef(solid, ref)) \
+                            for ref in ['first', 'second']]
+           future = self.executor.submit(evaluateSolid, name, components)
+           self.futures[name] = future
+        return future
+
+    def waitFor(self, op) :
+        # Queue op and wait for the main thread to build it
+        self.resume.clear()
+        self.queue.put(op)
+        self.resume.wait()
+
+    def evaluatePosRot(self, physVol) :
+        px, py, pz, rot = getPhysVolPosRot(physVol)
+        if rot is not None :
+           rot = evaluateRecord(rot)
+        return px, py, pz, rot
+
+    def walkPhysVol(self, parentKey, physVol, displayMode, seen, depth, \
+                    placement) :
+        if self.stopped :
+           return
+        px, py, pz, rot = self.evaluatePosRot(physVol)
+        fileElem = physVol.find("file")
+        if fileElem is not None :
+           # Other file has its own context, built on the main thread
+           self.waitFor(('file', parentKey, fileElem, px, py, pz, rot, \
+                         displayMode, placement))
+           return
+        volref = GDMLShared.getRef(physVol,"volumeref")
+        if importFilter.skip(volref, depth + 1) :
+           if importFilter.truncated(depth + 1) :
+              self.pruned += 1
+           return
+        if importFilter.region is not None :
+           placement = placement.multiply(GDMLShared.processPlacement( \
+                             FreeCAD.Vector(px,py,pz),rot))
+           if outsideRegion(volref, placement) :
+              self.pruned += 1
+              return
+        if volref in seen :
+           self.queue.put(('link', parentKey, volref, px, py, pz, rot))
+           return
+        key = self.nextKey
+        self.nextKey += 1
+        self.queue.put(('part', parentKey, key, volref, px, py, pz, rot))
+        self.walkVolume(key, volref, displayMode, seen, depth + 1, placement)
+
+    def walkVolume(self, key, name, displayMode, seen, depth, placement) :
+        seen.add(name)
+        pruned = self.pruned
+        vol = getStructure('volume', name)
+        if vol is not None :
            solidref = GDMLShared.getRef(vol,"solidref")
-           if solidref != None :
-              solid  = solids.find("*[@name='%s']" % solidref )
-              GDMLShared.trace(solid.tag)
-              # Material is the materialref value
-              # need to add default
-              #material = GDMLShared.getRef(vol,"materialref")
-              material = GDMLShared.getRef(vol,"materialref")
-              #createSolid(part,solid,material,px,py,pz,rot,displayMode)
-              obj = createSolid(parent,solid,material,px,py,pz,rot,displayMode)
-           # Volume may or maynot contain physvol's
-           displayMode = 1
-           for pv in vol.findall("physvol") :
-               # create solids at pos & rot in physvols
-               #parsePhysVol(part,pv,displayMode)
-               #obj = parent.newObject("App::Part",name)
-               parsePhysVol(parent,pv,displayMode)
-           # Add parsed Volume to dict
-           volDict[name] = obj
-           return obj
-
+           material = GDMLShared.getRef(vol,"materialref")
+           if solidref is not None and importFilter.buildSolid(name, material) :
+              self.queue.put(('solid', key, name, self.submitSolid(solidref), \
+                          material, displayMode))
+           for pv in volumeDaughters(vol) :
+               if pv.tag == 'physvol' :
+                  self.walkPhysVol(key, pv, 1, seen, depth, placement)
+               elif pv.tag in replicaTags :
+                  if importFilter.truncated(depth + 1) :
+                     self.pruned += 1
+                     continue
+                  # Cell is built on the main thread
+                  self.waitFor(('replica', key, pv, vol, 1, depth, \
+                                placement))
         else :
-           asm = structure.find("assembly[@name='%s']" % name)
-           print("Assembly : "+name)
-           if asm != None :
-              for pv in asm.findall("physvol") :
-                  # create solids at pos & rot in physvols
-                  #parsePhysVol(part,pv,displayMode)
-                  #obj = parent.newObject("App::Part",name)
-                  parsePhysVol(parent,pv,displayMode)
+           asm = getStructure('assembly', name)
+           if asm is not None :
+              for pv in volumeDaughters(asm) :
+                  if pv.tag == 'physvol' :
+                     self.walkPhysVol(key, pv, displayMode, seen, depth, \
+                                      placement)
            else :
-              print("Not Volume or Assembly") 
-
+              GDMLShared.warning("Not Volume or Assembly")
+        if pruned != self.pruned :
+           # Not complete, further placements are built not linked
+           seen.discard(name)
+
+    def walk(self, world) :
+        try :
+           self.walkVolume(0, world, 3, set(), 0, FreeCAD.Placement())
+        except Exception as e :
+           self.queue.put(('error', e))
+        self.queue.put(None)
+
+    def run(self, worldPart, world) :
+        from concurrent.futures import wait
+        global volumePlacement, volumeDepth
+        walker = threading.Thread(target=self.walk, args=(world,))
+        walker.daemon = True
+        walker.start()
+        parts = {0 : worldPart}
+        parents = {0 : None}
+        # Key of the part whose daughter is being built
+        building = None
+        try :
+           while True :
+              op = self.queue.get()
+              if op is None :
+                 break
+              kind = op[0]
+              if kind == 'part' :
+                 parentKey, key, name, px, py, pz, rot = op[1:]
+                 building = parentKey
+                 if importProgress is not None :
+                    importProgress.volume(name)
+                 part = addVolumePart(parts[parentKey],name)
+                 part.Placement = GDMLShared.processPlacement( \
+                                  FreeCAD.Vector(px,py,pz),rot)
+                 parts[key] = volDict[name] = part
+                 parents[key] = parentKey
+              elif kind == 'solid' :
+                 key, name, future, material, mode = op[1:]
+                 createSolid(parts[key],future.result(),material, \
+                             0,0,0,None,mode)
+              elif kind == 'link' :
+                 parentKey, name, px, py, pz, rot = op[1:]
+                 linkVolume(parts[parentKey],volDict[name],name,px,py,pz,rot)
+              elif kind in ('file', 'replica') :
+                 # Switches the define context or sets the solid of a
+                 # paramvol copy. The walker is waiting, let the workers
+                 # finish too so nothing else reads the context
+                 building = op[1]
+                 wait(list(self.futures.values()))
+                 if kind == 'replica' :
+                    parentKey, elem, mother, mode, depth, placement = op[1:]
+                    volumeDepth = depth
+                    volumePlacement = placement
+                    parseReplicated(parts[parentKey],elem,mother,mode)
+                 else :
+                    parentKey, fileElem, px, py, pz, rot, mode, placement = \
+                                                                     op[1:]
+                    # placement is the global placement of the parent
+                    volumePlacement = placement
+                    parseFileVolume(parts[parentKey],fileElem,px,py,pz,rot, \
+                                    mode)
+                 self.resume.set()
+              elif kind == 'error' :
+                 raise op[1]
+        except ImportCancelled :
+           # Parts still being walked are cut short, children have
+           # higher keys so go first
+           cut = []
+           key = building
+           while key is not None :
+               cut.append(key)
+               key = parents[key]
+           for key in cut :
+               abandonPart(parts[key])
+           raise
+        finally :
+           # Main thread may have failed, keep draining so walker can finish
+           import queue
+           self.stopped = True
+           for future in self.futures.values() :
+               future.cancel()
+           while walker.is_alive() :
+              self.resume.set()
+              try :
+                 self.queue.get(timeout=0.1)
+              except queue.Empty :
+                 pass
+           self.executor.shutdown(wait=True)
+
+
+##########################################################
+# Import filter                                          #
+# Root volumes, maximum depth and fnmatch patterns on    #
+# volume & material names, checked before any object of #
+# a physvol is created                                   #
+##########################################################
+
+class ImportFilter(object) :
+    '''roots   : volume name or list of names to import instead of world
+       maxDepth: physvol nesting below a root to import, None no limit
+       include : patterns, only volumes whose name or material match
+                 have their solid built, others are kept as containers
+       exclude : patterns, matching volumes and their daughters skipped
+       region  : BoxRegion or CylinderRegion in the frame of the root,
+                 placed volumes outside it are skipped with daughters'''
+
+    def __init__(self, roots=None, maxDepth=None, include=None, \
+                 exclude=None, region=None) :
+        if isinstance(roots, str) :
+           roots = [roots]
+        self.roots = roots or []
+        self.maxDepth = maxDepth
+        self.include = include or []
+        self.exclude = exclude or []
+        self.region = region
+
+    def matches(self, patterns, name, material) :
+        from fnmatch import fnmatchcase
+        for p in patterns :
+            if fnmatchcase(name, p) :
+               return True
+            if material is not None and fnmatchcase(material, p) :
+               return True
+        return False
+
+    def skip(self, name, depth) :
+        # True if volume placed at depth is not to be imported
+        if self.truncated(depth) :
+           return True
+        return len(self.exclude) > 0 and \
+               self.matches(self.exclude, name, volumeMaterial(name))
+
+    def truncated(self, depth) :
+        # True if depth is below maxDepth, the volume placing it is not
+        # complete so must not be the target of links
+        return self.maxDepth is not None and depth > self.maxDepth
+
+    def buildSolid(self, name, material) :
+        return len(self.include) == 0 or \
+               self.matches(self.include, name, material)
+
+def volumeMaterial(name) :
+    vol = getStructure('volume', name)
+    if vol is None :
+       return None
+    return GDMLShared.getRef(vol,"materialref")
+
+global importFilter, volumeDepth
+importFilter = ImportFilter()
+volumeDepth = 0
+
+##########################################################
+# Region of interest                                     #
+# Bounding boxes of solids are worked out from their     #
+# parameters, no OCC shapes are built. A placed volume   #
+# outside the region is pruned with all its daughters    #
+# as GDML daughters lie inside their mother volume       #
+##########################################################
+
+class BoxRegion(object) :
+    def __init__(self, xmin, ymin, zmin, xmax, ymax, zmax) :
+        self.bounds = (xmin, ymin, zmin, xmax, ymax, zmax)
+
+    def intersects(self, b) :
+        r = self.bounds
+        return b[0] <= r[3] and b[3] >= r[0] and \
+               b[1] <= r[4] and b[4] >= r[1] and \
+               b[2] <= r[5] and b[5] >= r[2]
+
+class CylinderRegion(object) :
+    # Cylinder parallel to z axis
+    def __init__(self, radius, zmin, zmax, x=0, y=0) :
+        self.radius = radius
+        self.zmin = zmin
+        self.zmax = zmax
+        self.x = x
+        self.y = y
+
+    def intersects(self, b) :
+        if b[2] > self.zmax or b[5] < self.zmin :
+           return False
+        # nearest point of box in xy to the axis
+        dx = max(b[0] - self.x, 0, self.x - b[3])
+        dy = max(b[1] - self.y, 0, self.y - b[4])
+        return dx * dx + dy * dy <= self.radius * self.radius
+
+def zplaneBounds(solid, radial) :
+    r = z0 = z1 = None
+    lf = GDMLShared.lengthFactor(solid)
+    for zp in solid.findall('zplane') :
+        rmax, z = GDMLShared.getVals(zp, ['rmax','z'], lf)
+        rmax *= radial
+        r = rmax if r is None else max(r, rmax)
+        z0 = z if z0 is None else min(z0, z)
+        z1 = z if z1 is None else max(z1, z)
+    if r is None :
+       return None
+    return [-r, -r, z0, r, r, z1]
+
+def solidBounds(solid) :
+    # Bounding box [xmin,ymin,zmin,xmax,ymax,zmax] of a solid in its
+    # own frame as created by the importer, None if not known
+    lf = GDMLShared.lengthFactor(solid)
+    def val(a) :
+        return GDMLShared.getVal(solid,a) * lf
+    def angle(a) :
+        return GDMLShared.getVal(solid,a) * GDMLShared.angleFactor(solid)
+    tag = solid.tag
+    if tag == 'box' :
+       x, y, z = val('x') / 2, val('y') / 2, val('z') / 2
+       return [-x, -y, -z, x, y, z]
+    if tag == 'tube' :
+       r, z = val('rmax'), val('z') / 2
+       return [-r, -r, -z, r, r, z]
+    if tag == 'cone' :
+       r, z = max(val('rmax1'), val('rmax2')), val('z') / 2
+       return [-r, -r, -z, r, r, z]
+    if tag == 'sphere' :
+       r = val('rmax')
+       return [-r, -r, -r, r, r, r]
+    if tag == 'ellipsoid' :
+       x, y, z = val('ax'), val('by'), val('cz')
+       return [-x, -y, -z, x, y, z]
+    if tag == 'eltube' :
+       x, y, z = val('dx'), val('dy'), val('dz')
+       return [-x, -y, -z, x, y, z]
+    if tag == 'elcone' :
+       # dx, dy have no unit
+       h = val('zmax') + val('zcut')
+       x = GDMLShared.getVal(solid,'dx') * h
+       y = GDMLShared.getVal(solid,'dy') * h
+       z = val('zcut')
+       return [-x, -y, -z, x, y, z]
+    if tag == 'trd' :
+       x = max(val('x1'), val('x2')) / 2
+       y = max(val('y1'), val('y2')) / 2
+       z = val('z') / 2
+       return [-x, -y, -z, x, y, z]
+    if tag in ['trap', 'trap_dimensions'] :
+       z = val('z') / 2
+       shift = abs(tan(angle('theta'))) * z
+       y = max(val('y1'), val('y2')) / 2
+       x = max(val('x1'), val('x2'), val('x3'), val('x4')) / 2 + shift + \
+           max(abs(tan(angle('alpha1'))), abs(tan(angle('alpha2')))) * y
+       y += shift
+       return [-x, -y, -z, x, y, z]
+    if tag == 'polycone' :
+       return zplaneBounds(solid, 1)
+    if tag == 'polyhedra' :
+       # rmax is to the flat side, corners are further out
+       n = max(GDMLShared.getVal(solid,'numsides',2), 3)
+       return zplaneBounds(solid, 1 / cos(pi / n))
+    if tag == 'xtru' :
+       verts = [GDMLShared.getVals(v, ['x','y'], lf) \
+                for v in solid.findall('twoDimVertex')]
+       b = None
+       for s in solid.findall('section') :
+           sf = GDMLShared.getVal(s,'scalingFactor')
+           z, xo, yo = GDMLShared.getVals(s, \
+                            ['zPosition','xOffset','yOffset'], lf)
+           for x, y in verts :
+               b = extendBounds(b, x * sf + xo, y * sf + yo, z)
+       return b
+    if tag == 'tessellated' :
+       # RELATIVE facets as createTessellated, vertices after the
+       # first are offsets from it
+       b = None
+       for facet in solid :
+           names = [facet.get(a) for a in \
+                    ['vertex1', 'vertex2', 'vertex3', 'vertex4']]
+           names = [n for n in names if n is not None]
+           relative = facet.get('type','ABSOLUTE').upper() == 'RELATIVE'
+           first = None
+           for n in names :
+               v = GDMLShared.getVertex(n)
+               if first is None :
+                  first = v
+               elif relative :
+                  v = first + v
+               b = extendBounds(b, v.x, v.y, v.z)
+       return b
+    if tag in ['union', 'subtraction', 'intersection'] :
+       b = solidBounds(getSolid(GDMLShared.getRef(solid,'first')))
+       if tag == 'union' and b is not None :
+          second = solidBounds(getSolid(GDMLShared.getRef(solid,'second')))
+          if second is None :
+             return None
+          second = transformBounds(second, \
+                         GDMLShared.getPlacementFromRefs(solid))
+          b = [min(b[0], second[0]), min(b[1], second[1]), \
+               min(b[2], second[2]), max(b[3], second[3]), \
+               max(b[4], second[4]), max(b[5], second[5])]
+       return b
+    return None
+
+def extendBounds(b, x, y, z) :
+    if b is None :
+       return [x, y, z, x, y, z]
+    return [min(b[0], x), min(b[1], y), min(b[2], z), \
+            max(b[3], x), max(b[4], y), max(b[5], z)]
+
+def transformBounds(b, placement) :
+    # Axis aligned bounds of a placed box
+    result = None
+    for x in (b[0], b[3]) :
+        for y in (b[1], b[4]) :
+            for z in (b[2], b[5]) :
+                v = placement.multVec(FreeCAD.Vector(x, y, z))
+                result = extendBounds(result, v.x, v.y, v.z)
+    return result
+
+def volumeBounds(name) :
+    # Local bounds of a volume, cached by name, each file context has
+    # its own cache
+    if name in boundsCache :
+       return boundsCache[name]
+    b = None
+    vol = getStructure('volume', name)
+    if vol is not None :
+       solidref = GDMLShared.getRef(vol,"solidref")
+       if solidref is not None :
+          solid = getSolid(solidref)
+          if solid is not None :
+             b = solidBounds(solid)
+    boundsCache[name] = b
+    return b
+
+def outsideRegion(name, placement) :
+    # True if placed volume name lies completely outside the region
+    if importFilter.region is None :
+       return False
+    b = volumeBounds(name)
+    if b is None :        # Assembly or unknown solid, keep
+       return False
+    return not importFilter.region.intersects(transformBounds(b, placement))
+
+global boundsCache, volumePlacement, prunedCount
+boundsCache = {}
+volumePlacement = None
+prunedCount = 0
 
 def getItem(element, attribute) :
     item = element.get(attribute)
@@ -712,128 +1983,1121 @@ def getItem(element, attribute) :
        return ""
 
 def processIsotopes(doc) :
-    from GDMLObjects import GDMLisotope, ViewProvider
     isotopesGrp  = doc.addObject("App::DocumentObjectGroupPython","Isotopes")
     for isotope in materials.findall('isotope') :
-        N = int(isotope.get('N'))
-        Z = int(float(isotope.get('Z')))    # annotated.gdml file has Z=8.0 
-        name = isotope.get('name')
-        atom = isotope.find('atom')
-        unit = atom.get('unit','g/mole')
-        value = float(atom.get('value'))
-        #isoObj = isotopesGrp.newObject("App::FeaturePython",name)
-        isoObj = isotopesGrp.newObject("App::DocumentObjectGroupPython",name)
-        #GDMLisotope(isoObj,name,N,Z,unit,value)
-        GDMLisotope(isoObj,name,N,Z,unit,value)
+        createIsotope(isotopesGrp, isotope)
+
+def createIsotope(grp, isotope) :
+    from GDMLObjects import GDMLisotope
+    N = int(isotope.get('N'))
+    Z = int(float(isotope.get('Z')))    # annotated.gdml file has Z=8.0 
+    name = isotope.get('name')
+    atom = isotope.find('atom')
+    unit = atom.get('unit','g/mole')
+    value = float(atom.get('value'))
+    #isoObj = isotopesGrp.newObject("App::FeaturePython",name)
+    isoObj = grp.newObject("App::DocumentObjectGroupPython",name)
+    #GDMLisotope(isoObj,name,N,Z,unit,value)
+    GDMLisotope(isoObj,name,N,Z,unit,value)
+    return isoObj
 
 def processElements(doc) :
-    from GDMLObjects import GDMLelement, GDMLfraction
     elementsGrp  = doc.addObject("App::DocumentObjectGroupPython","Elements")
     elementsGrp.Label = 'Elements'
     for element in materials.findall('element') :
-        name = element.get('name')
-        elementObj = elementsGrp.newObject("App::DocumentObjectGroupPython", \
-                     name)
-        Z = element.get('Z')
-        if (Z != None ) :
-           elementObj.addProperty("App::PropertyInteger","Z",name).Z=int(float(Z))
-        atom = element.find('atom') 
-        if atom != None :
-           unit = atom.get('unit')
-           if unit != None :
-              elementObj.addProperty("App::PropertyString","atom_unit",name). \
-                                      atom_unit = unit
-              value = float(atom.get('value'))                        
-              elementObj.addProperty("App::PropertyFloat","atom_value",name). \
-                                      atom_value = value
-
-
-        GDMLelement(elementObj,name)
-        for fraction in element.findall('fraction') :
-            ref = fraction.get('ref')
-            n = float(fraction.get('n'))
-            #fractObj = elementObj.newObject("App::FeaturePython",ref)
-            fractObj = elementObj.newObject("App::DocumentObjectGroupPython",ref)
-            GDMLfraction(fractObj,ref,n)
-            #fractObj.Label = ref[0:5]+' : ' + '{0:0.2f}'.format(n)
-            fractObj.Label = ref+' : ' + '{0:0.2f}'.format(n)
+        createElement(elementsGrp, element)
+
+def createElement(grp, element) :
+    from GDMLObjects import GDMLelement, GDMLfraction
+    name = element.get('name')
+    elementObj = grp.newObject("App::DocumentObjectGroupPython", \
+                 name)
+    Z = element.get('Z')
+    if (Z != None ) :
+       elementObj.addProperty("App::PropertyInteger","Z",name).Z=int(float(Z))
+    atom = element.find('atom') 
+    if atom != None :
+       unit = atom.get('unit')
+       if unit != None :
+          elementObj.addProperty("App::PropertyString","atom_unit",name). \
+                                  atom_unit = unit
+          value = float(atom.get('value'))                        
+          elementObj.addProperty("App::PropertyFloat","atom_value",name). \
+                                  atom_value = value
+
+
+    GDMLelement(elementObj,name)
+    for fraction in element.findall('fraction') :
+        ref = fraction.get('ref')
+        n = float(fraction.get('n'))
+        #fractObj = elementObj.newObject("App::FeaturePython",ref)
+        fractObj = elementObj.newObject("App::DocumentObjectGroupPython",ref)
+        GDMLfraction(fractObj,ref,n)
+        #fractObj.Label = ref[0:5]+' : ' + '{0:0.2f}'.format(n)
+        fractObj.Label = ref+' : ' + '{0:0.2f}'.format(n)
+    return elementObj
 
 def processMaterials(doc) :
-    from GDMLObjects import GDMLmaterial, GDMLfraction, GDMLcomposite, \
-                            MaterialsList
+    from GDMLObjects import MaterialsList
 
     materialGrp = doc.addObject("App::DocumentObjectGroupPython","Materials")
     materialGrp.Label = "Materials"
+    addMaterials(doc, materials, materialGrp)
+    GDMLShared.debug("Materials List :")
+    GDMLShared.debug("%s", MaterialsList)
+
+def addMaterials(doc, materials, materialGrp=None) :
+    # Add materials not already defined, i.e. from referenced files
+    from GDMLObjects import MaterialsList, findMaterialDB
+
+    if materials is None :
+       return
+    db = findMaterialDB(doc)
+    if db is not None :
+       addMaterialsDB(db, materials)
+       return
+    if materialGrp is None :
+       materialGrp = doc.getObject("Materials")
+    present = set(obj.Label for obj in materialGrp.Group)
     for material in materials.findall('material') :
         name = material.get('name')
-        MaterialsList.append(name)
-        materialObj = materialGrp.newObject("App::DocumentObjectGroupPython", \
-                      name)
-        GDMLmaterial(materialObj,name)
-        formula = material.get('formula')
-        if formula != None :
-           materialObj.addProperty("App::PropertyString",'formula', \
-                      name).formula = formula
-        D = material.find('D')
-        if D != None :
-           Dunit = getItem(D,'unit')
-           Dvalue = float(D.get('value'))
-           materialObj.addProperty("App::PropertyString",'Dunit','GDMLmaterial','D unit').Dunit = Dunit
-           materialObj.addProperty("App::PropertyFloat",'Dvalue','GDMLmaterial','D value').Dvalue = Dvalue
-        Z = material.get('Z')
-        if Z != None :
-           materialObj.addProperty("App::PropertyString",'Z',name).Z = Z
-        atom = material.find('atom')
-        if atom != None :
-           print("Found atom in : "+name) 
-           aUnit = atom.get('unit')
-           if aUnit != None :
-              materialObj.addProperty("App::PropertyString",'atom_unit', \
-                         name).atom_unit = aUnit
-           aValue = atom.get('value')
-           if aValue != None :
-              materialObj.addProperty("App::PropertyFloat",'atom_value', \
-                         name).atom_value = float(aValue)
+        if name in present :
+           continue
+        present.add(name)
+        if name not in MaterialsList :
+           MaterialsList.append(name)
+        createMaterial(materialGrp, material)
+
+def createMaterial(grp, material) :
+    from GDMLObjects import GDMLmaterial, GDMLfraction, GDMLcomposite
+    name = material.get('name')
+    materialObj = grp.newObject("App::DocumentObjectGroupPython", \
+                  name)
+    GDMLmaterial(materialObj,name)
+    formula = material.get('formula')
+    if formula != None :
+       materialObj.addProperty("App::PropertyString",'formula', \
+                  name).formula = formula
+    D = material.find('D')
+    if D != None :
+       Dunit = getItem(D,'unit')
+       Dvalue = float(D.get('value'))
+       materialObj.addProperty("App::PropertyString",'Dunit','GDMLmaterial','D unit').Dunit = Dunit
+       materialObj.addProperty("App::PropertyFloat",'Dvalue','GDMLmaterial','D value').Dvalue = Dvalue
+    Z = material.get('Z')
+    if Z != None :
+       materialObj.addProperty("App::PropertyString",'Z',name).Z = Z
+    atom = material.find('atom')
+    if atom != None :
+       GDMLShared.debug("Found atom in : %s", name) 
+       aUnit = atom.get('unit')
+       if aUnit != None :
+          materialObj.addProperty("App::PropertyString",'atom_unit', \
+                     name).atom_unit = aUnit
+       aValue = atom.get('value')
+       if aValue != None :
+          materialObj.addProperty("App::PropertyFloat",'atom_value', \
+                     name).atom_value = float(aValue)
  
-        T = material.find('T')
-        if T != None :
-           Tunit = T.get('unit')
-           Tvalue = float(T.get('value'))
-           materialObj.addProperty("App::PropertyString",'Tunit','GDMLmaterial',"T ZZZUnit").Tunit = Tunit
-           materialObj.addProperty("App::PropertyFloat",'Tvalue','GDMLmaterial','T XXXXvalue').Tvalue = Tvalue
-        MEE = material.find('MEE')
-        if MEE != None :
-           Munit = MEE.get('unit')
-           Mvalue = float(MEE.get('value'))
-           materialObj.addProperty("App::PropertyString",'MEEunit','GDMLmaterial','MEE unit').MEEunit = Munit
-           materialObj.addProperty("App::PropertyFloat",'MEEvalue','GDMLmaterial','MEE value').MEEvalue = Mvalue
-        for fraction in material.findall('fraction') :
-            n = float(fraction.get('n'))
-            ref = fraction.get('ref')
-            fractionObj = materialObj.newObject("App::DocumentObjectGroupPython", \
-                                                 ref)
-            GDMLfraction(fractionObj,ref,n)
-            #fractionObj.Label = ref[0:5] +' : '+'{0:0.2f}'.format(n)
-            fractionObj.Label = ref +' : '+'{0:0.2f}'.format(n)
-
-        for composite in material.findall('composite') :
-            n = int(composite.get('n'))
-            ref = composite.get('ref')
-            compositeObj = materialObj.newObject("App::DocumentObjectGroupPython", \
-                                                 ref)
-            GDMLcomposite(compositeObj,ref,n)
-            compositeObj.Label = ref +' : '+str(n)
-    print("Materials List :")
-    print(MaterialsList)
-
-def processGDML(doc,filename):
+    T = material.find('T')
+    if T != None :
+       Tunit = T.get('unit')
+       Tvalue = float(T.get('value'))
+       materialObj.addProperty("App::PropertyString",'Tunit','GDMLmaterial',"T ZZZUnit").Tunit = Tunit
+       materialObj.addProperty("App::PropertyFloat",'Tvalue','GDMLmaterial','T XXXXvalue').Tvalue = Tvalue
+    MEE = material.find('MEE')
+    if MEE != None :
+       Munit = MEE.get('unit')
+       Mvalue = float(MEE.get('value'))
+       materialObj.addProperty("App::PropertyString",'MEEunit','GDMLmaterial','MEE unit').MEEunit = Munit
+       materialObj.addProperty("App::PropertyFloat",'MEEvalue','GDMLmaterial','MEE value').MEEvalue = Mvalue
+    for fraction in material.findall('fraction') :
+        n = float(fraction.get('n'))
+        ref = fraction.get('ref')
+        fractionObj = materialObj.newObject("App::DocumentObjectGroupPython", \
+                                             ref)
+        GDMLfraction(fractionObj,ref,n)
+        #fractionObj.Label = ref[0:5] +' : '+'{0:0.2f}'.format(n)
+        fractionObj.Label = ref +' : '+'{0:0.2f}'.format(n)
+
+    for composite in material.findall('composite') :
+        n = int(composite.get('n'))
+        ref = composite.get('ref')
+        compositeObj = materialObj.newObject("App::DocumentObjectGroupPython", \
+                                             ref)
+        GDMLcomposite(compositeObj,ref,n)
+        compositeObj.Label = ref +' : '+str(n)
+    return materialObj
+
+##########################################################
+# Referenced materials                                   #
+# Only materials given by materialref of the volumes     #
+# being imported are created, with the elements and      #
+# isotopes they are made of                              #
+##########################################################
+
+def usedVolumes(index, roots) :
+    # Volumes and assemblies reachable from roots
+    seen = set()
+    stack = list(roots)
+    while len(stack) > 0 :
+        name = stack.pop()
+        if name in seen :
+           continue
+        seen.add(name)
+        vol = index.get(('volume', name))
+        if vol is None :
+           vol = index.get(('assembly', name))
+        if vol is None :
+           continue
+        # physvol, replicavol, paramvol and divisionvol
+        for pv in volumeDaughters(vol) :
+            ref = pv.find('volumeref')
+            if ref is not None :
+               stack.append(ref.get('ref'))
+    return seen
+
+def usedMaterials(materials, index, roots=None, referenced=True) :
+    # Materials section reduced to the materials referenced by volumes
+    # reachable from roots ( default all volumes ) and through fraction
+    # and composite refs the materials, elements and isotopes they use.
+    # G4_ materials not defined in the file come from the NIST database
+    # referenced False - keep all entries, only add NIST materials
+    import GDMLNist
+    if roots is None :
+       volumes = [name for tag, name in index if tag == 'volume']
+    else :
+       volumes = usedVolumes(index, roots)
+    stack = []
+    for name in volumes :
+        vol = index.get(('volume', name))
+        if vol is not None :
+           ref = GDMLShared.getRef(vol, 'materialref')
+           if ref is not None :
+              stack.append(ref)
+    # A material and an element may have the same name
+    entries = {}
+    section = []
+    if materials is not None :
+       section = [entry for entry in materials if isinstance(entry.tag, str)]
+    for entry in section :
+        if entry.get('name') is not None :
+           entries.setdefault(entry.get('name'), []).append(entry)
+    if not referenced :
+       stack += list(entries)
+    wanted = set()
+    nist = []
+    while len(stack) > 0 :
+        name = stack.pop()
+        if name in wanted :
+           continue
+        wanted.add(name)
+        if name not in entries :
+           if GDMLNist.isNist(name) :
+              nist.append(name)
+           continue
+        for entry in entries[name] :
+            for child in entry :
+                if child.tag in ('fraction', 'composite') :
+                   stack.append(child.get('ref'))
+    children = [recordFromEntry(kind, entry) for kind, name, entry in \
+                GDMLNist.entries(sorted(nist), entries)]
+    for name in nist :
+        if not GDMLNist.hasMaterial(name) :
+           GDMLShared.warning('Material not found : %s', name)
+    children += [entry for entry in section if entry.get('name') in wanted]
+    GDMLShared.debug('Referenced materials : %s', len(children))
+    if materials is None :
+       if len(children) == 0 :
+          return None
+       return GDMLRecord('materials', {}, None, children)
+    return GDMLRecord(materials.tag, dict(materials.attrib), None, children)
+
+##########################################################
+# Compact materials                                      #
+# Isotopes, elements and materials are held as entries   #
+# of one GDMLmaterialDB object, objects are only created #
+# when an entry is edited                                #
+##########################################################
+
+def entryFromElement(elem) :
+    return [dict(elem.attrib), [[c.tag, dict(c.attrib)] for c in elem \
+                                if isinstance(c.tag, str)]]
+
+def recordFromEntry(tag, entry) :
+    return GDMLRecord(tag, dict(entry[0]), None, \
+                 [GDMLRecord(t, dict(a), None, []) for t, a in entry[1]])
+
+def processMaterialsDB(doc) :
+    from GDMLObjects import GDMLmaterialDB, findMaterialDB
+    db = findMaterialDB(doc)
+    if db is None :
+       db = doc.addObject("App::DocumentObjectGroupPython","MaterialsDB")
+       db.Label = "Materials"
+       GDMLmaterialDB(db)
+    addMaterialsDB(db, materials)
+    return db
+
+def addMaterialsDB(db, materials) :
+    from GDMLObjects import MaterialsList
+    if materials is None :
+       return
+    for kind in db.Proxy.kinds :
+        items = [(e.get('name'), entryFromElement(e)) \
+                 for e in materials.findall(kind)]
+        db.Proxy.addEntries(db, kind, items)
+        if kind == 'material' :
+           known = set(MaterialsList)
+           for name, entry in items :
+               if name not in known :
+                  known.add(name)
+                  MaterialsList.append(name)
+
+def editMaterial(db, kind, name) :
+    # Create the object for a database entry so it can be edited
+    # from then on the entry is taken from the object
+    obj = db.Proxy.editedObject(db, kind, name)
+    if obj is not None :
+       return obj
+    entry = db.Proxy.entry(db, kind, name)
+    if entry is None :
+       raise KeyError(kind+' not found : '+name)
+    builder = {'isotope' : createIsotope, 'element' : createElement, \
+               'material' : createMaterial}[kind]
+    obj = builder(db, recordFromEntry(kind, entry))
+    db.Proxy.setEdited(db, kind, name, obj)
+    return obj
+
+##########################################################
+# Streaming import                                       #
+# The file is scanned once for the byte range of every   #
+# section entry. define, materials and setup are read    #
+# into compact GDMLRecords, solids and structure only    #
+# keep the byte ranges and an entry is parsed when it is #
+# looked up, the last few parsed are kept in a small LRU #
+# so memory follows what is instantiated not file size   #
+##########################################################
+
+pathPattern = re.compile( \
+         r"""^(\*|[\w:.-]+)(?:\[@(\w+)=(?:'([^']*)'|"([^"]*)")\])?$""")
+
+class GDMLRecord(object) :
+    '''Compact stand in for an lxml element used by the streaming import.
+       Supports the subset of the Element API used by the importer'''
+    __slots__ = ('tag', 'attrib', 'text', 'children')
+
+    def __init__(self, tag, attrib, text, children) :
+        self.tag = tag
+        self.attrib = attrib
+        self.text = text
+        self.children = children
+
+    def get(self, key, default=None) :
+        return self.attrib.get(key, default)
+
+    def getchildren(self) :
+        return self.children
+
+    def __iter__(self) :
+        return iter(self.children)
+
+    def __len__(self) :
+        return len(self.children)
+
+    def _match(self, path) :
+        # path steps separated by / each tag or * with optional
+        # [@attr='v'] or [@attr="v"]
+        step, sep, rest = path.partition('/')
+        m = pathPattern.match(step)
+        if m is None :
+           raise SyntaxError("Unsupported path : "+path)
+        tag, attr, single, double = m.groups()
+        value = single if single is not None else double
+        for child in self.children :
+            if tag != '*' and child.tag != tag :
+               continue
+            if attr is not None and child.attrib.get(attr) != value :
+               continue
+            if rest :
+               for c in child._match(rest) :
+                   yield c
+            else :
+               yield child
+
+    def find(self, path) :
+        for child in self._match(path) :
+            return child
+        return None
+
+    def findall(self, path) :
+        return list(self._match(path))
+
+def recordFromElement(elem) :
+    # Convert an lxml element and its children to GDMLRecords
+    # tag and attribute names are interned as they repeat endlessly
+    attrib = {}
+    for k, v in elem.attrib.items() :
+        attrib[sys.intern(k)] = v
+    children = [recordFromElement(c) for c in elem if isinstance(c.tag, str)]
+    text = elem.text
+    if text is not None and not text.strip() :
+       text = None
+    return GDMLRecord(sys.intern(elem.tag), attrib, text, children)
+
+def freeElement(elem) :
+    # Release an element and any already processed siblings
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None :
+       while elem.getprevious() is not None :
+          del parent[0]
+
+# Markup of a GDML file, only tags matter for the scan
+markupPattern = re.compile(br'''
+      <!--.*?-->
+    | <!\[CDATA\[.*?\]\]>
+    | <\?.*?\?>
+    | <!DOCTYPE(?:[^>\[]|(?P<subset>\[.*?\]))*>
+    | <(?P<close>/?)(?P<tag>[\w:.-]+)
+       (?P<attrs>(?:\s+[\w:.-]+\s*=\s*(?:"[^"]*"|'[^']*'))*)
+       \s*(?P<empty>/?)>''', re.S | re.X)
+namePattern = re.compile(br'''\sname\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+
+# Parsed entries kept per streamed section
+streamCacheSize = 4096
+
+class StreamedSection(object) :
+    '''Entries of a solids or structure section held as byte ranges of
+       the file, an entry is parsed into a GDMLRecord when it is used'''
+
+    def __init__(self, filename, tag, entries) :
+        self.filename = filename
+        self.tag = tag
+        self.attrib = {}
+        self.entries = entries     # list of (tag, name, start, end)
+        self.stat = self.fileStat()
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()     # walker and main thread both read
+
+    def fileStat(self) :
+        st = os.stat(self.filename)
+        return (st.st_size, st.st_mtime)
+
+    def get(self, key, default=None) :
+        return default
+
+    def record(self, start, end) :
+        with self.lock :
+           rec = self.cache.get(start)
+           if rec is not None :
+              self.cache.move_to_end(start)
+              return rec
+           if self.fileStat() != self.stat :
+              raise IOError('GDML file changed during import : '+ \
+                            self.filename)
+           rec = readSection(self.filename, start, end)
+           self.cache[start] = rec
+           if len(self.cache) > streamCacheSize :
+              self.cache.popitem(last=False)
+           return rec
+
+    def __iter__(self) :
+        for tag, name, start, end in self.entries :
+            yield self.record(start, end)
+
+    def __len__(self) :
+        return len(self.entries)
+
+    def findall(self, path) :
+        # Only plain tags, enough for loops
+        return [self.record(start, end) \
+                for tag, name, start, end in self.entries if tag == path]
+
+    def find(self, path) :
+        for rec in self.findall(path) :
+            return rec
+        return None
+
+    def index(self) :
+        index = StreamedIndex(self)
+        for tag, name, start, end in self.entries :
+            if name is not None :
+               index.setdefault((tag, name), (start, end))
+               index.setdefault(('*', name), (start, end))
+        return index
+
+class StreamedIndex(dict) :
+    '''Name index of a StreamedSection, values are byte ranges until
+       looked up. Records added later e.g. by loops are kept as is'''
+
+    def __init__(self, section) :
+        dict.__init__(self)
+        self.section = section
+
+    def resolve(self, value) :
+        if isinstance(value, tuple) :
+           return self.section.record(*value)
+        return value
+
+    def __getitem__(self, key) :
+        return self.resolve(dict.__getitem__(self, key))
+
+    def get(self, key, default=None) :
+        value = dict.get(self, key)
+        if value is None :
+           return default
+        return self.resolve(value)
+
+    def items(self) :
+        for key, value in dict.items(self) :
+            yield key, self.resolve(value)
+
+    def values(self) :
+        for value in dict.values(self) :
+            yield self.resolve(value)
+
+def sectionIndex(section) :
+    # Name index of a section read whole or streamed
+    if isinstance(section, StreamedSection) :
+       return section.index()
+    return GDMLShared.indexSection(section)
+
+def scanGDML(filename) :
+    # Byte ranges of the sections and their entries
+    # returns None if the file needs a real XML parser i.e. entities
+    import mmap, html
+    sections = []
+    entries = []
+    depth = 0
+    with io.open(filename, 'rb') as f :
+       data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+       try :
+          for m in markupPattern.finditer(data) :
+              if m.group('subset') is not None :
+                 return None
+              tag = m.group('tag')
+              if tag is None :
+                 continue
+              if m.group('close') :
+                 if depth == 3 :
+                    entries[-1][3] = m.end()
+                 elif depth == 2 :
+                    sections[-1][2] = m.end()
+                    sections[-1][3] = entries
+                    entries = []
+                 depth -= 1
+                 continue
+              depth += 1
+              if depth == 2 :
+                 sections.append([tag.decode(), m.start(), m.end(), []])
+              elif depth == 3 :
+                 name = namePattern.search(m.group('attrs'))
+                 if name is not None :
+                    name = html.unescape((name.group(1) \
+                           if name.group(1) is not None \
+                           else name.group(2)).decode('utf-8'))
+                 entries.append([tag.decode(), name, m.start(), m.end()])
+              if m.group('empty') :
+                 depth -= 1
+       finally :
+          data.close()
+    return sections
+
+def readSection(filename, start, end) :
+    from lxml import etree
+    with io.open(filename, 'rb') as f :
+       f.seek(start)
+       data = f.read(end - start)
+    return recordFromElement(etree.fromstring(data))
+
+def streamGDML(filename) :
+    # Returns a dictionary of section name -> GDMLRecord or
+    # StreamedSection for solids and structure
+    from lxml import etree
+    try :
+       scan = scanGDML(filename)
+       if scan is None :
+          return iterparseGDML(filename)
+       sections = {}
+       for tag, start, end, entries in scan :
+           if tag in ('solids', 'structure') :
+              sections[tag] = StreamedSection(filename, tag, \
+                    [tuple(e) for e in entries])
+           else :
+              sections[tag] = readSection(filename, start, end)
+           GDMLShared.debug("Streamed section : %s entries : %s", \
+                            tag, len(entries))
+       return sections
+    except (etree.XMLSyntaxError, ValueError) :
+       # e.g. namespace prefixes declared on the root element
+       return iterparseGDML(filename)
+
+def iterparseGDML(filename) :
+    # Returns a dictionary of section name -> GDMLRecord
+    # Only one section entry is held as an lxml element at any time
+    from lxml import etree
+    sections = {}
+    entries = []
+    depth = 0
+    context = etree.iterparse(filename, events=('start','end'), \
+                    resolve_entities=True, remove_comments=True)
+    for event, elem in context :
+        if event == 'start' :
+           depth += 1
+           continue
+        # end event
+        if depth == 3 :     # entry of a section e.g. <position> or <box>
+           entries.append(recordFromElement(elem))
+           freeElement(elem)
+        elif depth == 2 :   # section e.g. <define> or <solids>
+           attrib = dict(elem.attrib)
+           sections[elem.tag] = GDMLRecord(elem.tag, attrib, None, entries)
+           GDMLShared.debug("Streamed section : %s entries : %s", \
+                            elem.tag, len(entries))
+           entries = []
+           freeElement(elem)
+        depth -= 1
+    del context
+    return sections
+
+##########################################################
+# Update from file                                       #
+# An import keeps digests of the evaluated solid,        #
+# material and daughters of each volume. Update reads    #
+# the file again, compares volumes by name and only      #
+# touches the parts of changed volumes : solids are      #
+# rebuilt, materials set, daughters matched by volume    #
+# name so moved ones just get a new placement. The       #
+# record is also kept as JSON on the first root part so  #
+# a saved document can still be updated once reopened    #
+##########################################################
+
+# Document name -> record of last import / update
+global importRecords, fileWatcher, pendingUpdates
+importRecords = {}
+fileWatcher = None
+pendingUpdates = set()
+
+# Elements refering to a define by name
+defineRefs = {'positionref' : 'position', 'rotationref' : 'rotation', \
+              'scaleref' : 'scale', 'firstpositionref' : 'position', \
+              'firstrotationref' : 'rotation'}
+vertexAttribs = set(['vertex1', 'vertex2', 'vertex3', 'vertex4'])
+
+def valueKey(elem) :
+    # Tag, evaluated attributes and children as nested tuples, defines
+    # refered to by name are replaced by their values
+    if elem is None :
+       return None
+    attrib = []
+    for k, v in sorted(elem.attrib.items()) :
+        if k in vertexAttribs :
+           v = valueKey(GDMLShared.getDefine('position', v))
+        elif k not in textAttribs :
+           try :
+              v = GDMLShared.evalExpr(v)
+           except Exception :
+              pass
+        attrib.append((k, v))
+    if elem.tag in defineRefs :
+       attrib.append(valueKey(GDMLShared.getDefine(defineRefs[elem.tag], \
+                                                   elem.get('ref'))))
+    children = tuple(valueKey(c) for c in elem if isinstance(c.tag, str))
+    return (elem.tag, tuple(attrib), children)
+
+def digest(key) :
+    import hashlib
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+def solidDigest(name, digests) :
+    # Booleans include the digests of their components
+    d = digests.get(name)
+    if d is None :
+       solid = solidsIndex.get(('*', name))
+       key = valueKey(solid)
+       if solid is not None and \
+             solid.tag in ["subtraction","union","intersection"] :
+          key = (key, solidDigest(GDMLShared.getRef(solid,'first'), digests), \
+                 solidDigest(GDMLShared.getRef(solid,'second'), digests))
+       d = digests[name] = digest(key)
+    return d
+
+def volumeDigests(roots) :
+    # volume name -> (solid digest, material, daughters digest)
+    solidDigests = {}
+    volumes = {}
+    for name in usedVolumes(structureIndex, roots) :
+        vol = getStructure('volume', name)
+        solid = material = None
+        if vol is not None :
+           solidref = GDMLShared.getRef(vol,"solidref")
+           if solidref is not None :
+              solid = solidDigest(solidref, solidDigests)
+           material = GDMLShared.getRef(vol,"materialref")
+        else :
+           vol = getStructure('assembly', name)
+           if vol is None :
+              continue
+        daughters = [valueKey(pv) for pv in volumeDaughters(vol) \
+                     if pv.tag in daughterTags]
+        # Divisions depend on the mother solid
+        if vol.find("divisionvol") is not None :
+           daughters.append(solid)
+        volumes[name] = (solid, material, digest(daughters))
+    return volumes
+
+def recordImport(doc, filename, stream, roots, referenced, holder) :
+    # holder - name of the part the record is stored on
+    importRecords[doc.Name] = { \
+          'filename' : os.path.abspath(filename), 'stream' : stream, \
+          'roots' : roots, 'referenced' : referenced, \
+          'importFilter' : importFilter, 'volumeParts' : volumeParts, \
+          'volumes' : volumeDigests(roots), 'holder' : holder }
+    storeRecord(doc)
+
+def filterState(f) :
+    region = f.region
+    if isinstance(region, BoxRegion) :
+       region = ['box'] + list(region.bounds)
+    elif isinstance(region, CylinderRegion) :
+       region = ['cylinder', region.radius, region.zmin, region.zmax, \
+                 region.x, region.y]
+    return {'roots' : f.roots, 'maxDepth' : f.maxDepth, \
+            'include' : f.include, 'exclude' : f.exclude, 'region' : region}
+
+def filterFromState(state) :
+    region = state['region']
+    if region is not None :
+       regionClass = BoxRegion if region[0] == 'box' else CylinderRegion
+       region = regionClass(*region[1:])
+    return ImportFilter(state['roots'], state['maxDepth'], \
+                        state['include'], state['exclude'], region)
+
+def storeRecord(doc) :
+    # Keep the record on the document, saved with it
+    import json
+    record = importRecords[doc.Name]
+    holder = doc.getObject(record['holder']) if record['holder'] else None
+    if holder is None :
+       return
+    state = dict(record, importFilter = filterState(record['importFilter']))
+    if not hasattr(holder, 'GDMLImport') :
+       holder.addProperty("App::PropertyString","GDMLImport","GDML", \
+                          "Record of the import for update from file")
+       holder.setEditorMode("GDMLImport", 2)
+    holder.GDMLImport = json.dumps(state)
+
+def importRecord(doc) :
+    # Record of the last import, read from the document once reopened
+    import json
+    record = importRecords.get(doc.Name)
+    if record is not None :
+       return record
+    for obj in doc.RootObjects :
+        if hasattr(obj, 'GDMLImport') :
+           record = json.loads(obj.GDMLImport)
+           record['importFilter'] = filterFromState(record['importFilter'])
+           record['volumes'] = dict((k, tuple(v)) for k, v in \
+                                    record['volumes'].items())
+           importRecords[doc.Name] = record
+           return record
+    return None
+
+def partVolume(obj) :
+    # Volume name of a part or link created by the import
+    if obj.TypeId == 'App::Link' :
+       obj = obj.LinkedObject
+    if obj is None :
+       return None
+    return volumeParts.get(obj.Name)
+
+def volumeSolids(part) :
+    # Solid of the volume, for booleans with its components
+    return [obj for obj in part.Group \
+            if obj.TypeId not in ('App::Part', 'App::Link')]
+
+def partDepth(part) :
+    depth = 0
+    parent = part.getParentGeoFeatureGroup()
+    while parent is not None :
+       depth += 1
+       parent = parent.getParentGeoFeatureGroup()
+    return depth
+
+def partDisplayMode(part) :
+    # Display mode parseVolume gave the solid of part
+    if hasattr(part, 'DisplayMode') :
+       return part.DisplayMode
+    parent = part.getParentGeoFeatureGroup()
+    if parent is None or partVolume(parent) is None :
+       return 3
+    if getStructure('volume', partVolume(parent)) is not None :
+       return 1
+    return partDisplayMode(parent)
+
+def updateSolid(part, name) :
+    doc = part.Document
+    if isPlaceholder(part) and not part.Expanded :
+       return          # Built from the new file when expanded
+    for obj in volumeSolids(part) :
+        # With the objects it holds i.e. polycone zplanes
+        if hasattr(obj, 'removeObjectsFromDocument') :
+           obj.removeObjectsFromDocument()
+        doc.removeObject(obj.Name)
+    vol = getStructure('volume', name)
+    solidref = GDMLShared.getRef(vol,"solidref")
+    material = GDMLShared.getRef(vol,"materialref")
+    if solidref is not None and importFilter.buildSolid(name, material) :
+       createSolid(part,getSolid(solidref),material,0,0,0,None, \
+                   partDisplayMode(part))
+
+def updateMaterial(part, material) :
+    from GDMLObjects import MaterialsList
+    if material not in MaterialsList :
+       return
+    for obj in volumeSolids(part) :
+        if hasattr(obj, 'material') :
+           # Enumeration may not have the materials added since
+           obj.material = MaterialsList
+           obj.material = MaterialsList.index(material)
+
+def removeVolumePart(obj) :
+    # Other placements link to the part of the first placement, if there
+    # are any the part takes the place of one of the links
+    doc = obj.Document
+    if obj.TypeId == 'App::Part' :
+       links = [o for o in obj.InList \
+                if o.TypeId == 'App::Link' and o.LinkedObject == obj]
+       if len(links) > 0 :
+          link = links[0]
+          link.getParentGeoFeatureGroup().addObject(obj)
+          obj.Placement = link.Placement
+          obj.Visibility = True        # May be the cell of an array
+          doc.removeObject(link.Name)
+          return
+       obj.removeObjectsFromDocument()
+    doc.removeObject(obj.Name)
+
+def updateDaughters(part, name) :
+    # Daughters are matched by volume name in order, matched ones keep
+    # their objects and only get the new placement. Replicated volumes
+    # are built again
+    global volumeDepth, volumePlacement
+    vol = getStructure('volume', name)
+    if vol is None :
+       vol = getStructure('assembly', name)
+    placeholder = isPlaceholder(part)
+    current = {}
+    for obj in part.Group :
+        volref = partVolume(obj)
+        if volref is not None :
+           current.setdefault(volref, []).append(obj)
+    volumeDepth = partDepth(part)
+    volumePlacement = part.getGlobalPlacement()
+    for pv in volumeDaughters(vol) :
+        if pv.tag in replicaTags :
+           volref = GDMLShared.getRef(pv,"volumeref")
+           # Arrays before the cell they link to
+           objs = sorted(current.pop(volref, []), \
+                         key = lambda o : o.TypeId != 'App::Link')
+           if volDict.get(volref) in objs :
+              del volDict[volref]
+           for obj in objs :
+               removeVolumePart(obj)
+           parseReplicated(part,pv,vol,1)
+           continue
+        if pv.tag != 'physvol' or pv.find("file") is not None :
+           continue            # Placements of other files are kept
+        objs = current.get(GDMLShared.getRef(pv,"volumeref"))
+        if objs :
+           obj = objs.pop(0)
+           px, py, pz, rot = getPhysVolPosRot(pv)
+           placement = GDMLShared.processPlacement( \
+                             FreeCAD.Vector(px,py,pz),rot)
+           if not obj.Placement.isSame(placement) :
+              obj.Placement = placement
+        elif placeholder :
+           parseLazyPhysVol(part,pv,1,volumeDepth,volumePlacement)
+        else :
+           parsePhysVol(part,pv,1)
+    for objs in current.values() :
+        for obj in objs :
+            removeVolumePart(obj)
+
+def updateConstants(doc) :
+    from GDMLObjects import GDMLconstant
+    constantGrp = doc.getObject("Constants")
+    if constantGrp is None or GDMLShared.define is None :
+       return
+    present = dict((obj.name, obj) for obj in constantGrp.Group \
+                   if hasattr(obj, 'name'))
+    for cdefine in GDMLShared.define.findall('constant') :
+        name = str(cdefine.get('name'))
+        value = cdefine.get('value')
+        obj = present.get(name)
+        if obj is None :
+           obj = constantGrp.newObject("App::DocumentObjectGroupPython",name)
+           GDMLconstant(obj,name,value)
+        elif obj.value != value :
+           obj.value = value
+
+def updateMaterials(doc, materials) :
+    # New entries are added, changed entries of the material table
+    # replaced. Without a table only new materials are added
+    from GDMLObjects import findMaterialDB
+    db = findMaterialDB(doc)
+    if db is None or materials is None :
+       addMaterials(doc, materials)
+       return 0
+    changed = 0
+    for kind in db.Proxy.kinds :
+        items = [(e.get('name'), entryFromElement(e)) \
+                 for e in materials.findall(kind)]
+        changed += len(db.Proxy.replaceEntries(db, kind, items))
+    addMaterialsDB(db, materials)
+    return changed
+
+def updateFromFile(doc, filename=None) :
+    '''Apply the changes of the GDML file doc was imported from,
+       returns the number of volumes updated'''
+    global importFilter, volumeDepth, volumePlacement, volDict
+    global materials, pathName, volumeParts
+    import GDMLObjects
+    record = importRecord(doc)
+    if record is None :
+       GDMLShared.error('No GDML import for document : %s , import the '
+                        'file again', doc.Name)
+       return 0
+    if filename is None :
+       filename = record['filename']
+    GDMLShared.info('Update from GDML file : %s', filename)
+    pathName = os.path.dirname(os.path.normpath(filename))
+    importFilter = record['importFilter']
+    volumeDepth = 0
+    stream = record['stream']
+    setSections(readGDML(filename, stream))
+    GDMLShared.resolveDefines(GDMLShared.define)
+    indexLoops(solidsIndex, solids)
+    indexLoops(structureIndex, structure)
+    roots = record['roots']
+    volumeParts = record['volumeParts']
+    oldVolumes = record['volumes']
+    newVolumes = volumeDigests(roots)
+
+    materials = usedMaterials(materials, structureIndex, roots, \
+                              record['referenced'])
+    changedMaterials = updateMaterials(doc, materials)
+    updateConstants(doc)
+    loadFiles(doc, fileReferences(saveContext(), pathName), stream, \
+              record['referenced'])
+
+    # Parts of each volume, first one for links to new placements
+    parts = {}
+    volDict = {}
+    for objName, name in volumeParts.items() :
+        obj = doc.getObject(objName)
+        if obj is not None :
+           parts.setdefault(name, []).append(objName)
+           volDict.setdefault(name, obj)
+    solidCount = daughterCount = 0
+    with GDMLObjects.batchEdit() :
+       for name, (solid, material, daughters) in newVolumes.items() :
+           old = oldVolumes.get(name)
+           if old is None or old == (solid, material, daughters) :
+              continue
+           for objName in parts.get(name, []) :
+               part = doc.getObject(objName)
+               if part is None :
+                  continue            # Removed with its parent
+               if old[0] != solid :
+                  updateSolid(part, name)
+                  solidCount += 1
+               elif old[1] != material :
+                  updateMaterial(part, material)
+               if old[2] != daughters :
+                  updateDaughters(part, name)
+                  daughterCount += 1
+    record['volumes'] = newVolumes
+    for objName in [n for n in volumeParts if doc.getObject(n) is None] :
+        del volumeParts[objName]
+    storeRecord(doc)
+    if doc.Name in lazyContexts :
+       lazyContexts[doc.Name] = saveContext()
+    doc.recompute()
+    GDMLShared.info('GDML update : %s solids rebuilt, %s volumes '
+                    'restructured, %s materials changed', solidCount, \
+                    daughterCount, changedMaterials)
+    return solidCount + daughterCount
+
+def watchFile(filename) :
+    # Update the documents imported from filename when it is saved
+    global fileWatcher
+    if not gui :
+       return
+    from PySide import QtCore
+    filename = os.path.abspath(filename)
+    if fileWatcher is None :
+       fileWatcher = QtCore.QFileSystemWatcher()
+       fileWatcher.fileChanged.connect(watchedFileChanged)
+    if filename not in fileWatcher.files() :
+       fileWatcher.addPath(filename)
+
+def watchedFileChanged(path) :
+    # Editors may replace the file rather than write it, watch the new
+    # one and wait for writing to finish
+    from PySide import QtCore
+    if os.path.exists(path) and path not in fileWatcher.files() :
+       fileWatcher.addPath(path)
+    if path not in pendingUpdates :
+       pendingUpdates.add(path)
+       QtCore.QTimer.singleShot(500, lambda : updateWatched(path))
+
+def updateWatched(path) :
+    pendingUpdates.discard(path)
+    if not os.path.exists(path) :
+       return
+    for docName, record in list(importRecords.items()) :
+        if record['filename'] != path :
+           continue
+        try :
+           doc = FreeCAD.getDocument(docName)
+        except NameError :
+           del importRecords[docName]
+           continue
+        # Called from the event loop, the file may be half written
+        try :
+           updateFromFile(doc)
+        except Exception as e :
+           GDMLShared.error('Update from %s failed : %s', path, e)
+
+##########################################################
+# Import progress                                        #
+# Phases are timed, volumes and solids per type counted. #
+# A callback gets each event and may cancel the import,  #
+# cancelling is checked between volumes                  #
+##########################################################
+
+class ImportCancelled(Exception) :
+    pass
+
+class ImportProgress(object) :
+    '''Progress of an import i.e.
+          def report(progress, event, name) :
+              if event == 'volume' and progress.volumes > 1000 :
+                 progress.cancel()
+          processGDML(doc, filename, progress=ImportProgress(report))
+       events are 'phase', 'volume' and 'solid' '''
+
+    def __init__(self, callback=None) :
+        self.callback = callback
+        self.phases = []          # (name, seconds)
+        self.phase = None
+        self.phaseStart = None
+        self.solidCounts = {}
+        self.volumes = 0
+        self.cancelled = False
+        self.indicator = None
+        self.total = 0
+
+    def cancel(self) :
+        self.cancelled = True
+
+    def notify(self, event, name) :
+        if self.callback is not None :
+           self.callback(self, event, name)
+
+    def startPhase(self, name, steps=0) :
+        import time
+        self.endPhase()
+        self.phase = name
+        self.phaseStart = time.time()
+        GDMLShared.info('GDML import : %s', name)
+        if steps > 0 :
+           try :
+              self.indicator = FreeCAD.Base.ProgressIndicator()
+              self.indicator.start('GDML import : '+name, steps)
+           except Exception :
+              self.indicator = None
+        self.notify('phase', name)
+
+    def endPhase(self) :
+        import time
+        if self.phase is not None :
+           self.phases.append((self.phase, time.time() - self.phaseStart))
+           self.phase = None
+        if self.indicator is not None :
+           self.indicator.stop()
+           self.indicator = None
+
+    def volume(self, name) :
+        # Called before each volume is built
+        if self.cancelled :
+           raise ImportCancelled(name)
+        self.volumes += 1
+        if self.indicator is not None :
+           self.indicator.next()
+        self.notify('volume', name)
+        if self.cancelled :
+           raise ImportCancelled(name)
+
+    def solid(self, tag) :
+        self.solidCounts[tag] = self.solidCounts.get(tag, 0) + 1
+        self.notify('solid', tag)
+
+    def report(self) :
+        self.endPhase()
+        for name, seconds in self.phases :
+            GDMLShared.info('  %-12s %8.3f s', name, seconds)
+        GDMLShared.info('  volumes      %8d', self.volumes)
+        for tag in sorted(self.solidCounts) :
+            GDMLShared.info('  %-12s %8d', tag, self.solidCounts[tag])
+
+global importProgress
+importProgress = None
+
+def setSections(sections) :
+    # Globals for the sections of the file being imported
+    global setup, materials, solids, structure, volDict, volumeParts
+    global solidsIndex, structureIndex, evaluatedSolids, boundsCache
+    setup     = sections.get('setup')
+    GDMLShared.debug("Call set Define")
+    GDMLShared.setDefine(sections.get('define'))
+    materials = sections.get('materials')
+    solids    = sections.get('solids')
+    structure = sections.get('structure')
+    # Name indexes built once, all reference lookups go through them
+    solidsIndex = sectionIndex(solids)
+    structureIndex = sectionIndex(structure)
+    evaluatedSolids = {}
+    boundsCache = {}
+
+    # volDict dictionary of volume names and associated FreeCAD part
+    volDict = {}
+    volumeParts = {}
+
+def rootVolumes() :
+    # World or the roots of the import filter
+    world = GDMLShared.getRef(setup,"world")
+    #print(world)
+    roots = []
+    for name in importFilter.roots or [world] :
+        if getStructure('volume', name) is None and \
+           getStructure('assembly', name) is None :
+           GDMLShared.error('Volume not found : %s', name)
+        else :
+           roots.append(name)
+    return roots
+
+def processGDML(doc,filename,stream=None,threads=None,lazy=None, \
+                progress=None,volumeFilter=None):
 
     import GDMLShared
     import GDMLObjects
 
     params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
-    GDMLShared.printverbose = params.GetBool('printVerbose',False)
-    print("Print Verbose : "+ str(GDMLShared.printverbose))
+    GDMLShared.setVerbose(params.GetBool('printVerbose',False))
+    GDMLShared.resetCounts()
+    GDMLShared.debug("Print Verbose : %s", GDMLShared.printverbose)
 
     FreeCAD.Console.PrintMessage('Import GDML file : '+filename+'\n')
     FreeCAD.Console.PrintMessage('ImportGDML Version 0.2\n')
@@ -842,7 +3106,17 @@ def processGDML(doc,filename):
     pathName = os.path.dirname(os.path.normpath(filename))
     FilesEntity = False
 
-    global setup, materials, solids, structure, volDict
+    global materials, importProgress
+    global importFilter, volumeDepth, volumePlacement
+    # Which volumes to import, see ImportFilter
+    if volumeFilter is None :
+       volumeFilter = ImportFilter()
+    importFilter = volumeFilter
+    volumeDepth = 0
+    # progress can be an ImportProgress or just a callback
+    if progress is None or callable(progress) :
+       progress = ImportProgress(progress)
+    importProgress = progress
   
   # Add files object so user can change to organise files
   #  from GDMLObjects import GDMLFiles, ViewProvider
@@ -850,32 +3124,80 @@ def processGDML(doc,filename):
     #myfiles = doc.addObject("App::DocumentObjectGroupPython","Export_Files")
     #GDMLFiles(myfiles,FilesEntity,sectionDict)
 
-    from lxml import etree
-    #root = etree.fromstring(currentString)
-    parser = etree.XMLParser(resolve_entities=True)
-    root = etree.parse(filename, parser=parser)
-
-    setup     = root.find('setup')
-    print("Call set Define")
-    GDMLShared.setDefine(root.find('define'))
-    materials = root.find('materials')
-    solids    = root.find('solids')
-    structure = root.find('structure')
-
-    # volDict dictionary of volume names and associated FreeCAD part
-    volDict = {}
-
-    GDMLShared.processConstants(doc)
-    GDMLShared.trace(setup.attrib)
-    processIsotopes(doc)
-    processElements(doc)
-    processMaterials(doc)
-
-    world = GDMLShared.getRef(setup,"world")
-    #print(world)
-    part =doc.addObject("App::Part",world)
-    parseVolume(part,world,0,0,0,None,3)
-
-    doc.recompute()
-    FreeCADGui.SendMsgToActiveView("ViewFit")
+    # stream option - read sections with iterparse into compact records
+    # rather than holding the whole lxml tree during the import
+    if stream is None :
+       stream = params.GetBool('streamImport',False)
+
+    if stream :
+       GDMLShared.info('Streaming import')
+    try :
+       progress.startPhase('parse')
+       setSections(readGDML(filename, stream))
+
+       progress.startPhase('constants')
+       GDMLShared.processConstants(doc)
+       indexLoops(solidsIndex, solids)
+       indexLoops(structureIndex, structure)
+       GDMLShared.debug("%s", setup.attrib)
+
+       roots = rootVolumes()
+
+       referenced = params.GetBool('referencedMaterials',False)
+       materials = usedMaterials(materials, structureIndex, roots, referenced)
+       if params.GetBool('compactMaterials',False) :
+          progress.startPhase('materials')
+          processMaterialsDB(doc)
+       else :
+          progress.startPhase('isotopes')
+          processIsotopes(doc)
+          progress.startPhase('elements')
+          processElements(doc)
+          progress.startPhase('materials')
+          processMaterials(doc)
+       # Files referenced by physvols
+       progress.startPhase('files')
+       loadFiles(doc, fileReferences(saveContext(), pathName), stream, \
+                 referenced)
+
+       if lazy is None :
+          lazy = params.GetBool('lazyImport',False)
+       if threads is None :
+          threads = params.GetBool('threadedImport',False)
+       progress.startPhase('structure', len(structureIndex) // 2)
+       # Shapes are built once when the batch closes, not per property set
+       try :
+          rootParts = []
+          with GDMLObjects.batchEdit() :
+             for root in roots :
+                 volumePlacement = FreeCAD.Placement()
+                 part = doc.addObject("App::Part",root)
+                 volumeParts[part.Name] = root
+                 rootParts.append(part.Name)
+                 if lazy :
+                    lazyImport(doc,part,root)
+                 elif threads :
+                    ImportPipeline().run(part,root)
+                 else :
+                    parseVolume(part,root,0,0,0,None,3)
+       except ImportCancelled as e :
+          # Objects created so far are kept, cut short parts are removed
+          # or labelled incomplete
+          GDMLShared.warning('GDML import cancelled at volume : %s', e)
+
+       progress.startPhase('recompute')
+       doc.recompute()
+       recordImport(doc, filename, stream, roots, referenced, \
+                    rootParts[0] if len(rootParts) > 0 else None)
+       if params.GetBool('watchImportedFile',False) :
+          watchFile(filename)
+       progress.report()
+    finally :
+       # Whatever happened nothing reports to this import any more
+       progress.endPhase()
+       importProgress = None
+    if gui :
+       FreeCADGui.SendMsgToActiveView("ViewFit")
     FreeCAD.Console.PrintMessage('End processing GDML file\n')
+    # Number of errors reported while importing
+    return GDMLShared.logCounts[GDMLShared.ERROR]
@@ -0,0 +1,161 @@
+# Tests of the parts of the workbench that do not need OCC shapes,
+# run with pytest from the workbench directory.
+#
+# Without FreeCAD a minimal stand in for the FreeCAD and Part modules
+# is installed : vectors, rotations and placements with real maths,
+# a console that records messages and default preferences. It is only
+# used by these tests, the workbench always runs with FreeCAD itself.
+
+import os, sys, math, types
+import pytest
+
+sys.path.insert(0, \
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Vector(object) :
+    def __init__(self, x=0., y=0., z=0.) :
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __getitem__(self, i) :
+        return (self.x, self.y, self.z)[i]
+
+    def __add__(self, v) :
+        return Vector(self.x + v.x, self.y + v.y, self.z + v.z)
+
+    def __sub__(self, v) :
+        return Vector(self.x - v.x, self.y - v.y, self.z - v.z)
+
+    def __repr__(self) :
+        return 'Vector(%s, %s, %s)' % (self.x, self.y, self.z)
+
+def matmul(a, b) :
+    return [[sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)] \
+            for i in range(3)]
+
+class Rotation(object) :
+    # Rotation() or Rotation(axis, degrees), as a 3x3 matrix
+    def __init__(self, axis=None, angle=0.) :
+        self.m = [[1., 0., 0.], [0., 1., 0.], [0., 0., 1.]]
+        if axis is None :
+           return
+        n = math.sqrt(axis.x ** 2 + axis.y ** 2 + axis.z ** 2)
+        x, y, z = axis.x / n, axis.y / n, axis.z / n
+        a = math.radians(angle)
+        c, s, t = math.cos(a), math.sin(a), 1 - math.cos(a)
+        self.m = [[t*x*x + c,   t*x*y - s*z, t*x*z + s*y], \
+                  [t*x*y + s*z, t*y*y + c,   t*y*z - s*x], \
+                  [t*x*z - s*y, t*y*z + s*x, t*z*z + c]]
+
+    def multiply(self, r) :
+        result = Rotation()
+        result.m = matmul(self.m, r.m)
+        return result
+
+    def multVec(self, v) :
+        m = self.m
+        return Vector(*[m[i][0] * v.x + m[i][1] * v.y + m[i][2] * v.z \
+                        for i in range(3)])
+
+    def inverted(self) :
+        result = Rotation()
+        result.m = [list(r) for r in zip(*self.m)]
+        return result
+
+    def toEuler(self) :
+        # yaw, pitch, roll in degrees, R = Rz(yaw) Ry(pitch) Rx(roll)
+        m = self.m
+        pitch = math.asin(max(-1., min(1., -m[2][0])))
+        yaw = math.atan2(m[1][0], m[0][0])
+        roll = math.atan2(m[2][1], m[2][2])
+        return tuple(math.degrees(a) for a in (yaw, pitch, roll))
+
+    @property
+    def Angle(self) :
+        m = self.m
+        c = (m[0][0] + m[1][1] + m[2][2] - 1) / 2
+        return math.acos(max(-1., min(1., c)))
+
+class Placement(object) :
+    def __init__(self, base=None, rotation=None) :
+        self.Base = base if base is not None else Vector()
+        self.Rotation = rotation if rotation is not None else Rotation()
+
+    def multiply(self, p) :
+        return Placement(self.Base + self.Rotation.multVec(p.Base), \
+                         self.Rotation.multiply(p.Rotation))
+
+    def multVec(self, v) :
+        return self.Base + self.Rotation.multVec(v)
+
+class Console(object) :
+    messages = []
+
+    @classmethod
+    def PrintMessage(cls, msg) :
+        cls.messages.append(('message', msg))
+
+    @classmethod
+    def PrintWarning(cls, msg) :
+        cls.messages.append(('warning', msg))
+
+    @classmethod
+    def PrintError(cls, msg) :
+        cls.messages.append(('error', msg))
+
+class Parameters(object) :
+    # Every preference at its default
+    def GetBool(self, name, default=False) :
+        return default
+
+    def GetInt(self, name, default=0) :
+        return default
+
+    def GetFloat(self, name, default=0.) :
+        return default
+
+    def GetString(self, name, default='') :
+        return default
+
+def installFreeCAD() :
+    FreeCAD = types.ModuleType('FreeCAD')
+    FreeCAD.Vector = Vector
+    FreeCAD.Rotation = Rotation
+    FreeCAD.Placement = Placement
+    FreeCAD.Console = Console
+    FreeCAD.GuiUp = False
+    FreeCAD.ParamGet = lambda path : Parameters()
+    sys.modules['FreeCAD'] = FreeCAD
+    sys.modules['Part'] = types.ModuleType('Part')
+
+try :
+   import FreeCAD, Part
+except ImportError :
+   installFreeCAD()
+
+@pytest.fixture(autouse=True)
+def cleanState() :
+    # Each test starts with an empty expression namespace, no logged
+    # messages and the default import filter
+    import GDMLShared, importGDML
+    GDMLShared.resetNamespace()
+    GDMLShared.resetCounts()
+    importGDML.importFilter = importGDML.ImportFilter()
+    importGDML.volumeDepth = 0
+    yield
+
+@pytest.fixture
+def gdml(tmp_path) :
+    # Sets the importer's sections from GDML text, as an import does
+    # before building volumes, returns the sections
+    import importGDML, GDMLShared
+    def load(text, stream=False) :
+        path = tmp_path / 'test.gdml'
+        path.write_text(text)
+        sections = importGDML.readGDML(str(path), stream)
+        importGDML.setSections(sections)
+        GDMLShared.resolveDefines(GDMLShared.define)
+        importGDML.indexLoops(importGDML.solidsIndex, importGDML.solids)
+        importGDML.indexLoops(importGDML.structureIndex, \
+                              importGDML.structure)
+        return sections
+    return load
@@ -0,0 +1,60 @@
+# Scalar defines resolved in dependency order, cycles reported
+
+import pytest
+import GDMLShared
+from importGDML import GDMLRecord
+
+def defineSection(*entries) :
+    # entries ( tag, attributes ) or ( tag, attributes, text )
+    children = [GDMLRecord(e[0], e[1], e[2] if len(e) > 2 else None, []) \
+                for e in entries]
+    return GDMLRecord('define', {}, None, children)
+
+def errors() :
+    return GDMLShared.logCounts[GDMLShared.ERROR]
+
+def test_any_order() :
+    values = GDMLShared.resolveDefines(defineSection( \
+            ('constant', {'name' : 'b', 'value' : 'a*2'}), \
+            ('variable', {'name' : 'c', 'value' : 'b+a'}), \
+            ('constant', {'name' : 'a', 'value' : '3'}), \
+            ('quantity', {'name' : 'q', 'value' : 'b', 'unit' : 'cm'}), \
+            ('expression', {'name' : 'e'}, ' q/2 ')))
+    assert values == {'a' : 3., 'b' : 6., 'c' : 9., 'q' : 60., 'e' : 30.}
+    assert GDMLShared.evalExpr('a+e') == 33.
+    assert errors() == 0
+
+def test_first_definition_wins() :
+    values = GDMLShared.resolveDefines(defineSection( \
+            ('constant', {'name' : 'a', 'value' : '1'}), \
+            ('constant', {'name' : 'a', 'value' : '2'})))
+    assert values == {'a' : 1.}
+
+def test_cycle_reported() :
+    values = GDMLShared.resolveDefines(defineSection( \
+            ('constant', {'name' : 'a', 'value' : 'b+1'}), \
+            ('constant', {'name' : 'b', 'value' : 'a+1'}), \
+            ('constant', {'name' : 'c', 'value' : 'a*2'}), \
+            ('constant', {'name' : 'd', 'value' : '1'})))
+    # c only depends on the cycle, it is dropped not reported again
+    assert values == {'d' : 1.}
+    assert errors() == 1
+
+def test_self_reference() :
+    assert GDMLShared.findCycle({'a' : set(['a'])}, set(['a'])) == \
+           ['a', 'a']
+    GDMLShared.resolveDefines(defineSection( \
+            ('variable', {'name' : 'a', 'value' : 'a+1'})))
+    assert errors() == 1
+
+def test_bad_define_reported() :
+    values = GDMLShared.resolveDefines(defineSection( \
+            ('constant', {'name' : 'a', 'value' : 'unknown+1'}), \
+            ('constant', {'name' : 'b', 'value' : '1+'}), \
+            ('constant', {'name' : 'c'}), \
+            ('constant', {'name' : 'd', 'value' : '2'})))
+    assert values == {'d' : 2.}
+    assert errors() == 3
+
+def test_no_defines() :
+    assert GDMLShared.resolveDefines(None) == {}
@@ -0,0 +1,152 @@
+# Export of an imported document : volumes placed in the world with the
+# placement of their parts, once more for each link
+
+import re, types
+import pytest
+import FreeCAD
+import importGDML, exportGDML, GDMLShared
+
+nestedFile = '''<?xml version="1.0"?>
+<gdml>
+ <define/>
+ <materials/>
+ <solids>
+  <box name="WorldBox" x="1000" y="1000" z="1000"/>
+  <box name="ABox" x="50" y="50" z="50"/>
+  <box name="BBox" x="5" y="5" z="5"/>
+ </solids>
+ <structure>
+  <volume name="B">
+   <materialref ref="G4_Si"/>
+   <solidref ref="BBox"/>
+  </volume>
+  <volume name="A">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="ABox"/>
+   <physvol>
+    <volumeref ref="B"/>
+    <position name="BPos" x="1" unit="cm"/>
+   </physvol>
+  </volume>
+  <volume name="World">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="WorldBox"/>
+   <physvol>
+    <volumeref ref="A"/>
+    <position name="A1Pos" x="100"/>
+    <rotation name="A1Rot" z="90" unit="deg"/>
+   </physvol>
+   <physvol>
+    <volumeref ref="A"/>
+    <position name="A2Pos" x="-100"/>
+   </physvol>
+  </volume>
+ </structure>
+ <setup name="Default" version="1.0">
+  <world ref="World"/>
+ </setup>
+</gdml>
+'''
+
+class Document(object) :
+    # Objects, parts and links as far as import and export use them
+    def __init__(self) :
+        self.Objects = []
+
+    @property
+    def RootObjects(self) :
+        return [obj for obj in self.Objects if len(obj.InList) == 0]
+
+    def addObject(self, typeId, name) :
+        name = re.sub(r'\W', '_', name)
+        names = set(obj.Name for obj in self.Objects)
+        unique, n = name, 0
+        while unique in names :
+           n += 1
+           unique = '%s%03d' % (name, n)
+        obj = DocObject(self, typeId, unique)
+        self.Objects.append(obj)
+        return obj
+
+class DocObject(object) :
+    def __init__(self, doc, typeId, name) :
+        self.Document, self.TypeId, self.Name = doc, typeId, name
+        self.Label = name
+        self.Placement = FreeCAD.Placement()
+        self.Visibility = True
+        self.Group, self.InList = [], []
+        self.LinkedObject, self.ElementCount, self.PlacementList = \
+            None, 0, []
+
+    def newObject(self, typeId, name) :
+        obj = self.Document.addObject(typeId, name)
+        self.Group.append(obj)
+        obj.InList.append(self)
+        return obj
+
+    def setLink(self, obj) :
+        self.LinkedObject = obj
+        obj.InList.append(self)
+
+def createBox(part, solid, material, px, py, pz, rot, displayMode) :
+    # GDMLBox without its shape
+    box = part.newObject('Part::FeaturePython', \
+                         'GDMLBox:' + solid.get('name'))
+    box.Proxy = types.SimpleNamespace(Type='GDMLBox')
+    lf = GDMLShared.lengthFactor(solid)
+    box.x, box.y, box.z = [types.SimpleNamespace(Value=v) for v in \
+                           GDMLShared.getVals(solid, ['x', 'y', 'z'], lf)]
+    box.material = material
+    return box
+
+@pytest.fixture
+def importDoc(gdml, monkeypatch) :
+    # Imports GDML text into a new document, returns the document
+    monkeypatch.setattr(importGDML, 'createSolid', createBox)
+    def load(text) :
+        gdml(text)
+        monkeypatch.setattr(importGDML, 'volDict', {})
+        monkeypatch.setattr(importGDML, 'volumePlacement', \
+                            FreeCAD.Placement())
+        doc = Document()
+        world = GDMLShared.getRef(importGDML.setup, 'world')
+        importGDML.parseVolume(doc.addObject('App::Part', world), world, \
+                               0, 0, 0, None, 3)
+        return doc
+    return load
+
+def boxes(doc) :
+    # size, position & rotation of each box in the world
+    result = []
+    def walk(objs, placement) :
+        for obj in objs :
+            p = placement.multiply(obj.Placement)
+            if obj.TypeId == 'App::Part' :
+               walk(obj.Group, p)
+            elif obj.TypeId == 'App::Link' :
+               walk(obj.LinkedObject.Group, p)
+            else :
+               result.append((obj.x.Value, [round(v, 6) for v in p.Base], \
+                      [[round(v, 6) for v in row] for row in p.Rotation.m]))
+    walk(doc.RootObjects, FreeCAD.Placement())
+    return sorted(result)
+
+def test_round_trip(importDoc, monkeypatch, tmp_path) :
+    doc = importDoc(nestedFile)
+    links = [obj for obj in doc.Objects if obj.TypeId == 'App::Link']
+    assert len(links) == 1
+    monkeypatch.setattr(FreeCAD, 'ActiveDocument', doc, raising=False)
+    monkeypatch.setattr(FreeCAD, 'BoundBox', object, raising=False)
+    path = tmp_path / 'export.gdml'
+    exportGDML.export([], str(path))
+
+    exported = importDoc(path.read_text())
+    placed = boxes(exported)
+    # the export's own world box and every placement of A and B
+    assert [p[0] for p in placed] == [5., 5., 50., 50., 1000., 1000.]
+    assert [p[1] for p in placed[:4]] == [[-90., 0., 0.], [100., -10., 0.], \
+                                        [-100., 0., 0.], [100., 0., 0.]]
+    rz = [[0., 1., 0.], [-1., 0., 0.], [0., 0., 1.]]
+    assert placed[1][2] == placed[3][2] == rz
+    # the box of the link is the volume of the part it links to
+    assert len(exportGDML.solids.findall('box')) == 4
@@ -0,0 +1,72 @@
+# Expression evaluator : CLHEP style arithmetic, units & the whitelist
+
+import math
+import pytest
+import GDMLShared
+
+def test_arithmetic() :
+    assert GDMLShared.evalExpr('2*3+1') == 7.
+    assert GDMLShared.evalExpr('2^10') == 1024.
+    assert GDMLShared.evalExpr('-(1+2)*4') == -12.
+    assert GDMLShared.evalExpr('7/2') == 3.5
+    assert GDMLShared.evalExpr('sin(pi/2)') == pytest.approx(1.)
+    assert GDMLShared.evalExpr('max(1, atan2(1, 1)*4)') == \
+           pytest.approx(math.pi)
+
+def test_units() :
+    assert GDMLShared.evalExpr('10*cm') == 100.
+    assert GDMLShared.evalExpr('90*deg') == pytest.approx(math.pi / 2)
+    assert GDMLShared.evalExpr('1*m + 1*mm') == 1001.
+
+def test_plain_numbers() :
+    assert GDMLShared.evalExpr('1.5e3') == 1500.
+    assert GDMLShared.evalExpr(' 42 ') == 42.
+    assert GDMLShared.plainNumber('-0.25') == -0.25
+    for text in ('nan', 'inf', '-inf', 'Infinity', '1_000', 'x', None) :
+        assert GDMLShared.plainNumber(text) is None
+
+@pytest.mark.parametrize('expr', [
+    '__import__("os")',
+    'open("file")',
+    '"text"',
+    '().__class__',
+    'sin.__name__',
+    '[1, 2]',
+    '{1 : 2}',
+    'lambda : 1',
+    'sin(x=1)',
+    'pow(2)(3)',
+    '_hidden + 1',
+    '1_000',
+    'a[0]',
+    ])
+def test_whitelist_rejects(expr) :
+    with pytest.raises((ValueError, SyntaxError)) :
+        GDMLShared.compileExpr(expr)
+
+def test_only_namespace_names() :
+    # No python builtins, only math, units and defines
+    with pytest.raises(NameError) :
+        GDMLShared.evalExpr('len(1)')
+    with pytest.raises(NameError) :
+        GDMLShared.evalExpr('undefined * 2')
+
+def test_power_bounded() :
+    # Integer constants are doubles, a tower of powers overflows
+    # rather than building a huge integer
+    with pytest.raises(OverflowError) :
+        GDMLShared.evalExpr('9^9^9')
+
+def test_compiled_once() :
+    assert GDMLShared.cachedExpr('a_cached*2') is \
+           GDMLShared.cachedExpr('a_cached*2')
+
+def test_loop_bindings() :
+    import numpy
+    values = numpy.arange(3.)
+    assert GDMLShared.evalWith('i*2', {'i' : 4.}) == 8.
+    assert list(GDMLShared.evalRange('i*10+1', {}, 'i', values)) == \
+           [1., 11., 21.]
+    # math functions take scalars, evaluated value by value
+    assert list(GDMLShared.evalRange('sqrt(i)', {}, 'i', values)) == \
+           pytest.approx([0., 1., math.sqrt(2.)])
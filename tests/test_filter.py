@@ -0,0 +1,85 @@
+# ImportFilter : roots, depth, include & exclude patterns, regions
+
+import importGDML
+from importGDML import ImportFilter, BoxRegion, CylinderRegion
+
+filterFile = '''<?xml version="1.0"?>
+<gdml>
+ <define/>
+ <materials/>
+ <solids>
+  <box name="WorldBox" x="1000" y="1000" z="1000"/>
+  <box name="Box" x="10" y="20" z="30"/>
+  <tube name="Tube" rmax="5" z="10"/>
+ </solids>
+ <structure>
+  <volume name="Sensor_1">
+   <materialref ref="G4_Si"/>
+   <solidref ref="Box"/>
+  </volume>
+  <volume name="Pipe">
+   <materialref ref="G4_Fe"/>
+   <solidref ref="Tube"/>
+  </volume>
+  <volume name="World">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="WorldBox"/>
+  </volume>
+ </structure>
+ <setup name="Default" version="1.0">
+  <world ref="World"/>
+ </setup>
+</gdml>
+'''
+
+def test_matches_name_or_material() :
+    f = ImportFilter()
+    assert f.matches(['Sensor_*'], 'Sensor_1', 'G4_Si')
+    assert f.matches(['G4_Fe'], 'Pipe', 'G4_Fe')
+    assert not f.matches(['sensor_*'], 'Sensor_1', None)
+    assert not f.matches([], 'Pipe', 'G4_Fe')
+
+def test_roots() :
+    assert ImportFilter('Pipe').roots == ['Pipe']
+    assert ImportFilter(['A', 'B']).roots == ['A', 'B']
+    assert ImportFilter().roots == []
+
+def test_depth() :
+    f = ImportFilter(maxDepth=2)
+    assert not f.skip('Pipe', 2)
+    assert f.skip('Pipe', 3)
+    assert f.truncated(3)
+    assert not ImportFilter().truncated(100)
+
+def test_exclude(gdml) :
+    gdml(filterFile)
+    f = ImportFilter(exclude=['G4_Fe'])
+    assert f.skip('Pipe', 1)
+    assert not f.skip('Sensor_1', 1)
+    assert ImportFilter(exclude=['Sensor_?']).skip('Sensor_1', 1)
+    assert not f.truncated(1)
+
+def test_include(gdml) :
+    gdml(filterFile)
+    f = ImportFilter(include=['Sensor_*'])
+    # include only decides what gets a solid, nothing is skipped
+    assert not f.skip('Pipe', 1)
+    assert f.buildSolid('Sensor_1', 'G4_Si')
+    assert not f.buildSolid('Pipe', 'G4_Fe')
+    assert ImportFilter().buildSolid('Pipe', 'G4_Fe')
+
+def test_regions(gdml) :
+    gdml(filterFile)
+    box = BoxRegion(-10, -10, -10, 10, 10, 10)
+    assert box.intersects([5, 5, 5, 20, 20, 20])
+    assert not box.intersects([11, -1, -1, 20, 1, 1])
+    cylinder = CylinderRegion(10, -5, 5)
+    assert cylinder.intersects([-1, -1, -1, 1, 1, 1])
+    assert not cylinder.intersects([8, 8, 0, 9, 9, 1])
+    assert not cylinder.intersects([-1, -1, 6, 1, 1, 7])
+    # Box is 10 x 20 x 30 so half widths 5, 10, 15
+    assert importGDML.volumeBounds('Sensor_1') == [-5, -10, -15, 5, 10, 15]
+    importGDML.importFilter = ImportFilter(region=box)
+    P, V = importGDML.FreeCAD.Placement, importGDML.FreeCAD.Vector
+    assert not importGDML.outsideRegion('Sensor_1', P(V(12, 0, 0)))
+    assert importGDML.outsideRegion('Sensor_1', P(V(16, 0, 0)))
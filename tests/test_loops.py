@@ -0,0 +1,90 @@
+# Loop expansion and name[i] naming
+
+import pytest
+import importGDML
+
+loopFile = '''<?xml version="1.0"?>
+<gdml>
+ <define>
+  <constant name="N" value="3"/>
+  <variable name="i" value="0"/>
+  <variable name="j" value="0"/>
+ </define>
+ <materials/>
+ <solids>
+  <box name="World" x="1000" y="1000" z="1000"/>
+  <loop for="i" from="1" to="N" step="1">
+   <box name="b[i]" x="i*10" y="2" z="N"/>
+  </loop>
+  <loop for="i" from="1" to="2" step="1">
+   <loop for="j" from="1" to="3" step="1">
+    <tube name="t[i,j]" rmax="i*100+j" z="1"/>
+   </loop>
+  </loop>
+ </solids>
+ <structure>
+  <volume name="V">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="b[1]"/>
+  </volume>
+  <volume name="World">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="World"/>
+   <loop for="i" from="0" to="20" step="10">
+    <physvol name="pv[i/10+1]">
+     <volumeref ref="V"/>
+     <position name="p[i/10+1]" x="i" y="0" z="0"/>
+    </physvol>
+   </loop>
+  </volume>
+ </structure>
+ <setup name="Default" version="1.0">
+  <world ref="World"/>
+ </setup>
+</gdml>
+'''
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_names_and_values(gdml, stream) :
+    gdml(loopFile, stream)
+    boxes = [importGDML.getSolid('b_%d' % n) for n in range(3)]
+    assert [b.get('x') for b in boxes] == [10., 20., 30.]
+    # Values not using the loop variable are kept as text
+    assert [b.get('z') for b in boxes] == ['N'] * 3
+    assert importGDML.getSolid('b_3') is None
+    # solidref b[1] is the first copy
+    vol = importGDML.getStructure('volume', 'V')
+    assert importGDML.GDMLShared.getRef(vol, 'solidref') == 'b[1]'
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_nested(gdml, stream) :
+    gdml(loopFile, stream)
+    for i in range(2) :
+        for j in range(3) :
+            tube = importGDML.getSolid('t_%d_%d' % (i, j))
+            assert tube.get('rmax') == (i + 1) * 100 + j + 1
+
+def test_daughters(gdml) :
+    gdml(loopFile)
+    world = importGDML.getStructure('volume', 'World')
+    daughters = importGDML.volumeDaughters(world)
+    pvs = [d for d in daughters if d.tag == 'physvol']
+    assert [pv.get('name') for pv in pvs] == ['pv_0', 'pv_1', 'pv_2']
+    assert [pv.find('position').get('x') for pv in pvs] == [0., 10., 20.]
+    assert [pv.find('volumeref').get('ref') for pv in pvs] == ['V'] * 3
+
+def loop(attrib, *children) :
+    return importGDML.GDMLRecord('loop', attrib, None, list(children))
+
+def test_empty_and_step() :
+    box = importGDML.GDMLRecord('box', {'name' : 'b[i]', 'x' : 'i'}, \
+                                None, [])
+    assert importGDML.expandLoop(loop({'for' : 'i', 'from' : '3', \
+                                 'to' : '1', 'step' : '1'}, box)) == []
+    down = importGDML.expandLoop(loop({'for' : 'i', 'from' : '3', \
+                                 'to' : '1', 'step' : '-1'}, box))
+    assert [b.get('x') for b in down] == [3., 2., 1.]
+    assert [b.get('name') for b in down] == ['b_2', 'b_1', 'b_0']
+    with pytest.raises(ValueError) :
+        importGDML.expandLoop(loop({'for' : 'i', 'from' : '1', \
+                                    'to' : '3', 'step' : '0'}, box))
@@ -0,0 +1,63 @@
+# Consistency of Resources/G4NistMaterials.json
+
+import pytest
+import GDMLNist
+
+states = ('solid', 'liquid', 'gas')
+
+@pytest.fixture(scope='module')
+def db() :
+    return GDMLNist.load()
+
+def test_elements(db) :
+    Z = [z for z, A in db['elements'].values()]
+    assert sorted(Z) == list(range(1, len(Z) + 1))
+    for symbol, (z, A) in db['elements'].items() :
+        assert isinstance(z, int)
+        assert A > 0
+        # heavier elements have more mass per proton than hydrogen
+        assert A >= z
+
+def test_materials(db) :
+    for name, (D, I, state, kind, components) in db['materials'].items() :
+        assert GDMLNist.isNist(name), name
+        assert D > 0, name
+        assert I >= 0, name
+        assert state in states, name
+        assert kind in ('fraction', 'composite'), name
+        assert len(components) > 0, name
+        for element, n in components :
+            assert element in db['elements'], (name, element)
+            assert n > 0, (name, element)
+        if kind == 'fraction' :
+           assert sum(n for e, n in components) == \
+                  pytest.approx(1., abs=1e-3), name
+        else :
+           assert all(isinstance(n, int) for e, n in components), name
+
+def test_entries() :
+    entries = GDMLNist.entries(['G4_WATER', 'G4_AIR', 'G4_WATER', 'Mine'])
+    kinds = [kind for kind, name, entry in entries]
+    names = [name for kind, name, entry in entries]
+    # elements first, each entry once, unknown names left out
+    assert kinds == sorted(kinds, key=lambda k : k != 'element')
+    assert len(names) == len(set(names))
+    assert [n for k, n in zip(kinds, names) if k == 'material'] == \
+           ['G4_WATER', 'G4_AIR']
+    assert set(['H', 'O', 'N']) <= set(names)
+    assert 'Mine' not in names
+
+def test_entries_skip_defined() :
+    names = [name for kind, name, entry in \
+             GDMLNist.entries(['G4_WATER'], defined=['H', 'G4_AIR'])]
+    assert names == ['O', 'G4_WATER']
+
+def test_entry_form() :
+    attrib, children = GDMLNist.materialEntry('G4_WATER')
+    assert attrib == {'name' : 'G4_WATER', 'state' : 'liquid'}
+    tags = [tag for tag, a in children]
+    assert tags[:2] == ['MEE', 'D']
+    assert set(a['ref'] for tag, a in children[2:]) == set(['H', 'O'])
+    attrib, children = GDMLNist.elementEntry('O')
+    assert attrib['Z'] == '8'
+    assert children[0][0] == 'atom'
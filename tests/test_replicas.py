@@ -0,0 +1,160 @@
+# Placement arrays of replicavol, divisionvol & paramvol
+
+import math
+import pytest
+import importGDML, GDMLShared
+
+replicaFile = '''<?xml version="1.0"?>
+<gdml>
+ <define>
+  <constant name="N" value="4"/>
+ </define>
+ <materials/>
+ <solids>
+  <box name="Slab" x="40" y="10" z="10" lunit="mm"/>
+  <box name="Cell" x="1" y="1" z="1"/>
+  <tube name="Ring" rmin="10" rmax="50" z="20" startphi="30"
+        deltaphi="90" aunit="deg"/>
+  <cone name="Cone" rmax1="5" rmax2="5" z="10"/>
+ </solids>
+ <structure>
+  <volume name="CellV">
+   <materialref ref="G4_Si"/>
+   <solidref ref="Cell"/>
+  </volume>
+  <volume name="SlabV">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="Slab"/>
+  </volume>
+  <volume name="RingV">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="Ring"/>
+  </volume>
+  <volume name="ConeV">
+   <materialref ref="G4_AIR"/>
+   <solidref ref="Cone"/>
+  </volume>
+ </structure>
+ <setup name="Default" version="1.0">
+  <world ref="SlabV"/>
+ </setup>
+</gdml>
+'''
+
+R = importGDML.GDMLRecord
+
+def replica(axis, number, width, offset='0', unit='mm') :
+    along = R('replicate_along_axis', {}, None, [ \
+              R('direction', {axis : '1'}, None, []), \
+              R('width', {'value' : width, 'unit' : unit}, None, []), \
+              R('offset', {'value' : offset, 'unit' : unit}, None, [])])
+    return R('replicavol', {'number' : number}, None, [along])
+
+def division(axis, **attrib) :
+    attrib['axis'] = axis
+    return R('divisionvol', attrib, None, [])
+
+def mother(name) :
+    return importGDML.getStructure('volume', name)
+
+def bases(placements) :
+    return [p.Base.x for p in placements], [p.Base.y for p in placements], \
+           [p.Base.z for p in placements]
+
+def angles(placements) :
+    return [math.degrees(p.Rotation.Angle) for p in placements]
+
+def test_replica_along_axis(gdml) :
+    gdml(replicaFile)
+    x, y, z = bases(importGDML.replicaPlacements(replica('x', 'N', '10')))
+    # centred on the mother
+    assert x == pytest.approx([-15., -5., 5., 15.])
+    assert y == z == [0.] * 4
+    # the offset only applies to phi, Geant4 ignores it along x, y, z
+    y = bases(importGDML.replicaPlacements( \
+              replica('y', '3', '1', '2', 'cm')))[1]
+    assert y == pytest.approx([-10., 0., 10.])
+    assert GDMLShared.logCounts[GDMLShared.WARNING] == 1
+
+def test_replica_phi(gdml) :
+    gdml(replicaFile)
+    placements = importGDML.replicaPlacements( \
+                    replica('phi', '3', '30', '10', 'deg'))
+    assert angles(placements) == pytest.approx([25., 55., 85.])
+
+def test_replica_unsupported(gdml) :
+    gdml(replicaFile)
+    assert importGDML.replicaPlacements(replica('rho', '3', '1')) == []
+    # no axis given is reported not raised
+    assert importGDML.replicaPlacements(R('replicavol', {'number' : '2'}, \
+                                          None, [])) == []
+    along = R('replicate_along_axis', {}, None, [])
+    assert importGDML.replicaPlacements(R('replicavol', {'number' : '2'}, \
+                                          None, [along])) == []
+    assert GDMLShared.logCounts[GDMLShared.WARNING] == 3
+
+def test_division_box(gdml) :
+    gdml(replicaFile)
+    groups = importGDML.divisionGroups(division('kXAxis', number='4'), \
+                                       mother('SlabV'))
+    assert len(groups) == 1
+    cell, placements = groups[0]
+    assert cell.tag == 'box'
+    assert [float(cell.get(a)) for a in 'xyz'] == [10., 10., 10.]
+    assert bases(placements)[0] == pytest.approx([-15., -5., 5., 15.])
+    # by width, the number is what fits after the offset
+    cell, placements = importGDML.divisionGroups(division('kXAxis', \
+                  width='1.5', offset='0.5', unit='cm'), mother('SlabV'))[0]
+    assert float(cell.get('x')) == 15.
+    assert bases(placements)[0] == pytest.approx([-7.5, 7.5])
+
+def test_division_tube_phi(gdml) :
+    gdml(replicaFile)
+    cell, placements = importGDML.divisionGroups(division('kPhi', \
+                       number='3', offset='0'), mother('RingV'))[0]
+    # cells start at the mother's startphi
+    assert float(cell.get('startphi')) == pytest.approx(math.radians(30))
+    assert float(cell.get('deltaphi')) == pytest.approx(math.radians(30))
+    assert cell.get('aunit') == 'rad'
+    assert float(cell.get('rmax')) == 50.
+    assert angles(placements) == pytest.approx([0., 30., 60.])
+
+def test_division_tube_rho(gdml) :
+    gdml(replicaFile)
+    groups = importGDML.divisionGroups(division('kRho', width='10', \
+                        offset='5', unit='mm'), mother('RingV'))
+    rings = [(float(c.get('rmin')), float(c.get('rmax'))) for c, p in groups]
+    assert rings == [(15., 25.), (25., 35.), (35., 45.)]
+    assert all(len(p) == 1 for c, p in groups)
+
+def test_division_tube_z(gdml) :
+    gdml(replicaFile)
+    cell, placements = importGDML.divisionGroups(division('kZAxis', \
+                       number='2'), mother('RingV'))[0]
+    assert float(cell.get('z')) == 10.
+    assert bases(placements)[2] == pytest.approx([-5., 5.])
+
+def test_division_unsupported(gdml) :
+    gdml(replicaFile)
+    assert importGDML.divisionGroups(division('kXAxis', number='2'), \
+                                     mother('RingV')) == []
+    assert importGDML.divisionGroups(division('kZAxis', number='2'), \
+                                     mother('ConeV')) == []
+    assert importGDML.divisionGroups(division('kZAxis'), \
+                                     mother('SlabV')) == []
+    assert GDMLShared.logCounts[GDMLShared.WARNING] == 3
+
+def test_paramvol_groups(gdml) :
+    gdml(replicaFile)
+    dims = lambda x : R('box_dimensions', {'x' : x, 'y' : '1', 'z' : '1'}, \
+                        None, [])
+    params = [R('parameters', {'number' : str(n)}, None, \
+                [R('position', {'x' : str(n)}, None, []), dims(x)]) \
+              for n, x in enumerate(['2', '3', '2'])]
+    param = R('paramvol', {'ncopies' : '3'}, None, \
+              [R('volumeref', {'ref' : 'CellV'}, None, []), \
+               R('parameterised_position_size', {}, None, params)])
+    groups = importGDML.paramGroups(param, 'CellV')
+    # copies with the same dimensions share one solid
+    assert sorted((g[0].get('x'), len(g[1])) for g in groups) == \
+           [('2', 2), ('3', 1)]
@@ -0,0 +1,79 @@
+# Streaming import : sections scanned for byte ranges, solids and
+# structure entries parsed when looked up
+
+import importGDML
+
+streamFile = '''<?xml version="1.0"?>
+<!-- <solids> in a comment is not a section -->
+<gdml xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+ <define>
+  <constant name="a" value="2"/>
+ </define>
+ <materials/>
+ <solids>
+  <box name='b1' x="a" y="2" z="3"/>
+  <!-- <box name="hidden" x="1" y="1" z="1"/> -->
+  <tube name="it&apos;s" rmax="5" z="1"><![CDATA[ <box/> ]]></tube>
+  <loop for="i" from="1" to="2" step="1">
+   <box name="lb[i]" x="i" y="1" z="1"/>
+  </loop>
+ </solids>
+ <structure>
+  <volume name="V">
+   <materialref ref="G4_Si"/>
+   <solidref ref="b1"/>
+   <auxiliary auxtype="it's" auxvalue="1"/>
+   <auxiliary auxtype='say "x"' auxvalue="2"/>
+  </volume>
+ </structure>
+ <setup name="Default" version="1.0">
+  <world ref="V"/>
+ </setup>
+</gdml>
+'''
+
+def test_same_as_whole_file(gdml) :
+    whole = {}
+    for stream in (False, True) :
+        gdml(streamFile, stream)
+        whole[stream] = [(key, dict(importGDML.solidsIndex[key].attrib)) \
+                         for key in sorted(importGDML.solidsIndex)]
+    assert whole[True] == whole[False]
+    assert ('tube', "it's") in importGDML.solidsIndex
+    assert ('box', 'hidden') not in importGDML.solidsIndex
+    assert ('box', 'lb_1') in importGDML.solidsIndex
+
+def test_parsed_on_demand(gdml) :
+    sections = gdml(streamFile, True)
+    solids = sections['solids']
+    assert isinstance(solids, importGDML.StreamedSection)
+    assert isinstance(sections['define'], importGDML.GDMLRecord)
+    # only the loop has been read, to expand it
+    assert len(solids.cache) == 1
+    assert importGDML.getSolid('b1').get('x') == 'a'
+    assert len(solids.cache) == 2
+    assert importGDML.getSolid('b1') is importGDML.getSolid('b1')
+
+def test_cache_bounded(gdml, monkeypatch) :
+    monkeypatch.setattr(importGDML, 'streamCacheSize', 1)
+    sections = gdml(streamFile, True)
+    for rec in sections['solids'] :
+        pass
+    assert len(sections['solids'].cache) == 1
+
+def test_attribute_paths(gdml) :
+    gdml(streamFile, True)
+    vol = importGDML.getStructure('volume', 'V')
+    assert vol.find('''auxiliary[@auxtype="it's"]''').get('auxvalue') == '1'
+    assert vol.find("""auxiliary[@auxtype='say "x"']""").get('auxvalue') \
+           == '2'
+    assert vol.find("auxiliary[@auxtype='none']") is None
+
+def test_entities_fall_back(tmp_path) :
+    path = tmp_path / 'entities.gdml'
+    path.write_text('<?xml version="1.0"?>\n' \
+        '<!DOCTYPE gdml [<!ENTITY w "10">]>\n' \
+        '<gdml><solids><box name="b" x="&w;" y="1" z="1"/></solids></gdml>')
+    sections = importGDML.readGDML(str(path), True)
+    assert isinstance(sections['solids'], importGDML.GDMLRecord)
+    assert sections['solids'].find('box').get('x') == '10'
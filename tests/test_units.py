@@ -0,0 +1,55 @@
+# Lengths and angles normalised to mm and rad
+
+import math
+import pytest
+import GDMLShared
+from importGDML import GDMLRecord
+
+def test_unit_factor() :
+    assert GDMLShared.unitFactor('mm') == 1.
+    assert GDMLShared.unitFactor('cm') == 10.
+    assert GDMLShared.unitFactor('m') == 1000.
+    assert GDMLShared.unitFactor('um') == 1.e-3
+    assert GDMLShared.unitFactor('rad') == 1.
+    assert GDMLShared.unitFactor('deg') == pytest.approx(math.pi / 180)
+    assert GDMLShared.unitFactor('mrad') == 1.e-3
+
+def test_default() :
+    assert GDMLShared.unitFactor(None) == 1.
+    assert GDMLShared.unitFactor('') == 1.
+    assert GDMLShared.unitFactor(None, 10.) == 10.
+
+def test_expression() :
+    assert GDMLShared.unitFactor('10*mm') == 10.
+    assert GDMLShared.unitFactor('cm/2') == 5.
+
+def test_unknown_unit() :
+    # reported once as an import error naming the element, the value
+    # is kept in internal units
+    box = GDMLRecord('box', {'name' : 'b', 'x' : '1', 'lunit' : 'inch'}, \
+                     None, [])
+    assert GDMLShared.lengthFactor(box) == 1.
+    assert GDMLShared.logCounts[GDMLShared.ERROR] == 1
+    assert GDMLShared.unitFactor('furlong') == 1.
+    assert GDMLShared.logCounts[GDMLShared.ERROR] == 2
+
+def test_solid_factors() :
+    box = GDMLRecord('box', {'x' : '2', 'lunit' : 'cm'}, None, [])
+    assert GDMLShared.lengthFactor(box) == 10.
+    assert GDMLShared.angleFactor(box) == 1.
+    assert GDMLShared.getVals(box, ['x'], GDMLShared.lengthFactor(box)) == \
+           [20.]
+
+def test_position() :
+    pos = GDMLRecord('position', {'x' : '1', 'y' : '2', 'z' : '-3', \
+                                  'unit' : 'm'}, None, [])
+    v = GDMLShared.getPosition(pos)
+    assert (v.x, v.y, v.z) == (1000., 2000., -3000.)
+
+def test_rotation_order() :
+    # Placed with Rx(-x) Ry(-y) Rz(-z), the export writes the same
+    # angles back
+    rot = GDMLRecord('rotation', {'x' : '30', 'y' : '-20', 'z' : '45', \
+                                  'unit' : 'deg'}, None, [])
+    angles = GDMLShared.rotationAngles(GDMLShared.getRotation(rot))
+    assert angles == pytest.approx((30., -20., 45.))